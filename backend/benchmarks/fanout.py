@@ -0,0 +1,89 @@
+"""Broadcast one chat event per session (the old path) versus one room emit.
+
+Sessions are registered with an in-memory Socket.IO server whose transport
+is replaced by a coroutine that only yields to the loop (plus an optional
+delay), so the numbers measure the fan-out itself.
+
+Run from the backend directory:
+
+    python -m benchmarks.fanout --members 2 50 500 --devices 2
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from socketio import AsyncServer
+
+from websocket.events import SocketEvents
+from websocket.handlers.chat_handler import ChatHandler, conversation_room
+from websocket.services import ConnectionService
+
+CONVERSATION_ID = 1
+
+
+async def _server(members: int, devices: int, send_delay: float) -> tuple[AsyncServer, ChatHandler, str]:
+    sio = AsyncServer(async_mode="asgi")
+
+    async def send(eio_sid, pkt):
+        await asyncio.sleep(send_delay)
+
+    sio._send_eio_packet = send
+    connections = ConnectionService()
+    handler = ChatHandler(sio, connections)
+    sender_sid = None
+    for user_id in range(1, members + 1):
+        for device in range(devices):
+            sid = await sio.manager.connect(f"{user_id}-{device}", "/")
+            await connections.connect(user_id, sid)
+            await sio.enter_room(sid, conversation_room(CONVERSATION_ID))
+            sender_sid = sender_sid or sid
+    return sio, handler, sender_sid
+
+
+async def _per_session(sio: AsyncServer, handler: ChatHandler, payload: dict, exclude_sid: str, members: int):
+    """The original shape: one awaited emit per participant session"""
+    for participant_id in range(1, members + 1):
+        for session_id in handler.connection_service.get_user_sessions(participant_id):
+            if session_id != exclude_sid:
+                await sio.emit(SocketEvents.CHAT_MESSAGE, payload, to=session_id)
+
+
+async def _room(sio: AsyncServer, handler: ChatHandler, payload: dict, exclude_sid: str, members: int):
+    await handler.emit_message_to_conversation(CONVERSATION_ID, payload, exclude_sid=exclude_sid)
+
+
+async def _measure(label: str, broadcast, members: int, devices: int, repeats: int, send_delay: float):
+    sio, handler, sender_sid = await _server(members, devices, send_delay)
+    payload = {"id": 1, "conversation_id": CONVERSATION_ID, "content": "x" * 80, "read_by": []}
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await broadcast(sio, handler, payload, sender_sid, members)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{label:>11} {members:4d} members x {devices} devices: "
+          f"median {timings[len(timings) // 2] * 1000:8.2f} ms")
+
+
+async def _main(args):
+    # The app's server enables socketio's logger, which would log every emit
+    logging.getLogger("socketio.server").setLevel(logging.WARNING)
+    for members in args.members:
+        await _measure("per-session", _per_session, members, args.devices, args.repeats, args.send_delay_ms / 1000)
+        await _measure("room", _room, members, args.devices, args.repeats, args.send_delay_ms / 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--members", type=int, nargs="+", default=[2, 50, 500])
+    parser.add_argument("--devices", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--send-delay-ms", type=float, default=0.0,
+                        help="simulated time each transport send takes")
+    args = parser.parse_args()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Render the conversation inbox per conversation (the old path) versus set-based.
+
+The set-based path reads the latest message from the denormalized
+Conversation.last_message_* columns.
+
+Run from the backend directory:
+
+    python -m benchmarks.inbox --conversations 300 --messages 200
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+# Point the app at a throwaway database before anything imports the engine
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'bench.db')}"
+
+from sqlalchemy import func, insert, select, update  # noqa: E402
+from database.session import Base, engine, unit_of_work  # noqa: E402
+from database.instrumentation import track_queries  # noqa: E402
+from database.backfill import backfill_last_messages  # noqa: E402
+from database.models import User, Conversation, Message  # noqa: E402
+from database.models.conversation import conversation_participants  # noqa: E402
+from websocket.services import ChatService  # noqa: E402
+from routes.chat import format_conversations  # noqa: E402
+
+
+def _seed(conversations: int, messages: int) -> int:
+    Base.metadata.create_all(bind=engine)
+    with unit_of_work() as db:
+        users = [
+            User(email=f"u{i}@example.com", username=f"u{i}", first_name="User", last_name=str(i), hashed_password="x")
+            for i in range(20)
+        ]
+        db.add_all(users)
+        db.flush()
+        me = users[0]
+        rows = []
+        for c in range(conversations):
+            conversation = Conversation(created_by_id=me.id, name=f"c{c}")
+            conversation.participants = [me, users[1 + c % 19]]
+            db.add(conversation)
+            db.flush()
+            for m in range(messages):
+                rows.append({
+                    "conversation_id": conversation.id,
+                    "sender_id": random.choice((me.id, users[1 + c % 19].id)),
+                    "content": f"message {m}",
+                    "content_type": "text",
+                    "is_deleted": False,
+                })
+        db.execute(insert(Message), rows)
+        # The user has read the older half of every conversation
+        first_id = select(func.min(Message.id)).where(
+            Message.conversation_id == conversation_participants.c.conversation_id
+        ).scalar_subquery()
+        db.execute(
+            update(conversation_participants).where(
+                conversation_participants.c.user_id == me.id
+            ).values(last_read_message_id=first_id + messages // 2)
+        )
+        backfill_last_messages(db.connection())
+        return me.id
+
+
+def _per_conversation(conversations, user_id, db):
+    """The original shape: several queries per conversation"""
+    result = []
+    for conv in conversations:
+        unread = ChatService.get_unread_count(conv.id, user_id, db=db)
+        latest = conv.messages[-1] if conv.messages else None
+        if latest is not None:
+            ChatService.get_read_by([latest.id], db=db)
+            latest.sender.username
+        [p.id for p in conv.participants]
+        result.append(unread)
+    return result
+
+
+def _measure(label: str, render, user_id: int, conversations: int, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        with unit_of_work() as db, track_queries() as stats:
+            started = time.perf_counter()
+            convs = ChatService.get_user_conversations(user_id, limit=conversations, db=db)
+            render(convs, user_id, db)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{label:>16}: median {timings[len(timings) // 2] * 1000:8.1f} ms, "
+          f"{stats.count:5d} queries for {len(convs)} conversations")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    user_id = _seed(args.conversations, args.messages)
+    print(f"seeded {args.conversations} conversations x {args.messages} messages "
+          f"in {time.perf_counter() - started:.1f} s")
+
+    _measure("per-conversation", _per_conversation, user_id, args.conversations, args.repeats)
+    _measure("set-based", format_conversations, user_id, args.conversations, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Socket message throughput: one transaction per message versus group commit.
+
+Each sender is a member of a group conversation and sends messages one after
+another, waiting for the ack (the committed message) before the next, like
+a client would. Runs against a SQLite file with the app's production
+pragmas.
+
+Run from the backend directory:
+
+    python -m benchmarks.ingest --senders 1 10 100 500
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# Point the app at a throwaway database before anything imports the engine
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'bench.db')}"
+
+from database.session import Base, engine, log_sqlite_profile, unit_of_work  # noqa: E402
+from database.models import User, Conversation  # noqa: E402
+from websocket.handlers.chat_handler import ChatHandler, user_card  # noqa: E402
+from websocket.services import ConnectionService, MessagePipeline  # noqa: E402
+
+
+def _seed(senders: int, group_size: int) -> tuple[list[dict], list[int]]:
+    """senders users spread over groups of group_size; returns cards and each sender's conversation"""
+    Base.metadata.create_all(bind=engine)
+    with unit_of_work() as db:
+        users = [
+            User(email=f"u{i}@example.com", username=f"u{i}", first_name="User", last_name=str(i), hashed_password="x")
+            for i in range(senders)
+        ]
+        db.add_all(users)
+        db.flush()
+        conversation_of = []
+        for start in range(0, senders, group_size):
+            members = users[start:start + group_size]
+            conversation = Conversation(created_by_id=members[0].id, name="group", is_group=True)
+            conversation.participants = members
+            db.add(conversation)
+            db.flush()
+            conversation_of += [conversation.id] * len(members)
+        return [user_card(user) for user in users], conversation_of
+
+
+async def _sender(handler: ChatHandler, card: dict, conversation_id: int, count: int, latencies: list):
+    for n in range(count):
+        started = time.perf_counter()
+        payload = await handler.handle_send_message(card, conversation_id, f"message {n} from {card['id']}")
+        assert payload and payload["id"]
+        latencies.append(time.perf_counter() - started)
+
+
+async def _measure(label: str, pipeline: MessagePipeline, cards, conversations, senders: int, per_sender: int):
+    handler = ChatHandler(None, ConnectionService())
+    handler.message_pipeline = pipeline
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _sender(handler, cards[i], conversations[i], per_sender, latencies) for i in range(senders)
+    ))
+    elapsed = time.perf_counter() - started
+    await pipeline.stop()
+    latencies.sort()
+    total = senders * per_sender
+    extra = f", avg batch {pipeline.stats()['avg_batch']:6.1f}" if pipeline.enabled else ""
+    print(f"{label:>11} {senders:4d} senders: {total / elapsed:8.0f} msg/s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.1f} ms{extra}")
+
+
+async def _main(args):
+    log_sqlite_profile(engine)
+    cards, conversations = _seed(max(args.senders), args.group_size)
+    for senders in args.senders:
+        per_sender = max(1, args.messages // senders)
+        await _measure("per-message", MessagePipeline(enabled=False), cards, conversations, senders, per_sender)
+        await _measure("pipeline", MessagePipeline(max_batch=args.max_batch, max_delay=args.max_delay_ms / 1000),
+                       cards, conversations, senders, per_sender)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--senders", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--messages", type=int, default=2000, help="total messages per run")
+    parser.add_argument("--group-size", type=int, default=50)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-delay-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Event-loop lag while chat queries run inline versus on the DB executor.
+
+Run from the backend directory:
+
+    python -m benchmarks.loop_lag --calls 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# Point the app at a throwaway database before anything imports the engine
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'bench.db')}"
+
+from core.loop_monitor import LoopLagMonitor  # noqa: E402
+from database.session import Base, engine, SessionLocal  # noqa: E402
+from database.models import User, Conversation, Message  # noqa: E402
+from websocket.services import ChatService, AsyncChatService  # noqa: E402
+
+
+def _seed(messages: int) -> tuple[int, int]:
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        user = User(email="bench@example.com", username="bench", first_name="Bench", last_name="User", hashed_password="x")
+        db.add(user)
+        db.flush()
+        conversation = Conversation(created_by_id=user.id)
+        conversation.participants = [user]
+        db.add(conversation)
+        db.flush()
+        db.add_all(Message(conversation_id=conversation.id, sender_id=user.id, content=f"m{i}") for i in range(messages))
+        db.commit()
+        return user.id, conversation.id
+
+
+async def _measure(label: str, call, calls: int, concurrency: int):
+    monitor = LoopLagMonitor(interval=0.005, warn_threshold=float("inf"))
+    monitor.start()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await call()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    elapsed = time.perf_counter() - started
+    # Give the monitor one wake-up so a fully blocked run is still recorded
+    await asyncio.sleep(monitor.interval * 2)
+    monitor.stop()
+    stats = monitor.stats()
+    print(f"{label:>9}: {calls / elapsed:8.1f} calls/s  loop lag avg {stats['avg_lag_ms']} ms, "
+          f"max {stats['max_lag_ms']} ms over {stats['samples']} samples")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    user_id, conversation_id = _seed(args.messages)
+    offloaded = AsyncChatService()
+
+    async def inline():
+        ChatService.get_messages(conversation_id, 50, 0)
+        ChatService.get_unread_count(conversation_id, user_id)
+
+    async def executor():
+        await offloaded.get_messages(conversation_id, 50, 0)
+        await offloaded.get_unread_count(conversation_id, user_id)
+
+    await _measure("inline", inline, args.calls, args.concurrency)
+    await _measure("executor", executor, args.calls, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
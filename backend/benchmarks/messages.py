@@ -0,0 +1,101 @@
+"""Serialize a page of messages row by row (the old path) versus page-at-once.
+
+The old path loaded read receipts and the sender lazily for each message;
+format_messages loads both for the whole page in one query each.
+
+Run from the backend directory:
+
+    python -m benchmarks.messages --pages 50 500
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+# Point the app at a throwaway database before anything imports the engine
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'bench.db')}"
+
+from sqlalchemy import func, insert, select, update  # noqa: E402
+from database.session import Base, engine, unit_of_work  # noqa: E402
+from database.instrumentation import track_queries  # noqa: E402
+from database.models import User, Conversation, Message  # noqa: E402
+from database.models.conversation import conversation_participants  # noqa: E402
+from websocket.services import ChatService  # noqa: E402
+from routes.chat import format_messages  # noqa: E402
+
+
+def _seed(members: int, messages: int) -> int:
+    Base.metadata.create_all(bind=engine)
+    with unit_of_work() as db:
+        users = [
+            User(email=f"u{i}@example.com", username=f"u{i}", first_name="User", last_name=str(i), hashed_password="x")
+            for i in range(members)
+        ]
+        db.add_all(users)
+        db.flush()
+        conversation = Conversation(created_by_id=users[0].id, name="group", is_group=True)
+        conversation.participants = users
+        db.add(conversation)
+        db.flush()
+        db.execute(insert(Message), [
+            {
+                "conversation_id": conversation.id,
+                "sender_id": random.choice(users).id,
+                "content": f"message {m}",
+                "content_type": "text",
+                "is_deleted": False,
+            }
+            for m in range(messages)
+        ])
+        # Members have read up to a random point of the conversation
+        db.execute(
+            update(conversation_participants).values(
+                last_read_message_id=select(func.max(Message.id)).scalar_subquery() - func.abs(func.random() % messages)
+            )
+        )
+        return conversation.id
+
+
+def _per_message(messages, db):
+    """The original shape: read receipts and sender looked up per message"""
+    result = []
+    for msg in messages:
+        read_by_ids = ChatService.get_read_by([msg.id], db=db)[msg.id]
+        result.append((msg.id, read_by_ids, msg.sender.username))
+    return result
+
+
+def _measure(label: str, render, conversation_id: int, page: int, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        # A fresh session each time, so senders are not already in the identity map
+        with unit_of_work() as db, track_queries() as stats:
+            started = time.perf_counter()
+            messages = ChatService.get_messages(conversation_id, limit=page, db=db)
+            render(messages, db)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{label:>12} page {page:4d}: median {timings[len(timings) // 2] * 1000:8.1f} ms, "
+          f"{stats.count:5d} queries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--members", type=int, default=30)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    conversation_id = _seed(args.members, args.messages)
+    print(f"seeded {args.messages} messages from {args.members} members")
+
+    for page in args.pages:
+        _measure("per-message", _per_message, conversation_id, page, args.repeats)
+        _measure("per-page", format_messages, conversation_id, page, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Read receipts per message (the old path) versus coalesced "read up to".
+
+A member opens a conversation and reports each message that scrolls into
+view. The old path wrote the read cursor, reloaded read_by and broadcast
+once per report; the coalesced path records the reports and flushes one
+cursor write and one broadcast for the highest message.
+
+Run from the backend directory:
+
+    python -m benchmarks.receipts --bursts 10 50 200
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# Point the app at a throwaway database before anything imports the engine
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'bench.db')}"
+
+from sqlalchemy import insert, update  # noqa: E402
+from database.session import Base, engine, unit_of_work  # noqa: E402
+from database.instrumentation import track_queries  # noqa: E402
+from database.models import User, Conversation, Message  # noqa: E402
+from database.models.conversation import conversation_participants  # noqa: E402
+from websocket.handlers.chat_handler import ChatHandler  # noqa: E402
+from websocket.services import ChatService, ConnectionService  # noqa: E402
+
+
+class _CountingServer:
+    """Stands in for the Socket.IO server and counts emits"""
+
+    def __init__(self):
+        self.emits = 0
+
+    async def emit(self, *args, **kwargs):
+        self.emits += 1
+
+
+def _seed(members: int, messages: int) -> tuple[int, list[int]]:
+    Base.metadata.create_all(bind=engine)
+    with unit_of_work() as db:
+        users = [
+            User(email=f"u{i}@example.com", username=f"u{i}", first_name="User", last_name=str(i), hashed_password="x")
+            for i in range(members)
+        ]
+        db.add_all(users)
+        db.flush()
+        conversation = Conversation(created_by_id=users[0].id, name="group", is_group=True)
+        conversation.participants = users
+        db.add(conversation)
+        db.flush()
+        db.execute(insert(Message), [
+            {
+                "conversation_id": conversation.id,
+                "sender_id": users[m % members].id,
+                "content": f"message {m}",
+                "content_type": "text",
+                "is_deleted": False,
+            }
+            for m in range(messages)
+        ])
+        message_ids = [m.id for m in db.query(Message.id).order_by(Message.id)]
+        return conversation.id, message_ids
+
+
+def _reset_cursor(conversation_id: int):
+    with unit_of_work() as db:
+        db.execute(update(conversation_participants).where(
+            conversation_participants.c.conversation_id == conversation_id
+        ).values(last_read_message_id=None))
+
+
+async def _per_message(handler: ChatHandler, conversation_id: int, reader_id: int, message_ids: list[int]):
+    """The original shape: a write, a read_by reload and a broadcast per report"""
+    def _read(db, message_id):
+        message = ChatService.get_message(message_id, db=db)
+        ChatService.mark_message_as_read(message_id, reader_id, db=db)
+        read_by = ChatService.get_read_by([message.id], db=db)[message.id]
+        return {"message_id": message_id, "conversation_id": message.conversation_id, "read_by": read_by}
+
+    for message_id in message_ids:
+        read_data = await handler.chat_service.transaction(_read, message_id)
+        await handler.emit_message_read_to_conversation(conversation_id, read_data)
+
+
+async def _coalesced(handler: ChatHandler, conversation_id: int, reader_id: int, message_ids: list[int]):
+    for message_id in message_ids:
+        await handler.handle_message_read(message_id, reader_id)
+    # Close the window now instead of waiting for it
+    await handler.flush_reads()
+
+
+async def _measure(label: str, read, conversation_id: int, message_ids: list[int], burst: int):
+    _reset_cursor(conversation_id)
+    sio = _CountingServer()
+    handler = ChatHandler(sio, ConnectionService())
+    reader_id = 1
+    ids = message_ids[-burst:]
+    # Warm the membership index and message owner cache, as a live server would have them
+    await handler.get_participant_ids(conversation_id)
+    for message_id in ids:
+        await handler.get_message_owner(message_id)
+    with track_queries() as stats:
+        started = time.perf_counter()
+        await read(handler, conversation_id, reader_id, ids)
+        elapsed = time.perf_counter() - started
+    print(f"{label:>11} burst {burst:4d}: {elapsed * 1000:8.1f} ms, "
+          f"{stats.count:5d} queries, {sio.emits:4d} broadcasts")
+
+
+async def _main(args):
+    conversation_id, message_ids = _seed(args.members, args.messages)
+    print(f"seeded {args.messages} messages from {args.members} members")
+    for burst in args.bursts:
+        await _measure("per-message", _per_message, conversation_id, message_ids, burst)
+        await _measure("coalesced", _coalesced, conversation_id, message_ids, burst)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bursts", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--members", type=int, default=30)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
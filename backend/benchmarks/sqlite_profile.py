@@ -0,0 +1,99 @@
+"""Compare concurrent chat-write throughput with and without the SQLite profile.
+
+Run from the backend directory:
+
+    python -m benchmarks.sqlite_profile --threads 8 --writes 200
+"""
+import argparse
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from core.config import settings
+from database.session import Base, apply_sqlite_pragmas, sqlite_pragma_report
+from database.models import User, Conversation, Message
+
+
+def _setup(db_path: Path, pragmas: dict):
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    apply_sqlite_pragmas(engine, pragmas)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        user = User(email="bench@example.com", username="bench", first_name="Bench", last_name="User", hashed_password="x")
+        db.add(user)
+        db.flush()
+        conversation = Conversation(created_by_id=user.id)
+        conversation.participants = [user]
+        db.add(conversation)
+        db.commit()
+        return engine, Session, user.id, conversation.id
+
+
+def run(label: str, pragmas: dict, threads: int, writes: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session, user_id, conversation_id = _setup(Path(tmp) / "bench.db", pragmas)
+        errors = 0
+        lock = threading.Lock()
+
+        def writer():
+            nonlocal errors
+            for i in range(writes):
+                db = Session()
+                try:
+                    db.add(Message(conversation_id=conversation_id, sender_id=user_id, content=f"message {i}"))
+                    db.query(Conversation).filter(Conversation.id == conversation_id).update(
+                        {Conversation.updated_at: datetime.utcnow()}
+                    )
+                    db.commit()
+                except OperationalError:
+                    db.rollback()
+                    with lock:
+                        errors += 1
+                finally:
+                    db.close()
+
+        workers = [threading.Thread(target=writer) for _ in range(threads)]
+        started = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        total = threads * writes - errors
+        result = {
+            "profile": label,
+            "pragmas": sqlite_pragma_report(engine),
+            "writes": total,
+            "errors": errors,
+            "seconds": round(elapsed, 3),
+            "writes_per_sec": round(total / elapsed, 1),
+        }
+        engine.dispose()
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+
+    production = dict(settings.SQLITE_PRAGMAS) or {
+        "journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 5000,
+    }
+    for label, pragmas in (("default", {}), ("production", production)):
+        r = run(label, pragmas, args.threads, args.writes)
+        print(f"{r['profile']:>10}: {r['writes_per_sec']:>8} writes/s  "
+              f"({r['writes']} ok, {r['errors']} locked, {r['seconds']}s)  {r['pragmas']}")
+
+
+if __name__ == "__main__":
+    main()
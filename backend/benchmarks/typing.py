@@ -0,0 +1,77 @@
+"""Typing broadcasts per keystroke (the old path) versus the debounced TypingService.
+
+Simulates users typing bursts of keystrokes with pauses in between, on a
+simulated clock, and counts the typing events each approach would
+broadcast. Expiry runs on the same schedule as ChatHandler's timer.
+
+Run from the backend directory:
+
+    python -m benchmarks.typing --users 10 100 --seconds 60
+"""
+import argparse
+import random
+
+from websocket.services import TypingService
+
+CONVERSATION_ID = 1
+
+
+def _keystrokes(users: int, seconds: float, rate: float, seed: int) -> list[tuple[float, int, bool]]:
+    """(time, user_id, typing) events: bursts of keystrokes, each ended by a stop or by going quiet"""
+    rng = random.Random(seed)
+    events = []
+    for user_id in range(1, users + 1):
+        now = rng.uniform(0, 5)
+        while now < seconds:
+            burst_end = now + rng.uniform(2, 15)
+            while now < min(burst_end, seconds):
+                events.append((now, user_id, True))
+                now += rng.expovariate(rate)
+            # Half the bursts end with an explicit stop, the rest just go quiet
+            if rng.random() < 0.5:
+                events.append((now, user_id, False))
+            now += rng.uniform(3, 20)
+    events.sort()
+    return events
+
+
+def _debounced(events, seconds: float, interval: float, ttl: float) -> TypingService:
+    clock = [0.0]
+    service = TypingService(interval=interval, ttl=ttl, clock=lambda: clock[0])
+    next_expiry = ttl / 2
+    for at, user_id, typing in events:
+        while next_expiry <= at:
+            clock[0] = next_expiry
+            service.expire()
+            next_expiry += ttl / 2
+        clock[0] = at
+        if typing:
+            service.start(CONVERSATION_ID, user_id, f"user {user_id}", f"sid-{user_id}")
+        else:
+            service.stop(CONVERSATION_ID, user_id)
+    clock[0] = seconds + ttl
+    service.expire()
+    return service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--keystrokes-per-second", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=3.0)
+    parser.add_argument("--ttl", type=float, default=6.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for users in args.users:
+        events = _keystrokes(users, args.seconds, args.keystrokes_per_second, args.seed)
+        service = _debounced(events, args.seconds, args.interval, args.ttl)
+        stats = service.stats()
+        print(f"{users:4d} users, {args.seconds:.0f}s: per-keystroke {len(events):7d} broadcasts, "
+              f"debounced {stats['broadcasts']:6d} ({stats['suppressed']} suppressed, "
+              f"{stats['expired']} expired stops)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare per-request commits against the single-writer queue.
+
+Run from the backend directory:
+
+    python -m benchmarks.write_queue --threads 16 --writes 200
+"""
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from core.config import settings
+from database.session import Base, apply_sqlite_pragmas
+from database.writer import WriteQueue
+from database.models import User, Notification
+
+
+def _setup(db_path: Path):
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    apply_sqlite_pragmas(engine, settings.SQLITE_PRAGMAS)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+    with factory() as db:
+        user = User(email="bench@example.com", username="bench", first_name="Bench", last_name="User", hashed_password="x")
+        db.add(user)
+        db.commit()
+        return engine, factory, user.id
+
+
+def run(label: str, enabled: bool, threads: int, writes: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, factory, user_id = _setup(Path(tmp) / "bench.db")
+        wq = WriteQueue(factory, enabled=enabled, max_batch=settings.DB_WRITE_QUEUE_MAX_BATCH,
+                        max_delay=settings.DB_WRITE_QUEUE_MAX_DELAY_MS / 1000)
+        errors = 0
+        lock = threading.Lock()
+
+        def writer():
+            nonlocal errors
+            for i in range(writes):
+                try:
+                    wq.run_sync(lambda db: db.add(Notification(user_id=user_id, type="bench", data={"i": i})))
+                except Exception:
+                    with lock:
+                        errors += 1
+
+        workers = [threading.Thread(target=writer) for _ in range(threads)]
+        started = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - started
+        wq.stop()
+        engine.dispose()
+
+        total = threads * writes - errors
+        return {
+            "mode": label,
+            "writes": total,
+            "errors": errors,
+            "seconds": round(elapsed, 3),
+            "writes_per_sec": round(total / elapsed, 1),
+            "stats": wq.stats(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+
+    for label, enabled in (("direct", False), ("queued", True)):
+        r = run(label, enabled, args.threads, args.writes)
+        print(f"{r['mode']:>7}: {r['writes_per_sec']:>8} writes/s  ({r['writes']} ok, {r['errors']} failed, "
+              f"{r['seconds']}s)  avg batch {r['stats']['avg_batch']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry time to live
+
+    Fills from a slower source can race with invalidation: a value read
+    before a change commits may be stored after the change invalidated the
+    key. Take ``generation()`` before reading and pass it to ``set``; the
+    value is dropped if the key was written or invalidated since. Those
+    writes are remembered per key for the last ``maxsize`` keys, and older
+    ones by a single floor, so a fill may be skipped but never goes stale.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._changed: "OrderedDict[Hashable, int]" = OrderedDict()  # key -> generation of its last change
+        self._changed_floor = 0  # generation of the newest change forgotten from _changed
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the cached value, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self) -> int:
+        """Token to pass to set() for a value read from the source after this call"""
+        with self._lock:
+            return self._generation
+
+    def _mark_changed(self, key: Hashable):
+        # Caller holds the lock
+        self._generation += 1
+        self._changed[key] = self._generation
+        self._changed.move_to_end(key)
+        while len(self._changed) > max(self.maxsize, 1):
+            _, generation = self._changed.popitem(last=False)
+            self._changed_floor = generation
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None):
+        """Store a value, evicting the least recently used entry when full
+
+        With a generation from generation(), the value is only stored if the
+        key has not been set or invalidated since.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation is not None and self._changed.get(key, self._changed_floor) > generation:
+                return
+            self._mark_changed(key)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable):
+        """Drop the given keys if present"""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._mark_changed(key)
+
+    def invalidate_where(self, predicate: Callable[[Any], bool]):
+        """Drop every entry whose value matches the predicate"""
+        with self._lock:
+            stale = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in stale:
+                del self._data[key]
+                self._mark_changed(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+            self._changed.clear()
+            self._changed_floor = self._generation
+
+    def stats(self) -> dict:
+        """Get hit/miss counters and current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -11,10 +11,122 @@ class Settings(BaseModel):
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", str(60 * 24)))
 
+    # Authenticated principal cache (per process); 0 disables it
+    PRINCIPAL_CACHE_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+    PRINCIPAL_CACHE_TTL_SECONDS: float = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+    # Conversation membership index (per process); 0 disables it. The TTL
+    # bounds staleness when another process changes membership.
+    CONVERSATION_MEMBERSHIP_CACHE_SIZE: int = int(os.getenv("CONVERSATION_MEMBERSHIP_CACHE_SIZE", "4096"))
+    CONVERSATION_MEMBERSHIP_CACHE_TTL_SECONDS: float = float(os.getenv("CONVERSATION_MEMBERSHIP_CACHE_TTL_SECONDS", "300"))
+
+    # Conversation and sender of recent messages (per process), used to
+    # authorize socket edits, deletes, reads and reactions; 0 disables it
+    MESSAGE_OWNER_CACHE_SIZE: int = int(os.getenv("MESSAGE_OWNER_CACHE_SIZE", "8192"))
+    MESSAGE_OWNER_CACHE_TTL_SECONDS: float = float(os.getenv("MESSAGE_OWNER_CACHE_TTL_SECONDS", "600"))
+
+    # Socket.IO client manager: "memory" (one worker), "unix" (workers on one
+    # host share a broker on SOCKETIO_BROKER_PATH) or "redis" (several hosts).
+    # The broker socket must sit in a directory only this user can write to:
+    # workers unpickle whatever the broker sends them.
+    SOCKETIO_MANAGER: str = os.getenv("SOCKETIO_MANAGER", "memory")
+    SOCKETIO_REDIS_URL: str = os.getenv("SOCKETIO_REDIS_URL", "redis://localhost:6379/0")
+    SOCKETIO_BROKER_PATH: str = os.getenv(
+        "SOCKETIO_BROKER_PATH", str(Path(__file__).resolve().parent.parent / "run" / "socketio.sock")
+    )
+    SOCKETIO_CHANNEL: str = os.getenv("SOCKETIO_CHANNEL", "socketio")
+    SOCKETIO_PRESENCE_HEARTBEAT_SECONDS: float = float(os.getenv("SOCKETIO_PRESENCE_HEARTBEAT_SECONDS", "10"))
+
+    # Typing indicators: a start is re-broadcast at most once per interval, and
+    # a user who sends no keystroke for the TTL is broadcast as stopped
+    TYPING_BROADCAST_INTERVAL_SECONDS: float = float(os.getenv("TYPING_BROADCAST_INTERVAL_SECONDS", "3"))
+    TYPING_TTL_SECONDS: float = float(os.getenv("TYPING_TTL_SECONDS", "6"))
+
+    # Read events of one user in one conversation are coalesced for this long
+    # into a single read cursor write and "read up to" broadcast
+    READ_RECEIPT_WINDOW_MS: float = float(os.getenv("READ_RECEIPT_WINDOW_MS", "500"))
+
+    # Optional group commit for socket chat messages: each batch (at most
+    # MAX_BATCH, waiting at most MAX_DELAY_MS for more) is inserted in one
+    # transaction (see websocket/services/message_pipeline.py)
+    CHAT_MESSAGE_PIPELINE: bool = os.getenv("CHAT_MESSAGE_PIPELINE", "false").lower() in ("1", "true", "yes")
+    CHAT_MESSAGE_PIPELINE_MAX_BATCH: int = int(os.getenv("CHAT_MESSAGE_PIPELINE_MAX_BATCH", "256"))
+    CHAT_MESSAGE_PIPELINE_MAX_DELAY_MS: float = float(os.getenv("CHAT_MESSAGE_PIPELINE_MAX_DELAY_MS", "2"))
+    CHAT_MESSAGE_PIPELINE_MAX_PENDING: int = int(os.getenv("CHAT_MESSAGE_PIPELINE_MAX_PENDING", "10000"))
+
+    # Recently sent (sender, client_message_id) pairs kept in memory, so a
+    # retried send is answered with the original message without a query
+    CLIENT_MESSAGE_ID_WINDOW_SIZE: int = int(os.getenv("CLIENT_MESSAGE_ID_WINDOW_SIZE", "10000"))
+    CLIENT_MESSAGE_ID_WINDOW_SECONDS: float = float(os.getenv("CLIENT_MESSAGE_ID_WINDOW_SECONDS", "300"))
+
+    # Most change log entries one GET /chat/sync response replays
+    CHAT_SYNC_MAX_CHANGES: int = int(os.getenv("CHAT_SYNC_MAX_CHANGES", "1000"))
+
+    # bcrypt worker pool used by login/signup
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+    PASSWORD_HASH_QUEUE_LIMIT: int = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+    PASSWORD_HASH_TIMEOUT_SECONDS: float = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", "5"))
+
+    # SQLite connection profile: "production" applies the pragmas below on every
+    # new connection, "default" leaves SQLite's built-in behaviour untouched
+    SQLITE_PROFILE: str = os.getenv("SQLITE_PROFILE", "production")
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB
+    SQLITE_TEMP_STORE: str = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+    # Connection pool. Pre-ping and recycle only apply to server databases; the
+    # pool is not used for in-memory SQLite.
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+    # Schema handling at startup: "create" runs create_all on every boot,
+    # "versioned" only when the stored schema version is out of date, "skip" never
+    DB_SCHEMA_MODE: str = os.getenv("DB_SCHEMA_MODE", "create")
+
+    # Per-request SQL metrics: fraction of requests sampled (0 disables) and
+    # how many runs of one statement in a request count as a likely N+1
+    SQL_METRICS_SAMPLE_RATE: float = float(os.getenv("SQL_METRICS_SAMPLE_RATE", "1.0"))
+    SQL_METRICS_REPEAT_THRESHOLD: int = int(os.getenv("SQL_METRICS_REPEAT_THRESHOLD", "10"))
+
+    # Threads used to run blocking database work from async handlers
+    DB_EXECUTOR_WORKERS: int = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+
+    # Optional single-writer queue that group-commits writes (see database/writer.py);
+    # chat messages are group-committed by CHAT_MESSAGE_PIPELINE instead
+    DB_WRITE_QUEUE: bool = os.getenv("DB_WRITE_QUEUE", "false").lower() in ("1", "true", "yes")
+    DB_WRITE_QUEUE_MAX_BATCH: int = int(os.getenv("DB_WRITE_QUEUE_MAX_BATCH", "64"))
+    DB_WRITE_QUEUE_MAX_DELAY_MS: float = float(os.getenv("DB_WRITE_QUEUE_MAX_DELAY_MS", "2"))
+
+    # Mount the unauthenticated /internal/* diagnostics routes; keep off in production
+    INTERNAL_ENDPOINTS: bool = os.getenv("INTERNAL_ENDPOINTS", "false").lower() in ("1", "true", "yes")
+
+    @property
+    def SQLITE_PRAGMAS(self) -> dict[str, str | int]:
+        if self.SQLITE_PROFILE != "production":
+            return {}
+        return {
+            "journal_mode": self.SQLITE_JOURNAL_MODE,
+            "synchronous": self.SQLITE_SYNCHRONOUS,
+            "mmap_size": self.SQLITE_MMAP_SIZE,
+            "cache_size": self.SQLITE_CACHE_SIZE,
+            "temp_store": self.SQLITE_TEMP_STORE,
+            "busy_timeout": self.SQLITE_BUSY_TIMEOUT_MS,
+        }
+
     @property
     def DB_PATH(self) -> Path:
         return Path(__file__).resolve().parent.parent / "app.db"
 
+    @property
+    def MEDIA_DIR(self) -> Path:
+        return Path(__file__).resolve().parent.parent / "media"
+
     @property
     def DATABASE_URL(self) -> str:
         env_db = os.getenv("DATABASE_URL")
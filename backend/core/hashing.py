@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .config import settings
+from . import security
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when password work is rejected or times out"""
+
+
+class PasswordHasher:
+    """Runs bcrypt in a dedicated, size-limited process pool.
+
+    At most ``queue_limit`` operations are admitted at once (running plus
+    waiting); further calls fail fast with PasswordPoolBusy instead of piling up.
+    An operation counts as in flight until its worker is really done with it,
+    even after the caller gave up waiting on a timeout.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, timeout: float):
+        self.workers = max(1, workers)
+        self.queue_limit = max(self.workers, queue_limit)
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.failures = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise PasswordPoolBusy("password queue is full")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        started = time.perf_counter()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(lambda done: self._finished(done, started))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # Only drops the operation if it is still waiting; a running worker
+            # keeps its admission slot until _finished
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise PasswordPoolBusy("password operation timed out")
+
+    def _finished(self, future, started: float):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.failures += 1
+                return
+            self.completed += 1
+            self.total_latency += elapsed
+            self.max_latency = max(self.max_latency, elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(security.get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(security.verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self) -> dict:
+        """Get queue depth and latency counters"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "queue_depth": self.in_flight,
+                "max_queue_depth": self.max_in_flight,
+                "completed": self.completed,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "avg_latency_ms": round(self.total_latency / self.completed * 1000, 2) if self.completed else 0.0,
+                "max_latency_ms": round(self.max_latency * 1000, 2),
+            }
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_limit=settings.PASSWORD_HASH_QUEUE_LIMIT,
+    timeout=settings.PASSWORD_HASH_TIMEOUT_SECONDS,
+)
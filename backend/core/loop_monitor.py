@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed-interval sleep.
+
+    Any lag means a callback held the loop (for example blocking database I/O
+    inside an ``async def``), delaying every socket and request in the process.
+    """
+
+    def __init__(self, interval: float = 0.5, warn_threshold: float = 0.1):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self._task: asyncio.Task | None = None
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.stalls = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.samples += 1
+            self.total_lag += lag
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.warn_threshold:
+                self.stalls += 1
+                logger.warning("Event loop blocked for %.1f ms", lag * 1000)
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples,
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "avg_lag_ms": round(self.total_lag / self.samples * 1000, 2) if self.samples else 0.0,
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "stalls": self.stalls,
+        }
+
+
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,81 @@
+import logging
+import random
+import threading
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from core.config import settings
+from database.instrumentation import QueryStats, track_queries
+
+logger = logging.getLogger(__name__)
+
+
+class QueryMetrics:
+    """Sampling policy and counters shared by every QueryMetricsMiddleware"""
+
+    def __init__(self, sample_rate: float = 1.0, repeat_threshold: int = 10):
+        self.sample_rate = sample_rate
+        self.repeat_threshold = repeat_threshold
+        self._lock = threading.Lock()
+        self.sampled = 0
+        self.flagged = 0
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def report(self, scope: Scope, stats: QueryStats):
+        repeated = stats.repeated(self.repeat_threshold)
+        with self._lock:
+            self.sampled += 1
+            self.flagged += bool(repeated)
+        for statement, times in repeated:
+            logger.warning(
+                "Possible N+1 in %s %s: statement ran %d times (%d queries, %.1f ms total): %s",
+                scope["method"], scope["path"], times, stats.count, stats.duration * 1000, statement,
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "repeat_threshold": self.repeat_threshold,
+                "sampled_requests": self.sampled,
+                "flagged_requests": self.flagged,
+            }
+
+
+query_metrics = QueryMetrics(
+    sample_rate=settings.SQL_METRICS_SAMPLE_RATE,
+    repeat_threshold=settings.SQL_METRICS_REPEAT_THRESHOLD,
+)
+
+
+class QueryMetricsMiddleware:
+    """Reports query count and database time for a sample of HTTP requests.
+
+    Sampled responses carry ``Server-Timing`` and ``X-Query-Count`` headers,
+    and a warning is logged for every SQL shape that ran more than the repeat
+    threshold in one request (the usual N+1 pattern). Unsampled requests only
+    pay for one random() call.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: QueryMetrics = query_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.metrics.should_sample():
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_with_metrics(message: Message):
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"')
+                    headers.append("X-Query-Count", str(stats.count))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_metrics)
+            finally:
+                self.metrics.report(scope, stats)
@@ -12,8 +12,50 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
-def create_access_token(subject: str, expires_minutes: int | None = None) -> str:
+def create_access_token(subject: str, expires_minutes: int | None = None, claims: dict[str, Any] | None = None) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes or settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode: dict[str, Any] = {"sub": subject, "exp": expire}
+    to_encode: dict[str, Any] = {**(claims or {}), "sub": subject, "exp": expire}
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
+
+def decode_access_token(token: str) -> dict[str, Any]:
+    """Decode and verify a token, raising JWTError when it is invalid"""
+    return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+def display_name(user) -> str:
+    return f"{user.first_name} {user.last_name}".strip() or user.username
+
+def create_user_access_token(user) -> str:
+    """Issue a token carrying the user id and display card next to the email subject"""
+    return create_access_token(
+        user.email,
+        claims={"uid": user.id, "name": display_name(user), "avatar": user.profile_photo},
+    )
+
+
+class Principal:
+    """Authenticated user built from token claims, without an ORM row"""
+
+    __slots__ = ("id", "email", "name", "avatar")
+
+    def __init__(self, id: int, email: str, name: str, avatar: Optional[str] = None):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.avatar = avatar
+
+    @classmethod
+    def from_claims(cls, payload: dict[str, Any]) -> Optional["Principal"]:
+        """Build a principal from token claims; None for legacy email-only tokens"""
+        uid = payload.get("uid")
+        email = payload.get("sub")
+        if uid is None or email is None:
+            return None
+        return cls(id=int(uid), email=email, name=payload.get("name") or "", avatar=payload.get("avatar"))
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(id=user.id, email=user.email, name=display_name(user), avatar=user.profile_photo)
+
+    def __repr__(self) -> str:
+        return f"Principal(id={self.id!r}, email={self.email!r})"
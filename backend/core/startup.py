@@ -0,0 +1,45 @@
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Records how long each named startup phase takes"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.finished: float | None = None
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def mark(self, name: str, since: float | None = None):
+        """Record a phase that ran from ``since`` (default: timer creation) until now"""
+        self.phases[name] = time.perf_counter() - (self.started if since is None else since)
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        report = self.report()
+        logger.info(
+            "Startup finished in %.1f ms (%s)",
+            report["total_ms"],
+            ", ".join(f"{name}: {ms} ms" for name, ms in report["phases"].items()),
+        )
+
+    def report(self) -> dict:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return {
+            "total_ms": round((end - self.started) * 1000, 1),
+            "phases": {name: round(elapsed * 1000, 1) for name, elapsed in self.phases.items()},
+        }
+
+
+startup_timer = StartupTimer()
@@ -1,10 +1,15 @@
 from websocket.handlers import AuthHandler, ChatHandler, NotificationHandler
+from websocket.handlers.chat_handler import user_card
 from websocket.services import ConnectionService
-from websocket import sio
-from database.models import User, Message
+from websocket import sio, transport
+from core.config import settings
 
-# Initialize connection service
-connection_service = ConnectionService()
+# Initialize connection service; with a transport it shares presence across workers
+connection_service = ConnectionService(
+    transport=transport,
+    channel=f"{settings.SOCKETIO_CHANNEL}-presence",
+    heartbeat_interval=settings.SOCKETIO_PRESENCE_HEARTBEAT_SECONDS,
+)
 
 # Initialize handlers
 auth_handler = AuthHandler()
@@ -17,16 +22,26 @@ async def connect(sid, environ, auth):
     """Handle new socket connection"""
     try:
         user = await auth_handler.authenticate_socket(auth)
+        # Event handlers read the card from here instead of reloading the user
+        await sio.save_session(sid, {"user": user_card(user)})
         await connection_service.connect(user.id, sid)
+        await chat_handler.join_conversation_rooms(sid, user.id)
         print(f"User {user.id} connected with sid {sid}")
     except Exception as e:
         print(f"Connection error: {e}")
         raise e
 
 
+async def session_user(sid) -> dict | None:
+    """User card saved in the socket session by connect"""
+    session = await sio.get_session(sid)
+    return session.get("user")
+
+
 @sio.event
 async def disconnect(sid):
     """Handle socket disconnection"""
+    await chat_handler.handle_typing_disconnect(sid)
     await connection_service.disconnect(sid)
     print(f"Client {sid} disconnected")
 
@@ -37,15 +52,7 @@ async def disconnect(sid):
 async def chat_message(sid, data):
     """Handle incoming chat message"""
     try:
-        user_id = connection_service.user_by_session.get(sid)
-        if not user_id:
-            return
-
-        from database.session import SessionLocal
-        db = SessionLocal()
-        user = db.query(User).filter(User.id == user_id).first()
-        db.close()
-
+        user = await session_user(sid)
         if not user:
             return
 
@@ -53,19 +60,35 @@ async def chat_message(sid, data):
         content = data.get("content")
         content_type = data.get("content_type", "text")
         media_url = data.get("media_url")
+        client_message_id = data.get("client_message_id")
+        if client_message_id is not None and (
+            not isinstance(client_message_id, str) or not 0 < len(client_message_id) <= 64
+        ):
+            await sio.emit('error', {'message': 'Invalid client_message_id'}, to=sid)
+            return
 
         message_payload = await chat_handler.handle_send_message(
-            user=user,
+            sender=user,
             conversation_id=conversation_id,
             content=content,
             content_type=content_type,
             media_url=media_url,
+            client_message_id=client_message_id,
         )
 
+        if not message_payload:
+            await sio.emit('error', {'message': 'Not authorized'}, to=sid)
+            return
+
+        if message_payload.pop("duplicate", False):
+            # A retry of a message already delivered: ack it again, nothing more
+            await sio.emit('message_sent', {**message_payload, 'confirmed': True}, to=sid)
+            return
+
         await chat_handler.emit_message_to_conversation(
             conversation_id=conversation_id,
             message_data=message_payload,
-            exclude_sid=sid
+            exclude_sid=sid,
         )
 
         await sio.emit('message_sent', {**message_payload, 'confirmed': True}, to=sid)
@@ -78,22 +101,14 @@ async def chat_message(sid, data):
 async def message_read(sid, data):
     """Handle message read confirmation"""
     try:
-        user_id = connection_service.user_by_session.get(sid)
-        if not user_id:
+        user = await session_user(sid)
+        if not user:
             return
+        user_id = user["id"]
 
-        message_id = data.get("message_id")
-        conversation_id = data.get("conversation_id")
-
-        read_data = await chat_handler.handle_message_read(message_id, user_id)
-
-        await chat_handler.emit_message_read_to_conversation(
-            conversation_id=conversation_id,
-            read_data=read_data,
-            exclude_sid=sid
-        )
-
-        await sio.emit('message_read_confirmed', read_data, to=sid)
+        # Coalesced per conversation; the reader's own sessions get the
+        # "read up to" broadcast along with everyone else
+        await chat_handler.handle_message_read(data.get("message_id"), user_id)
     except Exception as e:
         print(f"Error handling message read: {e}")
 
@@ -102,25 +117,21 @@ async def message_read(sid, data):
 async def delete_message(sid, data):
     """Handle message deletion"""
     try:
-        user_id = connection_service.user_by_session.get(sid)
-        if not user_id:
+        user = await session_user(sid)
+        if not user:
             return
+        user_id = user["id"]
 
-        from database.session import SessionLocal
-        db = SessionLocal()
-        message = db.query(Message).filter(Message.id == data.get("message_id")).first()
-        db.close()
+        delete_data = await chat_handler.handle_delete_message(data.get("message_id"), user_id)
 
-        if not message or message.sender_id != user_id:
+        if not delete_data:
             await sio.emit('error', {'message': 'Not authorized'}, to=sid)
             return
 
-        delete_data = await chat_handler.handle_delete_message(data.get("message_id"))
-
         await chat_handler.emit_message_deleted_to_conversation(
             conversation_id=delete_data['conversation_id'],
             delete_data=delete_data,
-            exclude_sid=sid
+            exclude_sid=sid,
         )
 
         await sio.emit('message_deleted_confirmed', delete_data, to=sid)
@@ -133,28 +144,25 @@ async def delete_message(sid, data):
 async def message_edit(sid, data):
     """Handle message editing"""
     try:
-        user_id = connection_service.user_by_session.get(sid)
-        if not user_id:
-            return
-
-        from database.session import SessionLocal
-        db = SessionLocal()
-        message = db.query(Message).filter(Message.id == data.get("message_id")).first()
-        db.close()
-
-        if not message or message.sender_id != user_id:
-            await sio.emit('error', {'message': 'Not authorized'}, to=sid)
+        user = await session_user(sid)
+        if not user:
             return
+        user_id = user["id"]
 
         edit_data = await chat_handler.handle_edit_message(
             data.get("message_id"),
+            user_id,
             data.get("content")
         )
 
+        if not edit_data:
+            await sio.emit('error', {'message': 'Not authorized'}, to=sid)
+            return
+
         await chat_handler.emit_message_edited_to_conversation(
             conversation_id=edit_data['conversation_id'],
             edit_data=edit_data,
-            exclude_sid=sid
+            exclude_sid=sid,
         )
 
         await sio.emit('message_edited_confirmed', edit_data, to=sid)
@@ -167,29 +175,29 @@ async def message_edit(sid, data):
 async def message_reaction(sid, data):
     """Handle message reaction"""
     try:
-        user_id = connection_service.user_by_session.get(sid)
-        if not user_id:
+        user = await session_user(sid)
+        if not user:
             return
+        user_id = user["id"]
 
-        from database.session import SessionLocal
-        db = SessionLocal()
-        message = db.query(Message).filter(Message.id == data.get("message_id")).first()
-        db.close()
-
-        if not message:
+        owner = await chat_handler.get_message_owner(data.get("message_id"))
+        if not owner:
+            return
+        conversation_id, _ = owner
+        if user_id not in await chat_handler.get_participant_ids(conversation_id):
             return
 
         reaction_data = {
             "message_id": data.get("message_id"),
             "user_id": user_id,
             "emoji": data.get("emoji"),
-            "conversation_id": message.conversation_id,
+            "conversation_id": conversation_id,
         }
 
         await chat_handler.emit_message_to_conversation(
-            conversation_id=message.conversation_id,
+            conversation_id=conversation_id,
             message_data=reaction_data,
-            exclude_sid=None
+            exclude_sid=None,
         )
     except Exception as e:
         print(f"Error handling message reaction: {e}")
@@ -199,21 +207,14 @@ async def message_reaction(sid, data):
 async def mark_as_read(sid, data):
     """Handle marking message as read"""
     try:
-        user_id = connection_service.user_by_session.get(sid)
-        if not user_id:
+        user = await session_user(sid)
+        if not user:
             return
+        user_id = user["id"]
 
-        message_id = data.get("message_id")
-        conversation_id = data.get("conversation_id")
-
-        read_data = await chat_handler.handle_message_read(message_id, user_id)
-
-        await chat_handler.emit_message_read_to_conversation(
-            conversation_id=conversation_id,
-            read_data=read_data,
-        )
-
-        await sio.emit('message_read_confirmed', read_data, to=sid)
+        # Coalesced per conversation; the reader's own sessions get the
+        # "read up to" broadcast along with everyone else
+        await chat_handler.handle_message_read(data.get("message_id"), user_id)
     except Exception as e:
         print(f"Error handling mark as read: {e}")
 
@@ -222,36 +223,64 @@ async def mark_as_read(sid, data):
 async def typing(sid, data):
     """Handle typing indicator"""
     try:
-        user_id = connection_service.user_by_session.get(sid)
-        if not user_id:
-            return
-
-        from database.session import SessionLocal
-        db = SessionLocal()
-        user = db.query(User).filter(User.id == user_id).first()
-        db.close()
-
+        user = await session_user(sid)
         if not user:
             return
+        user_id = user["id"]
 
         conversation_id = data.get("conversation_id")
         is_typing = data.get("typing", True)
 
+        # Membership comes from the index, so non-participants cost no query
+        participant_ids = await chat_handler.get_participant_ids(conversation_id)
+        if user_id not in participant_ids:
+            return
+
         typing_payload = await chat_handler.handle_typing(
             user=user,
             conversation_id=conversation_id,
             is_typing=is_typing,
+            session_id=sid,
         )
+        if not typing_payload:
+            return
 
         await chat_handler.emit_typing_to_conversation(
             conversation_id=conversation_id,
             typing_data=typing_payload,
-            exclude_sid=sid
+            exclude_sid=sid,
         )
     except Exception as e:
         print(f"Error handling typing: {e}")
 
 
+# ============= BACKGROUND TASKS =============
+
+async def start_background_tasks():
+    """Start presence sharing and the typing expiry timer (called on app startup)"""
+    await connection_service.start()
+    chat_handler.start_typing_expiry()
+
+
+async def stop_background_tasks():
+    chat_handler.stop_typing_expiry()
+    await chat_handler.flush_reads()
+    await chat_handler.message_pipeline.stop()
+    await connection_service.stop()
+
+
+# ============= CONVERSATION ROOMS =============
+
+async def join_conversation_room(conversation_id: int, user_ids):
+    """Add the connected sessions of user_ids to a conversation's room"""
+    await chat_handler.join_conversation_room(conversation_id, user_ids)
+
+
+async def close_conversation_room(conversation_id: int):
+    """Empty the room of a deleted conversation"""
+    await chat_handler.close_conversation_room(conversation_id)
+
+
 # ============= PROFILE VISIT EVENTS =============
 
 async def emit_visit_notification(visited_user_id: int, visitor_id: int, visitor_name: str, visitor_avatar: str = None):
@@ -0,0 +1,110 @@
+"""Rebuild denormalized columns from their source tables.
+
+Run from the backend directory:
+
+    python -m database.backfill last-messages
+    python -m database.backfill read-cursors
+    python -m database.backfill search-index
+"""
+import argparse
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, and_, func, inspect, or_, select, update
+from sqlalchemy.engine import Connection
+from database.models import Conversation, Message
+from database.models.conversation import LAST_MESSAGE_PREVIEW_LENGTH, conversation_participants
+from database.search import rebuild_search_index
+
+# The per-message read receipts table replaced by read cursors; only the
+# collapse below still reads it
+legacy_message_reads = Table(
+    "message_reads",
+    MetaData(),
+    Column("message_id", Integer, primary_key=True),
+    Column("user_id", Integer, primary_key=True),
+    Column("read_at", DateTime),
+)
+
+
+def backfill_last_messages(conn: Connection) -> int:
+    """Point every conversation at its latest non-deleted message"""
+    conversations = Conversation.__table__
+    messages = Message.__table__
+
+    latest_id = select(messages.c.id).where(
+        messages.c.conversation_id == conversations.c.id,
+        messages.c.is_deleted == False,
+    ).order_by(
+        messages.c.created_at.desc(), messages.c.id.desc()
+    ).limit(1).scalar_subquery()
+    conn.execute(update(conversations).values(last_message_id=latest_id))
+
+    def from_latest(column):
+        return select(column).where(messages.c.id == conversations.c.last_message_id).scalar_subquery()
+
+    result = conn.execute(update(conversations).values(
+        last_message_at=from_latest(messages.c.created_at),
+        last_message_preview=from_latest(func.substr(messages.c.content, 1, LAST_MESSAGE_PREVIEW_LENGTH)),
+        last_message_type=from_latest(messages.c.content_type),
+        last_sender_id=from_latest(messages.c.sender_id),
+    ))
+    return result.rowcount
+
+
+def collapse_message_reads(conn: Connection) -> int:
+    """Turn legacy message_reads rows into read cursors, then drop the table.
+
+    Each participant's cursor moves to the newest message they had read, so
+    older messages they never opened also count as read from now on.
+    """
+    if not inspect(conn).has_table(legacy_message_reads.name):
+        return 0
+    reads = legacy_message_reads
+    participants = conversation_participants
+    messages = Message.__table__
+
+    def newest_read(column):
+        return select(column).select_from(
+            reads.join(messages, messages.c.id == reads.c.message_id)
+        ).where(
+            messages.c.conversation_id == participants.c.conversation_id,
+            reads.c.user_id == participants.c.user_id,
+        ).scalar_subquery()
+
+    newest_id = newest_read(func.max(reads.c.message_id))
+    result = conn.execute(
+        update(participants).where(
+            and_(
+                newest_id.is_not(None),
+                or_(
+                    participants.c.last_read_message_id == None,
+                    participants.c.last_read_message_id < newest_id,
+                ),
+            )
+        ).values(
+            last_read_message_id=newest_id,
+            last_read_at=newest_read(func.max(reads.c.read_at)),
+        )
+    )
+    reads.drop(conn)
+    return result.rowcount
+
+
+BACKFILLS = {
+    "last-messages": backfill_last_messages,
+    "read-cursors": collapse_message_reads,
+    "search-index": rebuild_search_index,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("target", choices=sorted(BACKFILLS))
+    args = parser.parse_args()
+
+    from database.session import engine
+    with engine.begin() as conn:
+        rows = BACKFILLS[args.target](conn)
+    print(f"{args.target}: {rows} rows updated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from core.config import settings
+
+T = TypeVar("T")
+
+# Dedicated pool for blocking database work issued from async code, so SQLite
+# I/O never runs on the event loop and cannot starve Starlette's threadpool.
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_EXECUTOR_WORKERS,
+    thread_name_prefix="db",
+)
+
+async def run_db(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking database call on the DB executor and await its result"""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. per-request query tracking) into the worker
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, functools.partial(ctx.run, fn, *args, **kwargs))
@@ -0,0 +1,66 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Expanded IN lists vary in length; fold them so they count as one SQL shape
+_IN_LIST = re.compile(r"\bIN \([^()]*\)", re.IGNORECASE)
+
+
+class QueryStats:
+    """Queries executed while tracking is active, grouped by SQL shape"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        shape = _IN_LIST.sub("IN (...)", statement)
+        with self._lock:
+            self.count += 1
+            self.duration += elapsed
+            self.shapes[shape] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """SQL shapes executed more than ``threshold`` times, most frequent first"""
+        with self._lock:
+            return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+
+# Set for the duration of a tracked request. Context variables follow the work
+# into Starlette's threadpool and into run_db, so queries issued there count too.
+current_query_stats: ContextVar[QueryStats | None] = ContextVar("current_query_stats", default=None)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    stats = QueryStats()
+    token = current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_query_stats.reset(token)
+
+
+def instrument_engine(engine: Engine):
+    """Time every statement executed while a QueryStats is being tracked"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if current_query_stats.get() is not None:
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stats = current_query_stats.get()
+        started = conn.info.get("query_started")
+        if stats is None or not started:
+            return
+        stats.record(statement, time.perf_counter() - started.pop())
@@ -7,7 +7,8 @@ from .friend import FriendRequest, Friendship
 from .visit import Visit
 from .notification import Notification
 from .conversation import Conversation
-from .message import Message, message_reads
+from .message import Message
+from .chat_change import ChatChange
 
 __all__ = [
     "User",
@@ -23,5 +24,5 @@ __all__ = [
     "Notification",
     "Conversation",
     "Message",
-    "message_reads",
+    "ChatChange",
 ]
@@ -0,0 +1,35 @@
+from datetime import datetime
+from sqlalchemy import Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from ..session import Base
+
+# ChatChange.kind values
+CHANGE_MESSAGE = "message"  # message_id was sent
+CHANGE_EDIT = "edit"  # message_id was edited
+CHANGE_DELETE = "delete"  # message_id was deleted
+CHANGE_READ = "read"  # user_id read everything up to message_id
+
+class ChatChange(Base):
+    """Append-only log of chat changes, replayed by GET /chat/sync
+
+    id is the sync cursor: it only ever grows (AUTOINCREMENT on SQLite never
+    reuses ids), so "everything after cursor N" is a range scan per
+    conversation on ix_chat_changes_conversation_id_id.
+
+    The cursor is only safe on SQLite, where the single writer makes ids
+    become visible in commit order. On PostgreSQL or MySQL two concurrent
+    transactions can commit ids out of order, and a client that synced in
+    between would skip the lower one.
+    """
+    __tablename__ = "chat_changes"
+    __table_args__ = (
+        Index('ix_chat_changes_conversation_id_id', 'conversation_id', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    conversation_id: Mapped[int] = mapped_column(Integer, ForeignKey("conversations.id"), nullable=False)
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)
+    message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
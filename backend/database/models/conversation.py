@@ -11,8 +11,14 @@ conversation_participants = Table(
     Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
     Column('muted', Boolean, default=False),
     Column('deleted_at', DateTime, nullable=True),
+    # Read cursor: every message up to and including this id has been read
+    Column('last_read_message_id', Integer, nullable=True),
+    Column('last_read_at', DateTime, nullable=True),
 )
 
+# Characters of the latest message copied into Conversation.last_message_preview
+LAST_MESSAGE_PREVIEW_LENGTH = 200
+
 class Conversation(Base):
     __tablename__ = "conversations"
 
@@ -26,6 +32,16 @@ class Conversation(Base):
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     deleted_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)
 
+    # Denormalized copy of the latest non-deleted message, kept in sync by
+    # ChatService so the inbox never has to read the messages table.
+    # last_message_id is a plain pointer: a foreign key would make the
+    # conversations/messages tables mutually dependent.
+    last_message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    last_message_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)
+    last_message_preview: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    last_message_type: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    last_sender_id: Mapped[int | None] = mapped_column(Integer, ForeignKey("users.id"), nullable=True)
+
     participants: Mapped[list["User"]] = relationship(
         "User",
         secondary=conversation_participants,
@@ -37,3 +53,4 @@ class Conversation(Base):
         cascade="all,delete-orphan"
     )
     creator = relationship("User", foreign_keys=[created_by_id])
+    last_sender = relationship("User", foreign_keys=[last_sender_id])
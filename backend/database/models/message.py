@@ -1,21 +1,14 @@
 from datetime import datetime
-from sqlalchemy import Integer, String, DateTime, ForeignKey, Text, Boolean, Table, Column, Index
+from sqlalchemy import Integer, String, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from ..session import Base
 
-# Association table for tracking which users have read each message
-message_reads = Table(
-    'message_reads',
-    Base.metadata,
-    Column('message_id', Integer, ForeignKey('messages.id'), primary_key=True),
-    Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
-    Column('read_at', DateTime, default=datetime.utcnow),
-)
-
 class Message(Base):
     __tablename__ = "messages"
     __table_args__ = (
         Index('ix_messages_conversation_created', 'conversation_id', 'created_at'),
+        # Retried sends carry the same client id; NULLs (no client id) never collide
+        Index('ux_messages_sender_client_message_id', 'sender_id', 'client_message_id', unique=True),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -27,11 +20,10 @@ class Message(Base):
     is_deleted: Mapped[bool] = mapped_column(default=False, index=True)
     edited_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    # Optional id generated by the sending client, unique per sender
+    client_message_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
 
     conversation: Mapped["Conversation"] = relationship("Conversation", back_populates="messages")
     sender = relationship("User", foreign_keys=[sender_id])
-    read_by: Mapped[list["User"]] = relationship(
-        "User",
-        secondary=message_reads,
-        backref="read_messages"
-    )
+    # Readers are not stored per message; they are derived from the read
+    # cursors on conversation_participants (see ChatService.get_read_by)
@@ -0,0 +1,63 @@
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection.
+
+    The measured time covers the whole checkout: waiting for a free slot,
+    opening a new connection when overflow allows it, and any pre-ping.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def wait_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+
+def pool_stats(engine: Engine) -> dict:
+    """Get the engine's pool occupancy and checkout wait times"""
+    pool = engine.pool
+    stats = {"dialect": engine.dialect.name, "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            # Negative while the pool is not yet full
+            "overflow": pool.overflow(),
+            "timeout": pool.timeout(),
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update(pool.wait_stats())
+    return stats
@@ -0,0 +1,93 @@
+import logging
+from typing import Callable
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, select
+from sqlalchemy.engine import Connection, Engine
+from .session import Base
+from .models import Conversation, Message
+from .models.conversation import conversation_participants
+from .backfill import backfill_last_messages, collapse_message_reads
+from .search import rebuild_search_index
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the models change, so "versioned" startups sync the schema again
+SCHEMA_VERSION = 6
+
+# Kept out of Base.metadata: it describes the schema rather than being part of it
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, nullable=False),
+)
+
+def add_missing_columns(conn: Connection, table: Table, names: list[str]):
+    """Add model columns (and their indexes) that an older table lacks"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        conn.exec_driver_sql(
+            f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(dialect=conn.dialect)}"
+        )
+    for index in table.indexes:
+        if set(index.columns.keys()) & set(names):
+            index.create(conn, checkfirst=True)
+
+def _v2_last_message(conn: Connection):
+    add_missing_columns(conn, Conversation.__table__, [
+        "last_message_id", "last_message_at", "last_message_preview", "last_message_type", "last_sender_id",
+    ])
+    backfill_last_messages(conn)
+
+def _v3_read_cursors(conn: Connection):
+    add_missing_columns(conn, conversation_participants, ["last_read_message_id", "last_read_at"])
+    collapse_message_reads(conn)
+
+def _v4_search_index(conn: Connection):
+    rebuild_search_index(conn)
+
+def _v5_client_message_ids(conn: Connection):
+    add_missing_columns(conn, Message.__table__, ["client_message_id"])
+
+# Upgrade steps for tables that create_all cannot alter, keyed by the version
+# they bring the schema to. Steps must be idempotent: databases created before
+# versioning existed report no version and run every step.
+MIGRATIONS: dict[int, Callable[[Connection], None]] = {
+    2: _v2_last_message,
+    3: _v3_read_cursors,
+    4: _v4_search_index,
+    5: _v5_client_message_ids,
+}
+
+def stored_schema_version(conn: Connection) -> int | None:
+    if not inspect(conn).has_table(schema_version.name):
+        return None
+    return conn.execute(select(schema_version.c.version)).scalar()
+
+def ensure_schema(engine: Engine, mode: str) -> str:
+    """Bring the database schema in line with the models.
+
+    ``create`` always runs create_all (the development default), ``versioned``
+    runs it only when the stored schema version differs from SCHEMA_VERSION,
+    and ``skip`` leaves the database untouched. Returns what was done.
+    """
+    if mode == "skip":
+        return "skipped"
+
+    with engine.begin() as conn:
+        stored = stored_schema_version(conn)
+        if mode == "versioned" and stored == SCHEMA_VERSION:
+            return f"version {stored} up to date"
+
+        Base.metadata.create_all(bind=conn)
+        for version in sorted(MIGRATIONS):
+            if stored is None or stored < version:
+                MIGRATIONS[version](conn)
+        schema_version.create(conn, checkfirst=True)
+        conn.execute(schema_version.delete())
+        conn.execute(schema_version.insert().values(version=SCHEMA_VERSION))
+
+    if stored != SCHEMA_VERSION:
+        logger.info("Schema synced from version %s to %s", stored, SCHEMA_VERSION)
+    return f"synced to version {SCHEMA_VERSION}"
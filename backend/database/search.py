@@ -0,0 +1,172 @@
+"""Full-text search over message content and conversation names.
+
+On SQLite the text is indexed by FTS5 tables that triggers keep in sync, so
+every write path (ORM, bulk updates, the write queue) updates the index on
+create, edit, soft delete and delete. PostgreSQL and MySQL use their native
+full-text search over expression/FULLTEXT indexes, and any other dialect
+falls back to matching each term with ILIKE.
+
+Queries are split into word terms; every term must match, and each term
+also matches as a prefix so results update while the user is still typing.
+"""
+import re
+from sqlalchemy import Column, Integer, MetaData, Table, func, inspect, literal_column
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Query
+from .models import Conversation, Message
+
+# Longer queries are truncated rather than rejected
+MAX_TERMS = 8
+
+_TERM = re.compile(r"\w+")
+
+# External-content FTS5 tables: they index rows of messages/conversations by
+# id without storing a second copy of the text. Kept out of Base.metadata;
+# create_all cannot create virtual tables.
+_fts_metadata = MetaData()
+messages_fts = Table("messages_fts", _fts_metadata, Column("rowid", Integer), Column("rank"))
+conversations_fts = Table("conversations_fts", _fts_metadata, Column("rowid", Integer), Column("rank"))
+
+# An FTS5 'delete' must be given exactly the values that were indexed, so
+# each trigger only unindexes rows that were indexable before the change
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, content='messages', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+    WHEN new.is_deleted = 0 BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, is_deleted ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content)
+            SELECT 'delete', old.id, old.content WHERE old.is_deleted = 0;
+        INSERT INTO messages_fts(rowid, content)
+            SELECT new.id, new.content WHERE new.is_deleted = 0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+    WHEN old.is_deleted = 0 BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+        name, content='conversations', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations
+    WHEN new.name IS NOT NULL AND new.deleted_at IS NULL BEGIN
+        INSERT INTO conversations_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE OF name, deleted_at ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, name)
+            SELECT 'delete', old.id, old.name WHERE old.name IS NOT NULL AND old.deleted_at IS NULL;
+        INSERT INTO conversations_fts(rowid, name)
+            SELECT new.id, new.name WHERE new.name IS NOT NULL AND new.deleted_at IS NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations
+    WHEN old.name IS NOT NULL AND old.deleted_at IS NULL BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+]
+
+_POSTGRESQL_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_messages_content_search ON messages "
+    "USING gin (to_tsvector('simple', coalesce(content, '')))",
+    "CREATE INDEX IF NOT EXISTS ix_conversations_name_search ON conversations "
+    "USING gin (to_tsvector('simple', coalesce(name, '')))",
+]
+
+_MYSQL_FULLTEXT = {
+    "messages": ("ix_messages_content_search", "content"),
+    "conversations": ("ix_conversations_name_search", "name"),
+}
+
+
+def search_terms(text: str) -> list[str]:
+    """Split a search box query into lowercase word terms"""
+    return _TERM.findall(text.lower())[:MAX_TERMS]
+
+
+def install_search_index(conn: Connection):
+    """Create the dialect's full-text indexes (and SQLite's sync triggers)"""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        for statement in _SQLITE_DDL:
+            conn.exec_driver_sql(statement)
+    elif dialect == "postgresql":
+        for statement in _POSTGRESQL_DDL:
+            conn.exec_driver_sql(statement)
+    elif dialect in ("mysql", "mariadb"):
+        for table, (index, column) in _MYSQL_FULLTEXT.items():
+            existing = {ix["name"] for ix in inspect(conn).get_indexes(table)}
+            if index not in existing:
+                conn.exec_driver_sql(f"CREATE FULLTEXT INDEX {index} ON {table} ({column})")
+
+
+def rebuild_search_index(conn: Connection) -> int:
+    """Install the search index and re-index every searchable row.
+
+    Only SQLite keeps a separate index to fill; other dialects index the
+    tables themselves.
+    """
+    install_search_index(conn)
+    if conn.dialect.name != "sqlite":
+        return 0
+    conn.exec_driver_sql("INSERT INTO messages_fts(messages_fts) VALUES ('delete-all')")
+    rows = conn.exec_driver_sql(
+        "INSERT INTO messages_fts(rowid, content) SELECT id, content FROM messages WHERE is_deleted = 0"
+    ).rowcount
+    conn.exec_driver_sql("INSERT INTO conversations_fts(conversations_fts) VALUES ('delete-all')")
+    rows += conn.exec_driver_sql(
+        "INSERT INTO conversations_fts(rowid, name) SELECT id, name FROM conversations "
+        "WHERE name IS NOT NULL AND deleted_at IS NULL"
+    ).rowcount
+    return rows
+
+
+def _ranked(query: Query, column, fts: Table, key, terms: list[str], newest_first) -> Query:
+    dialect = query.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        expression = " ".join(f'"{term}"*' for term in terms)
+        return query.join(fts, fts.c.rowid == key).filter(
+            literal_column(fts.name).op("MATCH")(expression)
+        ).order_by(fts.c.rank, newest_first)
+
+    if dialect == "postgresql":
+        # Matches the expression indexes created by install_search_index
+        document = func.to_tsvector("simple", func.coalesce(column, ""))
+        tsquery = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        return query.filter(document.op("@@")(tsquery)).order_by(
+            func.ts_rank(document, tsquery).desc(), newest_first
+        )
+
+    if dialect in ("mysql", "mariadb"):
+        relevance = match(column, against=" ".join(f"+{term}*" for term in terms)).in_boolean_mode()
+        return query.filter(relevance).order_by(relevance.desc(), newest_first)
+
+    return query.filter(*(column.ilike(f"%{term}%") for term in terms)).order_by(newest_first)
+
+
+def rank_messages(query: Query, text: str) -> Query | None:
+    """Restrict a Message query to full-text matches, best match first.
+
+    Returns None when the text holds no searchable terms.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return None
+    return _ranked(query, Message.content, messages_fts, Message.id, terms, Message.created_at.desc())
+
+
+def rank_conversations(query: Query, text: str) -> Query | None:
+    """Restrict a Conversation query to name matches, best match first.
+
+    Returns None when the text holds no searchable terms.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return None
+    return _ranked(
+        query, Conversation.name, conversations_fts, Conversation.id, terms,
+        func.coalesce(Conversation.last_message_at, Conversation.created_at).desc(),
+    )
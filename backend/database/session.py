@@ -1,14 +1,92 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import logging
+from contextlib import contextmanager
+from typing import Iterator
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
 from core.config import settings
+from .pool import TimedQueuePool
+from .instrumentation import instrument_engine
 
-engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
+logger = logging.getLogger(__name__)
+
+def apply_sqlite_pragmas(engine: Engine, pragmas: dict[str, str | int]):
+    """Run the given PRAGMA statements on every new DBAPI connection"""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+def sqlite_pragma_report(engine: Engine) -> dict[str, str | int]:
+    """Read back the effective connection pragmas"""
+    if engine.dialect.name != "sqlite":
+        return {}
+    report = {}
+    with engine.connect() as conn:
+        for name in ("journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store", "busy_timeout"):
+            report[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return report
+
+def log_sqlite_profile(engine: Engine):
+    report = sqlite_pragma_report(engine)
+    if report:
+        logger.info("SQLite profile %r: %s", settings.SQLITE_PROFILE, report)
+
+def create_db_engine(url: str) -> Engine:
+    """Create an engine with pool and connection options suited to its dialect"""
+    parsed = make_url(url)
+    kwargs = {}
+    if parsed.get_backend_name() == "sqlite":
+        # Sessions are handed between executor threads
+        kwargs["connect_args"] = {"check_same_thread": False}
+    else:
+        kwargs["pool_pre_ping"] = settings.DB_POOL_PRE_PING
+        kwargs["pool_recycle"] = settings.DB_POOL_RECYCLE_SECONDS
+
+    # In-memory SQLite keeps SQLAlchemy's default single-connection pool
+    if parsed.get_backend_name() != "sqlite" or parsed.database not in (None, "", ":memory:"):
+        kwargs.update(
+            poolclass=TimedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        )
+
+    engine = create_engine(url, **kwargs)
+    apply_sqlite_pragmas(engine, settings.SQLITE_PRAGMAS)
+    instrument_engine(engine)
+    return engine
+
+engine = create_db_engine(settings.DATABASE_URL)
 
 class Base(DeclarativeBase):
     pass
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Objects returned from a unit of work stay readable after it commits
+UnitOfWorkSession = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+@contextmanager
+def unit_of_work() -> Iterator[Session]:
+    """One session and one transaction: commit on success, roll back on error"""
+    db = UnitOfWorkSession()
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 # Dependency
 def get_db():
     db = SessionLocal()
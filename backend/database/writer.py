@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, TypeVar
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from core.config import settings
+from .session import engine
+from .executor import run_db
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+WriteOp = Callable[[Session], T]
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Serializes database writes through one writer thread.
+
+    Operations are callables that receive a Session and return a value. The
+    writer drains up to ``max_batch`` queued operations (waiting at most
+    ``max_delay`` seconds for more to arrive), runs them in one transaction and
+    commits once. If any operation fails the batch is rolled back and replayed
+    one operation per transaction, so only the failing future receives the
+    exception. Operations must therefore be safe to run twice.
+
+    When disabled, operations run inline in their own session and transaction,
+    so callers get the same semantics either way. Sessions use
+    ``expire_on_commit=False`` so returned ORM objects stay readable after
+    they are detached.
+    """
+
+    def __init__(self, session_factory: sessionmaker, enabled: bool, max_batch: int = 64, max_delay: float = 0.002):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._queue: "queue.Queue[object]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.operations = 0
+        self.failures = 0
+        self.max_batch_seen = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def submit(self, op: WriteOp) -> Future:
+        """Queue a write operation and return a future for its result"""
+        future: Future = Future()
+        if not self.enabled:
+            try:
+                future.set_result(self._run_inline(op))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+        self.start()
+        self._queue.put((op, future))
+        return future
+
+    async def run(self, op: WriteOp) -> T:
+        if not self.enabled:
+            return await run_db(self._run_inline, op)
+        return await asyncio.wrap_future(self.submit(op))
+
+    def run_sync(self, op: WriteOp) -> T:
+        return self.submit(op).result()
+
+    def _run_inline(self, op: WriteOp):
+        db = self.session_factory()
+        try:
+            result = op(db)
+            db.commit()
+            return result
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch: list):
+        batch = [(op, future) for op, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = self._run_batch(batch)
+        if outcomes is None:
+            # Something in the batch failed; replay each operation on its own
+            # so one bad write cannot take the others down with it.
+            outcomes = [self._run_single(op, future) for op, future in batch]
+
+        with self._lock:
+            self.batches += 1
+            self.operations += len(outcomes)
+            self.max_batch_seen = max(self.max_batch_seen, len(outcomes))
+            self.failures += sum(1 for _, _, error in outcomes if error is not None)
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _run_batch(self, batch: list) -> list | None:
+        db = self.session_factory()
+        try:
+            outcomes = [(future, op(db), None) for op, future in batch]
+            db.commit()
+            return outcomes
+        except Exception:
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    def _run_single(self, op: WriteOp, future: Future) -> tuple:
+        try:
+            return future, self._run_inline(op), None
+        except Exception as e:
+            return future, None, e
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "operations": self.operations,
+                "failures": self.failures,
+                "avg_batch": round(self.operations / self.batches, 2) if self.batches else 0.0,
+                "max_batch": self.max_batch_seen,
+            }
+
+
+write_queue = WriteQueue(
+    sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine),
+    enabled=settings.DB_WRITE_QUEUE,
+    max_batch=settings.DB_WRITE_QUEUE_MAX_BATCH,
+    max_delay=settings.DB_WRITE_QUEUE_MAX_DELAY_MS / 1000,
+)
@@ -1,28 +1,78 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from jose import JWTError
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from core.cache import TTLCache
 from core.config import settings
+from core.security import Principal, decode_access_token
 from database.session import get_db
 from database.models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    credentials_exception = HTTPException(
+# token subject -> detached User snapshot
+principal_cache = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+def _snapshot_user(user: User) -> User:
+    """Copy the user's column state into a detached instance safe to share between sessions"""
+    snapshot = User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+def invalidate_principal(user_id: int):
+    """Drop cached principals for a user whose row has changed"""
+    principal_cache.invalidate_where(lambda cached: cached.id == user_id)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str | None = payload.get("sub")
-        if email is None:
-            raise credentials_exception
+        payload = decode_access_token(token)
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
 
-    user = db.query(User).filter(User.email == email).first()
+def _load_user(payload: dict, db: Session) -> User:
+    subject: str = payload["sub"]
+    cached = principal_cache.get(subject)
+    if cached is not None:
+        # Attach a per-request copy without hitting the database
+        return db.merge(cached, load=False)
+
+    uid = payload.get("uid")
+    if uid is not None:
+        user = db.get(User, int(uid))
+    else:
+        # Legacy email-only token
+        user = db.query(User).filter(User.email == subject).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    principal_cache.set(subject, _snapshot_user(user))
     return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    return _load_user(_decode_token(token), db)
+
+async def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """Resolve the caller from token claims alone.
+
+    Use this for routes that only need the caller's id or display card. The card
+    reflects the user at login time; routes that need the current row should
+    depend on get_current_user instead.
+    """
+    payload = _decode_token(token)
+    principal = Principal.from_claims(payload)
+    if principal is not None:
+        return principal
+    return Principal.from_user(_load_user(payload, db))
@@ -1,3 +1,4 @@
+from core.startup import startup_timer  # first, so the import phase covers everything below
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,17 +7,23 @@ from dotenv import load_dotenv
 from socketio import ASGIApp
 import logging
 
-from database.session import Base, engine
-from websocket import sio
+from core.config import settings
+from database.session import engine, log_sqlite_profile
+from database.schema import ensure_schema
+from websocket import sio, transport
 from routes import auth as _auth, users as _users, posts as _posts, highlights as _highlights, stories as _stories, friends as _friends, visits as _visits, notifications as _notifications, chat as _chat
-import database.models as _models  # ensure models are registered
-import core.websocket as _websocket  # register websocket handlers
+from dependencies import principal_cache
+from websocket.services import membership_service, typing_service, read_receipt_service, message_pipeline
+from core.hashing import password_hasher
+from database.writer import write_queue
+from database.executor import db_executor
+from database.pool import pool_stats
+from core.loop_monitor import loop_monitor
+from core.middleware import QueryMetricsMiddleware, query_metrics
 
 # Load env from backend/.env
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
 
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="App Backend", version="1.0.0")
 
 cors_origins = os.getenv("CORS_ORIGINS", "*")
@@ -27,6 +34,7 @@ else:
 
 # Setup logging for debugging
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,12 +42,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Query-Count", "X-Prev-Cursor", "X-Next-Cursor"],
 )
+app.add_middleware(QueryMetricsMiddleware)
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MEDIA_DIR = os.path.join(BASE_DIR, "media")
-os.makedirs(MEDIA_DIR, exist_ok=True)
-app.mount("/media", StaticFiles(directory=MEDIA_DIR), name="media")
+# The media directory is created at startup
+app.mount("/media", StaticFiles(directory=str(settings.MEDIA_DIR), check_dir=False), name="media")
 
 app.include_router(_auth.router, prefix="/auth", tags=["auth"])
 app.include_router(_users.router, prefix="/users", tags=["users"])
@@ -59,9 +67,65 @@ def root():
 # Health check endpoint for WebSocket debugging
 @app.get("/health")
 def health():
-    return {"status": "ok", "message": "Backend running", "socketio": "enabled"}
+    return {
+        "status": "ok",
+        "message": "Backend running",
+        "socketio": "enabled",
+        "principal_cache": principal_cache.stats(),
+        "conversation_membership": membership_service.stats(),
+        "typing": typing_service.stats(),
+        "read_receipts": read_receipt_service.stats(),
+        "message_pipeline": message_pipeline.stats(),
+        "password_pool": password_hasher.stats(),
+        "write_queue": write_queue.stats(),
+        "event_loop": loop_monitor.stats(),
+        "sql_metrics": query_metrics.stats(),
+    }
+
+
+if settings.INTERNAL_ENDPOINTS:
+    # Internal: connection pool occupancy and checkout wait times
+    @app.get("/internal/db-pool")
+    def db_pool():
+        return pool_stats(engine)
+
+    # Internal: time spent in each startup phase
+    @app.get("/internal/startup")
+    def startup_report():
+        return startup_timer.report()
+
+
+@app.on_event("startup")
+async def startup():
+    with startup_timer.phase("media"):
+        os.makedirs(settings.MEDIA_DIR, exist_ok=True)
+    with startup_timer.phase("schema"):
+        logger.info("Schema: %s", ensure_schema(engine, settings.DB_SCHEMA_MODE))
+    with startup_timer.phase("database"):
+        log_sqlite_profile(engine)
+    with startup_timer.phase("websocket"):
+        import core.websocket  # registers the socket event handlers
+        await core.websocket.start_background_tasks()
+    loop_monitor.start()
+    startup_timer.finish()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Socket tasks first: flushing read cursors and queued messages still
+    # needs the database workers stopped below
+    import core.websocket
+    await core.websocket.stop_background_tasks()
+    if transport is not None:
+        await transport.close()
+    loop_monitor.stop()
+    password_hasher.shutdown()
+    write_queue.stop()
+    db_executor.shutdown(wait=False)
 
 
 # Wrap FastAPI with Socket.IO
 # The path parameter tells Socket.IO where to mount its endpoints
 socket_app = ASGIApp(sio, app, socketio_path="/socket.io/")
+
+startup_timer.mark("import")
@@ -1,12 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from database.session import get_db
+from database.executor import run_db
+from database.session import get_db, unit_of_work
 from database.models import User
-from core.security import get_password_hash, verify_password, create_access_token
+from core.security import create_user_access_token
+from core.hashing import password_hasher, PasswordPoolBusy
+from dependencies import principal_cache
 from schemas.auth import LoginRequest, SignupRequest, Token, CheckUsernameRequest
 
 router = APIRouter()
 
+def _busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servidor ocupado, tente novamente em instantes",
+        headers={"Retry-After": "1"},
+    )
+
 @router.post("/check-username")
 def check_username(payload: CheckUsernameRequest, db: Session = Depends(get_db)):
     existing = db.query(User).filter(User.username == payload.username).first()
@@ -14,33 +24,57 @@ def check_username(payload: CheckUsernameRequest, db: Session = Depends(get_db))
         raise HTTPException(status_code=400, detail="Username já está em uso")
     return {"available": True}
 
+def _find_conflict(email: str, username: str) -> str | None:
+    with unit_of_work() as db:
+        if db.query(User.id).filter(User.email == email).first():
+            return "Email já cadastrado"
+        if db.query(User.id).filter(User.username == username).first():
+            return "Username já está em uso"
+    return None
+
+def _create_user(payload: SignupRequest, hashed_password: str) -> User:
+    with unit_of_work() as db:
+        user = User(
+            email=payload.email,
+            username=payload.username,
+            first_name=payload.first_name,
+            last_name=payload.last_name,
+            hashed_password=hashed_password,
+        )
+        db.add(user)
+        db.flush()
+        return user
+
+def _get_user_by_email(email: str) -> User | None:
+    with unit_of_work() as db:
+        return db.query(User).filter(User.email == email).first()
+
+# Async so bcrypt is awaited on the process pool; the queries run on the DB
+# executor (run_db) rather than on the event loop
 @router.post("/signup", response_model=Token)
-def signup(payload: SignupRequest, db: Session = Depends(get_db)):
-    existing_email = db.query(User).filter(User.email == payload.email).first()
-    if existing_email:
-        raise HTTPException(status_code=400, detail="Email já cadastrado")
+async def signup(payload: SignupRequest):
+    conflict = await run_db(_find_conflict, payload.email, payload.username)
+    if conflict:
+        raise HTTPException(status_code=400, detail=conflict)
 
-    existing_username = db.query(User).filter(User.username == payload.username).first()
-    if existing_username:
-        raise HTTPException(status_code=400, detail="Username já está em uso")
+    try:
+        hashed_password = await password_hasher.hash(payload.password)
+    except PasswordPoolBusy:
+        raise _busy_exception()
 
-    user = User(
-        email=payload.email,
-        username=payload.username,
-        first_name=payload.first_name,
-        last_name=payload.last_name,
-        hashed_password=get_password_hash(payload.password),
-    )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    token = create_access_token(user.email)
+    user = await run_db(_create_user, payload, hashed_password)
+    principal_cache.invalidate(user.email)
+    token = create_user_access_token(user)
     return Token(access_token=token)
 
 @router.post("/login", response_model=Token)
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == payload.email).first()
-    if not user or not verify_password(payload.password, user.hashed_password):
+async def login(payload: LoginRequest):
+    user = await run_db(_get_user_by_email, payload.email)
+    try:
+        valid = user is not None and await password_hasher.verify(payload.password, user.hashed_password)
+    except PasswordPoolBusy:
+        raise _busy_exception()
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais inválidas")
-    token = create_access_token(user.email)
+    token = create_user_access_token(user)
     return Token(access_token=token)
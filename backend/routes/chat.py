@@ -1,61 +1,74 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from database.session import get_db
-from database.models import User, Conversation, Message
+from database.models import ChatChange, Conversation, Message, User
+from database.models.chat_change import CHANGE_READ
 from schemas.conversation import (
     ConversationCreate, ConversationUpdate, ConversationWithLatestMessage,
     ConversationDetail, ConversationSearch
 )
 from schemas.message import MessageBase, MessageCreate, MessageUpdate
-from websocket.services import ChatService
-from dependencies import get_current_user
+from websocket.services import ChatService, AsyncChatService, membership_service, recent_client_messages
+from dependencies import get_current_principal
+from core.config import settings
+from core.security import Principal
+from core.websocket import join_conversation_room, close_conversation_room
+import base64
+import binascii
 import os
 import uuid
 from datetime import datetime
 
 router = APIRouter()
 
-chat_service = ChatService()
+chat_service = AsyncChatService()
 
 
-def format_conversation(conv: Conversation, current_user_id: int):
-    """Format conversation object for API response"""
-    unread_count = chat_service.get_unread_count(
-        conversation_id=conv.id,
-        user_id=current_user_id
-    )
+def _user_card(user: User) -> dict:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "profile_photo": user.profile_photo,
+    }
+
+
+def _message_dict(msg: Message, sender: dict | None, read_by_ids: list[int]) -> dict:
+    return {
+        "id": msg.id,
+        "conversation_id": msg.conversation_id,
+        "content": msg.content,
+        "content_type": msg.content_type,
+        "media_url": msg.media_url,
+        "client_message_id": msg.client_message_id,
+        "is_deleted": msg.is_deleted,
+        "edited_at": msg.edited_at.isoformat() if msg.edited_at else None,
+        "created_at": msg.created_at.isoformat(),
+        "read_by": read_by_ids,
+        "sender": sender,
+    }
+
+
+def _conversation_dict(conv: Conversation, read_by_ids: list[int], unread_count: int) -> dict:
     latest_message = None
-    if conv.messages:
-        latest_msg = conv.messages[-1]
-        read_by_ids = [u.id for u in latest_msg.read_by]
+    if conv.last_message_id is not None:
+        # Built from the denormalized columns; content is a preview and the
+        # pointer only ever references a live message
+        sender = conv.last_sender
         latest_message = {
-            "id": latest_msg.id,
-            "content": latest_msg.content,
-            "content_type": latest_msg.content_type,
-            "media_url": latest_msg.media_url,
-            "is_deleted": latest_msg.is_deleted,
-            "edited_at": latest_msg.edited_at.isoformat() if latest_msg.edited_at else None,
-            "created_at": latest_msg.created_at.isoformat(),
+            "id": conv.last_message_id,
+            "content": conv.last_message_preview,
+            "content_type": conv.last_message_type,
+            "media_url": None,
+            "is_deleted": False,
+            "edited_at": None,
+            "created_at": conv.last_message_at.isoformat(),
             "read_by": read_by_ids,
-            "sender": {
-                "id": latest_msg.sender.id,
-                "username": latest_msg.sender.username,
-                "first_name": latest_msg.sender.first_name,
-                "last_name": latest_msg.sender.last_name,
-                "profile_photo": latest_msg.sender.profile_photo,
-            }
+            "sender": _user_card(sender) if sender else None
         }
 
-    participants = [
-        {
-            "id": p.id,
-            "username": p.username,
-            "first_name": p.first_name,
-            "last_name": p.last_name,
-            "profile_photo": p.profile_photo,
-        }
-        for p in conv.participants
-    ]
+    participants = [_user_card(p) for p in conv.participants]
 
     return {
         "id": conv.id,
@@ -71,71 +84,237 @@ def format_conversation(conv: Conversation, current_user_id: int):
     }
 
 
+def format_conversations(conversations: list[Conversation], current_user_id: int, db: Session) -> list[dict]:
+    """Format conversations for API response with a fixed number of queries"""
+    conversation_ids = [conv.id for conv in conversations]
+    read_by = ChatService.get_read_by(
+        [conv.last_message_id for conv in conversations if conv.last_message_id is not None],
+        db=db
+    )
+    unread = ChatService.get_unread_counts(conversation_ids, current_user_id, db=db)
+    return [
+        _conversation_dict(conv, read_by.get(conv.last_message_id, []), unread.get(conv.id, 0))
+        for conv in conversations
+    ]
+
+
+def format_conversation(conv: Conversation, current_user_id: int, db: Session):
+    """Format conversation object for API response"""
+    return format_conversations([conv], current_user_id, db)[0]
+
+
+def format_messages(
+    messages: list[Message], db: Session, read_by: dict[int, list[int]] | None = None
+) -> list[dict]:
+    """Format a page of messages for API response with a fixed number of queries
+
+    Senders and read state are loaded for the whole page up front, so nothing
+    is lazy-loaded per message; pass ``read_by`` when it is already known.
+    """
+    if not messages:
+        return []
+    if read_by is None:
+        read_by = ChatService.get_read_by([msg.id for msg in messages], db=db)
+    senders = {
+        user.id: _user_card(user)
+        for user in ChatService.get_users({msg.sender_id for msg in messages}, db=db)
+    }
+    return [_message_dict(msg, senders.get(msg.sender_id), read_by[msg.id]) for msg in messages]
+
+
+def format_message(message: Message, db: Session, read_by_ids: list[int] | None = None) -> dict:
+    """Format message object for API response"""
+    read_by = None if read_by_ids is None else {message.id: read_by_ids}
+    return format_messages([message], db, read_by)[0]
+
+
+def format_changes(changes: list[ChatChange], db: Session) -> dict:
+    """Collapse change log entries into what a client has to apply
+
+    Each touched message is sent once, in its current state; each reader
+    once, with their furthest read.
+    """
+    reads: dict[tuple[int, int], ChatChange] = {}
+    message_ids = set()
+    for change in changes:
+        if change.message_id is None:
+            continue  # read changes logged for empty conversations before they were skipped
+        if change.kind == CHANGE_READ:
+            key = (change.conversation_id, change.user_id)
+            if key not in reads or change.message_id > reads[key].message_id:
+                reads[key] = change
+        else:
+            message_ids.add(change.message_id)
+
+    messages = db.query(Message).filter(Message.id.in_(message_ids)).order_by(Message.id).all() if message_ids else []
+    return {
+        "messages": format_messages([msg for msg in messages if not msg.is_deleted], db),
+        "deleted": [{"id": msg.id, "conversation_id": msg.conversation_id} for msg in messages if msg.is_deleted],
+        "reads": [
+            {
+                "conversation_id": change.conversation_id,
+                "user_id": change.user_id,
+                "message_id": change.message_id,
+                "read_at": change.created_at.isoformat(),
+            }
+            for change in reads.values()
+        ],
+    }
+
+
+def encode_message_cursor(message: Message) -> str:
+    """Opaque keyset cursor for a message's (created_at, id) position"""
+    raw = f"{message.created_at.isoformat()}|{message.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_message_cursor(value: str | None) -> tuple[datetime, int] | int | None:
+    """Accept a cursor from encode_message_cursor, or a bare message id"""
+    if value is None:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        created_at, message_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _require_participant(conversation_id: int, user_id: int, db: Session):
+    """Raise 404/403 unless the user takes part in the conversation"""
+    # Answered from the membership index; db is only used on a cache miss
+    participant_ids = membership_service.get_member_ids(conversation_id, db=db)
+    if not participant_ids:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    if user_id not in participant_ids:
+        raise HTTPException(status_code=403, detail="Not a participant of this conversation")
+
+
+def _own_message(message_id: int, user_id: int, db: Session, action: str) -> Message:
+    """Load a message sent by the user, or raise 404/403"""
+    message = ChatService.get_message(message_id, db=db)
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+    # Check if user is the sender
+    if message.sender_id != user_id:
+        raise HTTPException(status_code=403, detail=f"Can only {action} your own messages")
+    return message
+
+
 @router.get("/conversations")
 async def get_conversations(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     limit: int = 50,
     offset: int = 0,
 ):
     """Get all conversations for the current user"""
-    conversations = chat_service.get_user_conversations(
-        user_id=current_user.id,
-        limit=limit,
-        offset=offset
-    )
+    def _load(db: Session):
+        conversations = ChatService.get_user_conversations(
+            user_id=current_user.id,
+            limit=limit,
+            offset=offset,
+            db=db
+        )
+        return format_conversations(conversations, current_user.id, db)
+
+    return await chat_service.transaction(_load)
+
+
+@router.get("/sync")
+async def sync(
+    current_user: Principal = Depends(get_current_principal),
+    since: int | None = Query(None, ge=0, description="Cursor from the previous sync"),
+    limit: int = Query(settings.CHAT_SYNC_MAX_CHANGES, ge=1, le=settings.CHAT_SYNC_MAX_CHANGES),
+):
+    """Everything that changed in the user's conversations since a cursor
+
+    Replays the change log in one response: messages sent or edited (in
+    their current state), deleted message ids and read cursor moves. Keep
+    the returned cursor for the next call and repeat while has_more is set.
+    Without since, only the current cursor is returned; take it before
+    loading conversations and messages, then sync from it.
+
+    The cursor relies on change ids committing in order, which only holds
+    on SQLite (see ChatChange).
+    """
+    def _load(db: Session):
+        latest = ChatService.get_latest_change_id(db=db)
+        if since is None:
+            return {"cursor": latest, "has_more": False, "messages": [], "deleted": [], "reads": []}
+
+        changes = ChatService.get_changes(current_user.id, since, latest, limit + 1, db=db)
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return {
+            "cursor": changes[-1].id if has_more else max(latest, since),
+            "has_more": has_more,
+            **format_changes(changes, db),
+        }
 
-    return [format_conversation(conv, current_user.id) for conv in conversations]
+    return await chat_service.transaction(_load)
 
 
 @router.get("/conversations/search")
 async def search_conversations(
     q: str = Query(..., min_length=1),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     limit: int = 20,
 ):
     """Search conversations by name"""
-    conversations = chat_service.search_conversations(
-        user_id=current_user.id,
-        query=q,
-        limit=limit
-    )
+    def _load(db: Session):
+        conversations = ChatService.search_conversations(
+            user_id=current_user.id,
+            query=q,
+            limit=limit,
+            db=db
+        )
+        return format_conversations(conversations, current_user.id, db)
 
-    return [format_conversation(conv, current_user.id) for conv in conversations]
+    return await chat_service.transaction(_load)
 
 
 @router.post("/conversations")
 async def create_conversation(
     data: ConversationCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """Create a new conversation or group"""
-    try:
+    def _create(db: Session):
         # Ensure current user is included in participants
         user_ids = data.participant_ids
         if current_user.id not in user_ids:
             user_ids.insert(0, current_user.id)
 
-        conversation = chat_service.create_conversation(
+        conversation = ChatService.create_conversation(
             user_ids=user_ids,
             name=data.name,
             description=data.description,
-            created_by_id=current_user.id
+            created_by_id=current_user.id,
+            db=db
         )
+        return format_conversation(conversation, current_user.id, db)
 
-        return format_conversation(conversation, current_user.id)
+    try:
+        conversation = await chat_service.transaction(_create)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    await join_conversation_room(conversation["id"], [p["id"] for p in conversation["participants"]])
+    return conversation
 
 
 @router.put("/conversations/{conversation_id}")
 async def update_conversation(
     conversation_id: int,
     data: ConversationUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """Update conversation details"""
-    try:
-        conversation = chat_service.get_conversation(conversation_id)
+    def _update(db: Session):
+        conversation = ChatService.get_conversation(conversation_id, db=db)
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
 
@@ -143,14 +322,17 @@ async def update_conversation(
         if conversation.created_by_id != current_user.id:
             raise HTTPException(status_code=403, detail="Only creator can update conversation")
 
-        updated = chat_service.update_conversation(
+        updated = ChatService.update_conversation(
             conversation_id=conversation_id,
             name=data.name,
             description=data.description,
-            avatar_url=data.avatar_url
+            avatar_url=data.avatar_url,
+            db=db
         )
+        return format_conversation(updated, current_user.id, db)
 
-        return format_conversation(updated, current_user.id)
+    try:
+        return await chat_service.transaction(_update)
     except HTTPException:
         raise
     except Exception as e:
@@ -160,21 +342,16 @@ async def update_conversation(
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(
     conversation_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """Delete (soft delete) a conversation"""
-    try:
-        conversation = chat_service.get_conversation(conversation_id)
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-
-        # Check if user is a participant
-        participant_ids = [p.id for p in conversation.participants]
-        if current_user.id not in participant_ids:
-            raise HTTPException(status_code=403, detail="Not a participant of this conversation")
-
-        chat_service.delete_conversation(conversation_id)
+    def _delete(db: Session):
+        _require_participant(conversation_id, current_user.id, db)
+        ChatService.delete_conversation(conversation_id, db=db)
 
+    try:
+        await chat_service.transaction(_delete)
+        await close_conversation_room(conversation_id)
         return {"message": "Conversation deleted"}
     except HTTPException:
         raise
@@ -185,135 +362,86 @@ async def delete_conversation(
 @router.get("/conversations/{conversation_id}/messages")
 async def get_messages(
     conversation_id: int,
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
     limit: int = 50,
     offset: int = 0,
+    before_id: str | None = Query(None, description="Cursor or message id; returns older messages"),
+    after_id: str | None = Query(None, description="Cursor or message id; returns newer messages"),
 ):
-    """Get messages from a conversation"""
-    conversation = chat_service.get_conversation(conversation_id)
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+    """Get messages from a conversation
 
-    # Check if user is a participant
-    participant_ids = [p.id for p in conversation.participants]
-    if current_user.id not in participant_ids:
-        raise HTTPException(status_code=403, detail="Not a participant of this conversation")
+    Page with before_id/after_id using the X-Prev-Cursor (older) and
+    X-Next-Cursor (newer) response headers. offset is deprecated.
+    """
+    before = decode_message_cursor(before_id)
+    after = decode_message_cursor(after_id)
 
-    # Mark messages as read
-    chat_service.mark_conversation_messages_as_read(conversation_id, current_user.id)
-
-    messages = chat_service.get_messages(conversation_id, limit, offset)
-
-    result = []
-    for msg in messages:
-        read_by_ids = [u.id for u in msg.read_by]
-        result.append({
-            "id": msg.id,
-            "conversation_id": msg.conversation_id,
-            "content": msg.content,
-            "content_type": msg.content_type,
-            "media_url": msg.media_url,
-            "is_deleted": msg.is_deleted,
-            "edited_at": msg.edited_at.isoformat() if msg.edited_at else None,
-            "created_at": msg.created_at.isoformat(),
-            "read_by": read_by_ids,
-            "sender": {
-                "id": msg.sender.id,
-                "username": msg.sender.username,
-                "first_name": msg.sender.first_name,
-                "last_name": msg.sender.last_name,
-                "profile_photo": msg.sender.profile_photo,
-            }
-        })
+    def _load(db: Session):
+        _require_participant(conversation_id, current_user.id, db)
+
+        # Mark messages as read
+        ChatService.mark_conversation_messages_as_read(conversation_id, current_user.id, db=db)
+
+        messages = ChatService.get_messages(conversation_id, limit, offset, db=db, before=before, after=after)
+        if messages:
+            response.headers["X-Prev-Cursor"] = encode_message_cursor(messages[0])
+            response.headers["X-Next-Cursor"] = encode_message_cursor(messages[-1])
 
-    return result
+        return format_messages(messages, db)
+
+    return await chat_service.transaction(_load)
 
 
 @router.get("/conversations/{conversation_id}/messages/search")
 async def search_messages(
     conversation_id: int,
     q: str = Query(..., min_length=1),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     limit: int = 20,
 ):
     """Search messages in a conversation"""
-    conversation = chat_service.get_conversation(conversation_id)
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+    def _load(db: Session):
+        _require_participant(conversation_id, current_user.id, db)
 
-    # Check if user is a participant
-    participant_ids = [p.id for p in conversation.participants]
-    if current_user.id not in participant_ids:
-        raise HTTPException(status_code=403, detail="Not a participant of this conversation")
+        messages = ChatService.search_messages(conversation_id, q, limit, db=db)
 
-    messages = chat_service.search_messages(conversation_id, q, limit)
-
-    result = []
-    for msg in messages:
-        read_by_ids = [u.id for u in msg.read_by]
-        result.append({
-            "id": msg.id,
-            "conversation_id": msg.conversation_id,
-            "content": msg.content,
-            "content_type": msg.content_type,
-            "media_url": msg.media_url,
-            "is_deleted": msg.is_deleted,
-            "edited_at": msg.edited_at.isoformat() if msg.edited_at else None,
-            "created_at": msg.created_at.isoformat(),
-            "read_by": read_by_ids,
-            "sender": {
-                "id": msg.sender.id,
-                "username": msg.sender.username,
-                "first_name": msg.sender.first_name,
-                "last_name": msg.sender.last_name,
-                "profile_photo": msg.sender.profile_photo,
-            }
-        })
+        return format_messages(messages, db)
+
+    return await chat_service.transaction(_load)
+
+
+@router.get("/messages/search")
+async def search_all_messages(
+    q: str = Query(..., min_length=1),
+    current_user: Principal = Depends(get_current_principal),
+    limit: int = 20,
+):
+    """Search messages across all of the user's conversations"""
+    def _load(db: Session):
+        messages = ChatService.search_user_messages(current_user.id, q, limit, db=db)
 
-    return result
+        return format_messages(messages, db)
+
+    return await chat_service.transaction(_load)
 
 
 @router.put("/messages/{message_id}")
 async def update_message(
     message_id: int,
     data: MessageUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """Edit a message"""
-    try:
-        from database.session import SessionLocal
-        db = SessionLocal()
-        message = db.query(Message).filter(Message.id == message_id).first()
-        db.close()
+    def _edit(db: Session):
+        _own_message(message_id, current_user.id, db, "edit")
 
-        if not message:
-            raise HTTPException(status_code=404, detail="Message not found")
+        updated = ChatService.edit_message(message_id, data.content, db=db)
 
-        # Check if user is the sender
-        if message.sender_id != current_user.id:
-            raise HTTPException(status_code=403, detail="Can only edit your own messages")
+        return format_message(updated, db)
 
-        updated = chat_service.edit_message(message_id, data.content)
-
-        read_by_ids = [u.id for u in updated.read_by]
-        return {
-            "id": updated.id,
-            "conversation_id": updated.conversation_id,
-            "content": updated.content,
-            "content_type": updated.content_type,
-            "media_url": updated.media_url,
-            "is_deleted": updated.is_deleted,
-            "edited_at": updated.edited_at.isoformat() if updated.edited_at else None,
-            "created_at": updated.created_at.isoformat(),
-            "read_by": read_by_ids,
-            "sender": {
-                "id": updated.sender.id,
-                "username": updated.sender.username,
-                "first_name": updated.sender.first_name,
-                "last_name": updated.sender.last_name,
-                "profile_photo": updated.sender.profile_photo,
-            }
-        }
+    try:
+        return await chat_service.transaction(_edit)
     except HTTPException:
         raise
     except Exception as e:
@@ -323,24 +451,15 @@ async def update_message(
 @router.delete("/messages/{message_id}")
 async def delete_message(
     message_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """Delete a message"""
-    try:
-        from database.session import SessionLocal
-        db = SessionLocal()
-        message = db.query(Message).filter(Message.id == message_id).first()
-        db.close()
-
-        if not message:
-            raise HTTPException(status_code=404, detail="Message not found")
-
-        # Check if user is the sender
-        if message.sender_id != current_user.id:
-            raise HTTPException(status_code=403, detail="Can only delete your own messages")
-
-        chat_service.delete_message(message_id)
+    def _delete(db: Session):
+        _own_message(message_id, current_user.id, db, "delete")
+        ChatService.delete_message(message_id, db=db)
 
+    try:
+        await chat_service.transaction(_delete)
         return {"message": "Message deleted"}
     except HTTPException:
         raise
@@ -351,26 +470,21 @@ async def delete_message(
 @router.post("/messages/{message_id}/read")
 async def mark_message_read(
     message_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """Mark a message as read"""
-    try:
-        from database.session import SessionLocal
-        db = SessionLocal()
-        message = db.query(Message).filter(Message.id == message_id).first()
-        db.close()
-
+    def _mark(db: Session):
+        message = ChatService.get_message(message_id, db=db)
         if not message:
             raise HTTPException(status_code=404, detail="Message not found")
 
         # Check if user is a participant of the conversation
-        conversation = chat_service.get_conversation(message.conversation_id)
-        participant_ids = [p.id for p in conversation.participants]
-        if current_user.id not in participant_ids:
-            raise HTTPException(status_code=403, detail="Not a participant of this conversation")
+        _require_participant(message.conversation_id, current_user.id, db)
 
-        chat_service.mark_message_as_read(message_id, current_user.id)
+        ChatService.mark_message_as_read(message_id, current_user.id, db=db)
 
+    try:
+        await chat_service.transaction(_mark)
         return {"message": "Message marked as read"}
     except HTTPException:
         raise
@@ -381,25 +495,17 @@ async def mark_message_read(
 @router.get("/conversations/{user_id}/dm")
 async def get_or_create_dm(
     user_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """Get or create a direct message conversation with a specific user"""
-    try:
-        conversation = chat_service.get_or_create_dm_conversation(
+    def _load(db: Session):
+        conversation = ChatService.get_or_create_dm_conversation(
             user_id_1=current_user.id,
-            user_id_2=user_id
+            user_id_2=user_id,
+            db=db
         )
 
-        participants = [
-            {
-                "id": p.id,
-                "username": p.username,
-                "first_name": p.first_name,
-                "last_name": p.last_name,
-                "profile_photo": p.profile_photo,
-            }
-            for p in conversation.participants
-        ]
+        participants = [_user_card(p) for p in conversation.participants]
 
         return {
             "id": conversation.id,
@@ -409,14 +515,20 @@ async def get_or_create_dm(
             "created_at": conversation.created_at.isoformat(),
             "updated_at": conversation.updated_at.isoformat(),
         }
+
+    try:
+        conversation = await chat_service.transaction(_load)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    # Joining is idempotent, so an existing DM needs no special case
+    await join_conversation_room(conversation["id"], [p["id"] for p in conversation["participants"]])
+    return conversation
 
 
 @router.post("/upload")
 async def upload_chat_file(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """Upload a file for chat"""
     try:
@@ -444,23 +556,19 @@ async def upload_chat_file(
 async def react_to_message(
     message_id: int,
     emoji: str = Query(..., min_length=1, max_length=10),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """Add a reaction to a message"""
-    try:
-        from database.session import SessionLocal
-        db = SessionLocal()
-        message = db.query(Message).filter(Message.id == message_id).first()
-        db.close()
-
+    def _check(db: Session):
+        message = ChatService.get_message(message_id, db=db)
         if not message:
             raise HTTPException(status_code=404, detail="Message not found")
 
         # Check if user is a participant of the conversation
-        conversation = chat_service.get_conversation(message.conversation_id)
-        participant_ids = [p.id for p in conversation.participants]
-        if current_user.id not in participant_ids:
-            raise HTTPException(status_code=403, detail="Not a participant of this conversation")
+        _require_participant(message.conversation_id, current_user.id, db)
+
+    try:
+        await chat_service.transaction(_check)
 
         return {
             "message_id": message_id,
@@ -477,47 +585,47 @@ async def react_to_message(
 @router.post("/messages")
 async def create_message(
     data: MessageCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
-    """Create a new message via REST (used as fallback if WebSocket fails)"""
-    try:
-        conversation = chat_service.get_conversation(data.conversation_id)
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
+    """Create a new message via REST (used as fallback if WebSocket fails)
 
-        # Check if user is a participant
-        participant_ids = [p.id for p in conversation.participants]
-        if current_user.id not in participant_ids:
-            raise HTTPException(status_code=403, detail="Not a participant of this conversation")
-
-        message = chat_service.create_message(
-            conversation_id=data.conversation_id,
-            sender_id=current_user.id,
-            content=data.content,
-            content_type=data.content_type or "text",
-            media_url=data.media_url,
-        )
+    A retry with a client_message_id the user already sent (over the socket
+    or here) returns the original message instead of storing a second one.
+    """
+    key = (current_user.id, data.client_message_id)
 
-        read_by_ids = [u.id for u in message.read_by]
-        return {
-            "id": message.id,
-            "conversation_id": message.conversation_id,
-            "content": message.content,
-            "content_type": message.content_type,
-            "media_url": message.media_url,
-            "is_deleted": message.is_deleted,
-            "edited_at": message.edited_at.isoformat() if message.edited_at else None,
-            "created_at": message.created_at.isoformat(),
-            "read_by": read_by_ids,
-            "sender": {
-                "id": message.sender.id,
-                "username": message.sender.username,
-                "first_name": message.sender.first_name,
-                "last_name": message.sender.last_name,
-                "profile_photo": message.sender.profile_photo,
-            }
-        }
+    def _create(db: Session):
+        if data.client_message_id:
+            message = recent_client_messages.get(key)
+            if message is not None:
+                return message, format_message(message, db)
+
+        _require_participant(data.conversation_id, current_user.id, db)
+
+        message, created = ChatService.create_messages([{
+            "conversation_id": data.conversation_id,
+            "sender_id": current_user.id,
+            "content": data.content,
+            "content_type": data.content_type or "text",
+            "media_url": data.media_url,
+            "client_message_id": data.client_message_id,
+        }], db)[0]
+
+        # Nobody has read a message that was just sent
+        return message, format_message(message, db, read_by_ids=[] if created else None)
+
+    try:
+        try:
+            message, payload = await chat_service.transaction(_create)
+        except IntegrityError:
+            if not data.client_message_id:
+                raise
+            # Another worker stored the same send first; answer with its row
+            message, payload = await chat_service.transaction(_create)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if data.client_message_id:
+        recent_client_messages.set(key, message)
+    return payload
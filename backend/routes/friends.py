@@ -4,13 +4,24 @@ from typing import List
 from datetime import datetime
 
 from database.session import get_db
-from dependencies import get_current_user
+from database.writer import write_queue
+from dependencies import get_current_user, get_current_principal
+from core.security import Principal
 from database.models import User, FriendRequest, Friendship, UserProfile
 from schemas.friend import FriendRequestCreate, FriendRequestOut, FriendStatusOut, IncomingFriendRequestOut
 from core.websocket import emit_friend_request_notification, emit_friend_request_accepted
 
 router = APIRouter()
 
+def _set_request_status(request_id: int, new_status: str) -> FriendRequest:
+    def _write(db: Session) -> FriendRequest:
+        req = db.get(FriendRequest, request_id)
+        req.status = new_status
+        req.updated_at = datetime.utcnow()
+        return req
+
+    return write_queue.run_sync(_write)
+
 @router.post("/requests", response_model=FriendRequestOut)
 async def send_request(payload: FriendRequestCreate, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
     if payload.user_id == current.id:
@@ -34,10 +45,13 @@ async def send_request(payload: FriendRequestCreate, current: User = Depends(get
     if pending:
         raise HTTPException(status_code=400, detail="Já existe um convite pendente")
 
-    fr = FriendRequest(sender_id=current.id, receiver_id=target.id, status="pending", created_at=datetime.utcnow(), updated_at=datetime.utcnow())
-    db.add(fr)
-    db.commit()
-    db.refresh(fr)
+    def _write(db: Session) -> FriendRequest:
+        fr = FriendRequest(sender_id=current.id, receiver_id=target.id, status="pending", created_at=datetime.utcnow(), updated_at=datetime.utcnow())
+        db.add(fr)
+        db.flush()
+        return fr
+
+    fr = await write_queue.run(_write)
 
     try:
         await emit_friend_request_notification(
@@ -53,7 +67,7 @@ async def send_request(payload: FriendRequestCreate, current: User = Depends(get
     return fr
 
 @router.get("/requests/incoming", response_model=List[IncomingFriendRequestOut])
-def get_incoming_requests(current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_incoming_requests(current: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     requests = db.query(FriendRequest).filter(
         FriendRequest.receiver_id == current.id,
         FriendRequest.status == "pending",
@@ -73,7 +87,7 @@ def get_incoming_requests(current: User = Depends(get_current_user), db: Session
     return result
 
 @router.get("/status/{user_id}", response_model=FriendStatusOut)
-def get_status(user_id: int, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_status(user_id: int, current: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     if user_id == current.id:
         return FriendStatusOut(status="friends", request_id=None)
 
@@ -110,30 +124,37 @@ async def accept_request(request_id: int, current: User = Depends(get_current_us
     if req.receiver_id != current.id:
         raise HTTPException(status_code=403, detail="Sem permissão para aceitar este convite")
 
-    # create friendships both directions
-    exists = db.query(Friendship).filter(Friendship.user_id == req.sender_id, Friendship.friend_id == req.receiver_id).first()
-    if not exists:
-        db.add(Friendship(user_id=req.sender_id, friend_id=req.receiver_id))
-    exists_rev = db.query(Friendship).filter(Friendship.user_id == req.receiver_id, Friendship.friend_id == req.sender_id).first()
-    if not exists_rev:
-        db.add(Friendship(user_id=req.receiver_id, friend_id=req.sender_id))
-
-    # update request
-    req.status = "accepted"
-    req.updated_at = datetime.utcnow()
-
-    # update profiles connection counts
-    for uid in [req.sender_id, req.receiver_id]:
-        prof = db.query(UserProfile).filter(UserProfile.user_id == uid).first()
-        if not prof:
-            prof = UserProfile(user_id=uid, connections_count=1)
-            db.add(prof)
-        else:
-            prof.connections_count = (prof.connections_count or 0) + 1
-            db.add(prof)
-
-    db.commit()
-    db.refresh(req)
+    def _accept(db: Session) -> FriendRequest | None:
+        req = db.get(FriendRequest, request_id)
+        if req.status != "pending":
+            return None
+
+        # create friendships both directions
+        exists = db.query(Friendship).filter(Friendship.user_id == req.sender_id, Friendship.friend_id == req.receiver_id).first()
+        if not exists:
+            db.add(Friendship(user_id=req.sender_id, friend_id=req.receiver_id))
+        exists_rev = db.query(Friendship).filter(Friendship.user_id == req.receiver_id, Friendship.friend_id == req.sender_id).first()
+        if not exists_rev:
+            db.add(Friendship(user_id=req.receiver_id, friend_id=req.sender_id))
+
+        # update request
+        req.status = "accepted"
+        req.updated_at = datetime.utcnow()
+
+        # update profiles connection counts
+        for uid in [req.sender_id, req.receiver_id]:
+            prof = db.query(UserProfile).filter(UserProfile.user_id == uid).first()
+            if not prof:
+                prof = UserProfile(user_id=uid, connections_count=1)
+                db.add(prof)
+            else:
+                prof.connections_count = (prof.connections_count or 0) + 1
+                db.add(prof)
+        return req
+
+    req = await write_queue.run(_accept)
+    if req is None:
+        raise HTTPException(status_code=404, detail="Convite não encontrado")
 
     # Get sender info for notification
     sender = db.query(User).filter(User.id == req.sender_id).first()
@@ -154,28 +175,20 @@ async def accept_request(request_id: int, current: User = Depends(get_current_us
     return req
 
 @router.post("/requests/{request_id}/decline", response_model=FriendRequestOut)
-def decline_request(request_id: int, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def decline_request(request_id: int, current: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     req = db.query(FriendRequest).filter(FriendRequest.id == request_id).first()
     if not req or req.status != "pending":
         raise HTTPException(status_code=404, detail="Convite não encontrado")
     if req.receiver_id != current.id:
         raise HTTPException(status_code=403, detail="Sem permissão para recusar este convite")
-    req.status = "declined"
-    req.updated_at = datetime.utcnow()
-    db.add(req)
-    db.commit()
-    db.refresh(req)
-    return req
+    return _set_request_status(request_id, "declined")
 
 @router.delete("/requests/{request_id}")
-def cancel_request(request_id: int, current: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def cancel_request(request_id: int, current: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     req = db.query(FriendRequest).filter(FriendRequest.id == request_id).first()
     if not req or req.status != "pending":
         raise HTTPException(status_code=404, detail="Convite não encontrado")
     if req.sender_id != current.id:
         raise HTTPException(status_code=403, detail="Sem permissão para cancelar este convite")
-    req.status = "canceled"
-    req.updated_at = datetime.utcnow()
-    db.add(req)
-    db.commit()
+    _set_request_status(request_id, "canceled")
     return {"success": True}
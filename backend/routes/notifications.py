@@ -4,15 +4,16 @@ from typing import List
 from datetime import datetime, timedelta
 
 from database.session import get_db
-from dependencies import get_current_user
-from database.models import User, Notification
+from dependencies import get_current_principal
+from core.security import Principal
+from database.models import Notification
 from schemas.notification import NotificationOut, NotificationResponse
 
 router = APIRouter()
 
 @router.get("/", response_model=List[NotificationResponse])
 def get_notifications(
-    current: User = Depends(get_current_user),
+    current: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
     limit: int = 50,
     unread_only: bool = False
@@ -27,7 +28,7 @@ def get_notifications(
 
 @router.get("/unread-count", response_model=dict)
 def get_unread_count(
-    current: User = Depends(get_current_user),
+    current: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     count = db.query(Notification).filter(
@@ -39,7 +40,7 @@ def get_unread_count(
 @router.post("/{notification_id}/read")
 def mark_as_read(
     notification_id: int,
-    current: User = Depends(get_current_user),
+    current: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     notification = db.query(Notification).filter(
@@ -56,7 +57,7 @@ def mark_as_read(
 
 @router.post("/read-all")
 def mark_all_as_read(
-    current: User = Depends(get_current_user),
+    current: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     db.query(Notification).filter(
@@ -69,7 +70,7 @@ def mark_all_as_read(
 @router.delete("/{notification_id}")
 def delete_notification(
     notification_id: int,
-    current: User = Depends(get_current_user),
+    current: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     notification = db.query(Notification).filter(
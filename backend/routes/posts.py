@@ -5,13 +5,13 @@ from sqlalchemy.orm import Session
 from database.session import get_db
 from database.models import Post
 from schemas.post import PostCreate, PostOut
+from core.config import settings
 from dependencies import get_current_user
 
 router = APIRouter()
 
-MEDIA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "media")
-MEDIA_DIR = os.path.abspath(MEDIA_DIR)
-os.makedirs(MEDIA_DIR, exist_ok=True)
+# Created at startup (see main.py)
+MEDIA_DIR = str(settings.MEDIA_DIR)
 
 @router.get("/", response_model=List[PostOut])
 def list_posts(db: Session = Depends(get_db)):
@@ -4,7 +4,8 @@ from database.session import get_db
 from schemas.user import UserBase
 from schemas.post import PostOut
 from schemas.profile import ProfileOut, ProfileUpdate
-from dependencies import get_current_user
+from core.config import settings
+from dependencies import get_current_user, invalidate_principal
 from database.models import User, Post, UserProfile, UserPosition, UserEducation
 import os
 import uuid
@@ -13,8 +14,8 @@ from typing import List
 
 router = APIRouter()
 
-MEDIA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "media")
-os.makedirs(MEDIA_DIR, exist_ok=True)
+# Created at startup (see main.py)
+MEDIA_DIR = str(settings.MEDIA_DIR)
 
 @router.get("/me", response_model=UserBase)
 async def me(current: User = Depends(get_current_user)):
@@ -99,6 +100,7 @@ async def update_profile_photo(
         db.add(current)
         db.commit()
         db.refresh(current)
+        invalidate_principal(current.id)
 
         return {
             "success": True,
@@ -132,6 +134,7 @@ async def update_cover_photo(
         db.add(current)
         db.commit()
         db.refresh(current)
+        invalidate_principal(current.id)
 
         return {
             "success": True,
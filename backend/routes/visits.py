@@ -5,7 +5,9 @@ from datetime import datetime, timedelta
 import asyncio
 
 from database.session import get_db
-from dependencies import get_current_user
+from database.writer import write_queue
+from dependencies import get_current_user, get_current_principal
+from core.security import Principal
 from database.models import User, Visit, FriendRequest, Friendship
 from schemas.visit import VisitOut, VisitorInfo, VisitCreate
 from core.websocket import emit_visit_notification
@@ -22,10 +24,13 @@ def record_visit(payload: VisitCreate, current: User = Depends(get_current_user)
     if not target:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
-    visit = Visit(visitor_id=current.id, visited_user_id=visited_user_id, visited_at=datetime.utcnow())
-    db.add(visit)
-    db.commit()
-    db.refresh(visit)
+    def _write(db: Session) -> Visit:
+        visit = Visit(visitor_id=current.id, visited_user_id=visited_user_id, visited_at=datetime.utcnow())
+        db.add(visit)
+        db.flush()
+        return visit
+
+    visit = write_queue.run_sync(_write)
 
     # Emit websocket notification
     asyncio.create_task(
@@ -42,7 +47,7 @@ def record_visit(payload: VisitCreate, current: User = Depends(get_current_user)
 @router.get("/profile/{user_id}", response_model=List[VisitorInfo])
 def get_profile_visits(
     user_id: int, 
-    current: User = Depends(get_current_user), 
+    current: Principal = Depends(get_current_principal), 
     db: Session = Depends(get_db),
     time_filter: str = Query("all", description="Filter: all, today, week, month")
 ):
@@ -93,7 +98,7 @@ def get_profile_visits(
 @router.get("/count/{user_id}", response_model=dict)
 def get_visit_count(
     user_id: int,
-    current: User = Depends(get_current_user),
+    current: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     if user_id != current.id:
@@ -110,7 +115,7 @@ def get_visit_count(
 
 @router.get("/unread-count", response_model=dict)
 def get_unread_visits_count(
-    current: User = Depends(get_current_user),
+    current: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     one_day_ago = datetime.utcnow() - timedelta(days=1)
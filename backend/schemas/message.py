@@ -1,5 +1,5 @@
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 class UserInfo(BaseModel):
@@ -17,6 +17,8 @@ class MessageCreate(BaseModel):
     content: str
     content_type: str = "text"
     media_url: Optional[str] = None
+    # Lets a retried send be answered with the original message
+    client_message_id: Optional[str] = Field(None, min_length=1, max_length=64)
 
 class MessageUpdate(BaseModel):
     content: str
@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+# Before the app is imported: the engine is built from DATABASE_URL at import time
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from core.security import create_user_access_token
+from database.models import User
+from database.session import unit_of_work
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_user(client):
+    """Create a user and return (user id, auth headers)"""
+    def _make(name: str):
+        with unit_of_work() as db:
+            user = User(first_name=name, last_name="Test", email=f"{name}@example.com",
+                        username=name, hashed_password="x")
+            db.add(user)
+            db.flush()
+            headers = {"Authorization": f"Bearer {create_user_access_token(user)}"}
+            return user.id, headers
+    return _make
+
+
+class RecordingServer:
+    """Socket.IO server stand-in that records emits as (event, data, room)"""
+
+    def __init__(self):
+        self.emitted = []
+
+    async def emit(self, event, data, room=None, to=None, skip_sid=None):
+        self.emitted.append((event, data, room or to))
+
+
+@pytest.fixture
+def chat_handler():
+    """A ChatHandler that records its emits on handler.sio.emitted"""
+    from websocket.handlers.chat_handler import ChatHandler
+    from websocket.services import ConnectionService
+    return ChatHandler(RecordingServer(), ConnectionService())
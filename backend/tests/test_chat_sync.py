@@ -0,0 +1,78 @@
+from database.models import ChatChange, Conversation, User
+from database.models.chat_change import CHANGE_READ
+from database.session import unit_of_work
+from websocket.services import ChatService, membership_service
+
+
+def _change_count(conversation_id: int) -> int:
+    with unit_of_work() as db:
+        return db.query(ChatChange).filter(ChatChange.conversation_id == conversation_id).count()
+
+
+def test_sync_after_opening_empty_conversation(client, make_user):
+    alice_id, alice = make_user("empty_alice")
+    bob_id, _ = make_user("empty_bob")
+    conversation = ChatService.create_conversation([alice_id, bob_id], name="empty")
+    since = client.get("/chat/sync", headers=alice).json()["cursor"]
+
+    response = client.get(f"/chat/conversations/{conversation.id}/messages", headers=alice)
+    assert response.status_code == 200
+    assert response.json() == []
+    assert _change_count(conversation.id) == 0
+
+    response = client.get(f"/chat/sync?since={since}", headers=alice)
+    assert response.status_code == 200
+    assert response.json()["reads"] == []
+
+
+def test_sync_skips_read_changes_without_message(client, make_user):
+    alice_id, alice = make_user("legacy_alice")
+    conversation = ChatService.create_conversation([alice_id], name="legacy")
+    since = client.get("/chat/sync", headers=alice).json()["cursor"]
+    with unit_of_work() as db:
+        db.add(ChatChange(conversation_id=conversation.id, kind=CHANGE_READ, user_id=alice_id, message_id=None))
+
+    response = client.get(f"/chat/sync?since={since}", headers=alice)
+    assert response.status_code == 200
+    assert response.json()["reads"] == []
+
+
+def test_sync_returns_messages_and_reads(client, make_user):
+    alice_id, alice = make_user("sync_alice")
+    bob_id, bob = make_user("sync_bob")
+    conversation = ChatService.create_conversation([alice_id, bob_id], name="sync")
+    since = client.get("/chat/sync", headers=alice).json()["cursor"]
+
+    sent = client.post("/chat/messages", json={"conversation_id": conversation.id, "content": "hi"}, headers=bob).json()
+    client.get(f"/chat/conversations/{conversation.id}/messages", headers=alice)
+
+    body = client.get(f"/chat/sync?since={since}", headers=alice).json()
+    assert [message["id"] for message in body["messages"]] == [sent["id"]]
+    assert body["reads"] == [{
+        "conversation_id": conversation.id,
+        "user_id": alice_id,
+        "message_id": sent["id"],
+        "read_at": body["reads"][0]["read_at"],
+    }]
+    assert body["has_more"] is False
+    assert client.get(f"/chat/sync?since={body['cursor']}", headers=alice).json()["messages"] == []
+
+
+def test_sync_includes_conversation_missing_from_membership_cache(client, make_user):
+    alice_id, alice = make_user("stale_alice")
+    since = client.get("/chat/sync", headers=alice).json()["cursor"]
+    assert membership_service.get_conversation_ids(alice_id) == frozenset()
+
+    # Created by "another worker": nothing tells this process's membership index
+    with unit_of_work() as db:
+        conversation = Conversation(created_by_id=alice_id, name="elsewhere", is_group=True)
+        conversation.participants = [db.get(User, alice_id)]
+        db.add(conversation)
+        db.flush()
+        [(message, _)] = ChatService.create_messages([{
+            "conversation_id": conversation.id, "sender_id": alice_id, "content": "hello",
+        }], db)
+    assert membership_service.cached_conversation_ids(alice_id) == frozenset()
+
+    body = client.get(f"/chat/sync?since={since}", headers=alice).json()
+    assert [m["id"] for m in body["messages"]] == [message.id]
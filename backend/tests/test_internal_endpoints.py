@@ -0,0 +1,3 @@
+def test_internal_endpoints_are_not_mounted_by_default(client):
+    assert client.get("/internal/db-pool").status_code == 404
+    assert client.get("/internal/startup").status_code == 404
@@ -0,0 +1,98 @@
+import threading
+
+from core.cache import TTLCache
+from database.session import unit_of_work
+from websocket.services import ChatService, MembershipService
+
+
+class _CommitDuringRead:
+    """Session stand-in: runs the real query, then lets another "session" commit"""
+
+    def __init__(self, db, on_read):
+        self.db = db
+        self.on_read = on_read
+
+    def execute(self, *args, **kwargs):
+        result = self.db.execute(*args, **kwargs)
+        self.on_read()
+        return result
+
+
+def test_fill_racing_invalidation_is_not_cached(client, make_user):
+    alice_id, _ = make_user("race_alice")
+    bob_id, _ = make_user("race_bob")
+    conversation = ChatService.create_conversation([alice_id, bob_id], name="race")
+    index = MembershipService()
+
+    def delete_elsewhere():
+        with unit_of_work() as other:
+            ChatService.delete_conversation(conversation.id, db=other)
+            index.conversation_deleted(other, conversation.id, [alice_id, bob_id])
+
+    with unit_of_work() as db:
+        # The read saw both members, but the delete committed before the store
+        assert index.get_member_ids(conversation.id, _CommitDuringRead(db, delete_elsewhere)) == {alice_id, bob_id}
+        assert index.cached_member_ids(conversation.id) is None
+        assert index.get_conversation_ids(alice_id, db) == frozenset()
+    assert not index.is_member(conversation.id, alice_id)
+
+
+def test_user_fill_racing_invalidation_is_not_cached(client, make_user):
+    alice_id, _ = make_user("race_carol")
+    index = MembershipService()
+
+    def create_elsewhere():
+        with unit_of_work() as other:
+            conversation = ChatService.create_conversation([alice_id], name="late", db=other)
+            index.conversation_created(other, conversation.id, [alice_id])
+
+    with unit_of_work() as db:
+        assert index.get_conversation_ids(alice_id, _CommitDuringRead(db, create_elsewhere)) == frozenset()
+    assert index.cached_conversation_ids(alice_id) is None
+    assert len(index.get_conversation_ids(alice_id)) == 1
+
+
+def test_ttl_cache_generation():
+    cache = TTLCache(maxsize=2, ttl=60)
+    generation = cache.generation()
+    cache.invalidate("a")
+    cache.set("a", 1, generation)
+    assert cache.get("a") is None
+
+    generation = cache.generation()
+    cache.set("b", 2, generation)
+    assert cache.get("b") == 2
+
+    # Keys pushed out of the per-key record still block fills older than them
+    generation = cache.generation()
+    for key in ("c", "d", "e"):
+        cache.invalidate(key)
+    cache.set("c", 3, generation)
+    assert cache.get("c") is None
+
+
+def test_ttl_cache_concurrent_fills_and_invalidations():
+    cache = TTLCache(maxsize=16, ttl=60)
+    source = {"value": 0}
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            source["value"] += 1
+            cache.invalidate("key")
+
+    def filler():
+        while not stop.is_set():
+            generation = cache.generation()
+            cache.set("key", source["value"], generation)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=filler) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    threading.Event().wait(0.2)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    cached = cache.get("key")
+    assert cached is None or cached == source["value"]
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from database.models import Message
+from database.session import unit_of_work
+from websocket.services import ChatService
+
+
+def _conversation_with_tied_messages(make_user, name: str, count: int = 7):
+    """A conversation whose messages all share one created_at"""
+    user_id, _ = make_user(name)
+    conversation = ChatService.create_conversation([user_id], name=name)
+    created_at = datetime(2024, 1, 1, 12, 0, 0)
+    with unit_of_work() as db:
+        messages = [
+            Message(conversation_id=conversation.id, sender_id=user_id, content=f"tied {n}", created_at=created_at)
+            for n in range(count)
+        ]
+        db.add_all(messages)
+        db.flush()
+        return conversation.id, [message.id for message in messages]
+
+
+def test_keyset_pages_backwards_through_tied_timestamps(client, make_user):
+    conversation_id, ids = _conversation_with_tied_messages(make_user, "keyset_back")
+
+    pages, before = [], None
+    while True:
+        page = ChatService.get_messages(conversation_id, limit=3, before=before)
+        if not page:
+            break
+        pages.append([message.id for message in page])
+        before = (page[0].created_at, page[0].id)
+
+    assert pages == [ids[4:7], ids[1:4], ids[0:1]]
+
+
+def test_keyset_pages_forwards_through_tied_timestamps(client, make_user):
+    conversation_id, ids = _conversation_with_tied_messages(make_user, "keyset_forward")
+
+    seen, after = [], ids[0]  # a bare message id works as a cursor too
+    while True:
+        page = ChatService.get_messages(conversation_id, limit=2, after=after)
+        if not page:
+            break
+        seen += [message.id for message in page]
+        after = (page[-1].created_at, page[-1].id)
+
+    assert seen == ids[1:]
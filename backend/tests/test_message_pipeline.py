@@ -0,0 +1,100 @@
+import asyncio
+
+from database.models import Conversation, Message
+from database.session import unit_of_work
+from websocket.services import ChatService, MessagePipeline, recent_client_messages
+
+
+def _send_all(pipeline: MessagePipeline, sends: list[dict]) -> list:
+    async def scenario():
+        try:
+            return await asyncio.gather(*(pipeline.submit(**fields) for fields in sends))
+        finally:
+            await pipeline.stop()
+    return asyncio.run(scenario())
+
+
+def _message_count(conversation_id: int) -> int:
+    with unit_of_work() as db:
+        return db.query(Message).filter(Message.conversation_id == conversation_id).count()
+
+
+def test_duplicate_client_id_in_one_batch_returns_same_message(client, make_user):
+    alice_id, _ = make_user("pipe_alice")
+    conversation = ChatService.create_conversation([alice_id], name="pipe")
+    pipeline = MessagePipeline(max_delay=0.05)
+
+    results = _send_all(pipeline, [
+        {"conversation_id": conversation.id, "sender_id": alice_id, "content": "hi", "client_message_id": "same"}
+        for _ in range(3)
+    ])
+
+    assert len({message.id for message, _ in results}) == 1
+    assert [created for _, created in results] == [True, False, False]
+    assert pipeline.stats()["batches"] == 1
+    assert _message_count(conversation.id) == 1
+
+
+def test_duplicate_client_id_across_batches_returns_stored_row(client, make_user):
+    alice_id, _ = make_user("pipe_bob")
+    conversation = ChatService.create_conversation([alice_id], name="pipe")
+    fields = {"conversation_id": conversation.id, "sender_id": alice_id, "content": "hi", "client_message_id": "again"}
+
+    [(first, created)] = _send_all(MessagePipeline(), [fields])
+    assert created
+    [(second, created)] = _send_all(MessagePipeline(), [fields])
+    assert not created
+    assert second.id == first.id
+    assert _message_count(conversation.id) == 1
+
+
+def test_batch_over_several_conversations_sets_each_last_message(client, make_user):
+    alice_id, _ = make_user("pipe_carol")
+    conversations = [ChatService.create_conversation([alice_id], name=f"pipe{n}") for n in range(3)]
+    sends = [
+        {"conversation_id": conversations[n % 3].id, "sender_id": alice_id, "content": f"message {n}"}
+        for n in range(9)
+    ]
+    pipeline = MessagePipeline(max_delay=0.05)
+
+    results = _send_all(pipeline, sends)
+
+    assert pipeline.stats()["batches"] == 1
+    with unit_of_work() as db:
+        for conversation in conversations:
+            newest = max((m for m, _ in results if m.conversation_id == conversation.id), key=lambda m: m.id)
+            stored = db.get(Conversation, conversation.id)
+            assert stored.last_message_id == newest.id
+            assert stored.last_message_preview == newest.content
+            assert stored.last_sender_id == alice_id
+
+
+def test_rest_send_retries_after_losing_the_unique_index_race(client, make_user, monkeypatch):
+    alice_id, alice = make_user("pipe_dave")
+    conversation = ChatService.create_conversation([alice_id], name="race")
+    lookup = ChatService.get_client_messages
+    winner = {}
+
+    def racing_lookup(keys, db=None):
+        if not winner:
+            # Another worker stores the same send between our lookup and insert
+            winner["id"] = None
+            with unit_of_work() as other:
+                [(message, _)] = ChatService.create_messages([{
+                    "conversation_id": conversation.id, "sender_id": alice_id,
+                    "content": "hi", "client_message_id": "raced",
+                }], other)
+            winner["id"] = message.id
+            return {}
+        return lookup(keys, db=db)
+
+    monkeypatch.setattr(ChatService, "get_client_messages", staticmethod(racing_lookup))
+    recent_client_messages.clear()
+
+    response = client.post("/chat/messages", headers=alice, json={
+        "conversation_id": conversation.id, "content": "hi", "client_message_id": "raced",
+    })
+
+    assert response.status_code == 200, response.text
+    assert response.json()["id"] == winner["id"]
+    assert _message_count(conversation.id) == 1
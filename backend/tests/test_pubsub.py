@@ -0,0 +1,125 @@
+import asyncio
+import fcntl
+import os
+import pickle
+import time
+
+import pytest
+
+from websocket.pubsub import MemoryTransport, TransportManager, UnixSocketTransport
+
+
+async def _subscribed(transport: MemoryTransport, channel: str):
+    iterator = transport.subscribe(channel)
+    pending = asyncio.ensure_future(iterator.__anext__())
+    await asyncio.sleep(0)  # run the generator up to its first wait, which subscribes it
+    return iterator, pending
+
+
+def test_memory_transport_delivers_to_every_subscriber():
+    async def scenario():
+        transport = MemoryTransport()
+        _, first = await _subscribed(transport, "room")
+        _, second = await _subscribed(transport, "room")
+        _, other = await _subscribed(transport, "elsewhere")
+
+        await transport.publish("room", b"hello")
+        assert await asyncio.wait_for(first, 1) == b"hello"
+        assert await asyncio.wait_for(second, 1) == b"hello"
+        await asyncio.sleep(0)
+        assert not other.done()
+        other.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_transport_manager_pickles_round_trip():
+    async def scenario():
+        manager = TransportManager(MemoryTransport(), channel="socketio")
+        listener = manager._listen()
+        pending = asyncio.ensure_future(listener.__anext__())
+        await asyncio.sleep(0)
+
+        message = {"method": "emit", "event": "chat_message", "data": {"id": 1}, "room": "conversation:1"}
+        await manager._publish(message)
+        assert pickle.loads(await asyncio.wait_for(pending, 1)) == message
+        await listener.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_unix_transport_creates_private_directory(tmp_path):
+    path = tmp_path / "run" / "broker.sock"
+
+    async def scenario():
+        transport = UnixSocketTransport(str(path))
+        transport._start()
+        assert os.stat(path.parent).st_mode & 0o777 == 0o700
+        await transport.close()
+
+    asyncio.run(scenario())
+
+
+def test_unix_transport_refuses_shared_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o755)
+    os.chmod(shared, 0o755)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            UnixSocketTransport(str(shared / "broker.sock"))._start()
+
+    asyncio.run(scenario())
+
+
+def test_unix_transport_does_not_follow_lock_symlink(tmp_path):
+    path = tmp_path / "broker.sock"
+    target = tmp_path / "elsewhere"
+    os.symlink(target, f"{path}.lock")
+
+    async def scenario():
+        transport = UnixSocketTransport(str(path))
+        with pytest.raises(OSError):
+            await transport._serve_if_unclaimed()
+        assert not transport.serving
+
+    asyncio.run(scenario())
+    assert not target.exists()
+
+
+def test_unix_transport_publish_times_out_without_broker(tmp_path):
+    path = tmp_path / "broker.sock"
+    # Another worker holds the broker lock but never serves
+    fd = os.open(f"{path}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    async def scenario():
+        transport = UnixSocketTransport(str(path), retry_interval=0.05, publish_timeout=0.2)
+        started = time.monotonic()
+        await transport.publish("socketio", b"dropped")
+        elapsed = time.monotonic() - started
+        await transport.close()
+        return elapsed
+
+    try:
+        assert 0.2 <= asyncio.run(scenario()) < 1.0
+    finally:
+        os.close(fd)
+
+
+def test_unix_transport_relays_between_workers(tmp_path):
+    path = tmp_path / "run" / "broker.sock"
+
+    async def scenario():
+        first, second = UnixSocketTransport(str(path)), UnixSocketTransport(str(path))
+        messages = second.subscribe("socketio")
+        pending = asyncio.ensure_future(messages.__anext__())
+        await asyncio.sleep(0.2)  # let both connect and the subscription reach the broker
+        await first.publish("socketio", b"hello")
+        assert await asyncio.wait_for(pending, 2) == b"hello"
+        assert first.serving != second.serving
+        await messages.aclose()
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,86 @@
+import asyncio
+
+from database.models.conversation import conversation_participants
+from database.session import unit_of_work
+from websocket.events import SocketEvents
+from websocket.services import ChatService, ReadReceiptService
+
+
+def _read_cursor(conversation_id: int, user_id: int) -> int | None:
+    with unit_of_work() as db:
+        return db.execute(
+            conversation_participants.select().where(
+                (conversation_participants.c.conversation_id == conversation_id)
+                & (conversation_participants.c.user_id == user_id)
+            )
+        ).first().last_read_message_id
+
+
+def _setup(make_user, name: str, count: int):
+    sender_id, _ = make_user(f"{name}_sender")
+    reader_id, _ = make_user(f"{name}_reader")
+    conversation = ChatService.create_conversation([sender_id, reader_id], name=name)
+    with unit_of_work() as db:
+        sent = ChatService.create_messages([
+            {"conversation_id": conversation.id, "sender_id": sender_id, "content": f"m{n}"} for n in range(count)
+        ], db)
+    return conversation.id, reader_id, [message.id for message, _ in sent]
+
+
+def _reads(handler) -> list[tuple[int, int]]:
+    return [(data["user_id"], data["message_id"]) for event, data, _ in handler.sio.emitted
+            if event == SocketEvents.MESSAGE_READ]
+
+
+def test_reads_in_one_window_flush_once_at_the_highest_id(client, make_user, chat_handler):
+    conversation_id, reader_id, ids = _setup(make_user, "window", 5)
+    chat_handler.read_receipts = ReadReceiptService(window=0.05)
+
+    async def scenario():
+        for message_id in (ids[1], ids[3], ids[0], ids[2]):
+            assert await chat_handler.handle_message_read(message_id, reader_id)
+        assert _reads(chat_handler) == []  # nothing before the window closes
+        await asyncio.sleep(0.15)
+
+    asyncio.run(scenario())
+    assert _reads(chat_handler) == [(reader_id, ids[3])]
+    assert _read_cursor(conversation_id, reader_id) == ids[3]
+    assert chat_handler.read_receipts.stats() == {"pending": 0, "events": 4, "flushes": 1, "coalesced": 3}
+
+
+def test_read_cursor_only_moves_forward(client, make_user, chat_handler):
+    conversation_id, reader_id, ids = _setup(make_user, "forward", 3)
+    chat_handler.read_receipts = ReadReceiptService(window=0.02)
+
+    async def scenario():
+        await chat_handler.handle_message_read(ids[2], reader_id)
+        await asyncio.sleep(0.08)
+        await chat_handler.handle_message_read(ids[0], reader_id)  # an older message scrolls into view
+        await asyncio.sleep(0.08)
+
+    asyncio.run(scenario())
+    assert _reads(chat_handler) == [(reader_id, ids[2])]
+    assert _read_cursor(conversation_id, reader_id) == ids[2]
+
+
+def test_flush_reads_persists_open_windows(client, make_user, chat_handler):
+    conversation_id, reader_id, ids = _setup(make_user, "shutdown", 2)
+    chat_handler.read_receipts = ReadReceiptService(window=60)
+
+    async def scenario():
+        await chat_handler.handle_message_read(ids[1], reader_id)
+        await chat_handler.flush_reads()
+
+    asyncio.run(scenario())
+    assert _reads(chat_handler) == [(reader_id, ids[1])]
+    assert _read_cursor(conversation_id, reader_id) == ids[1]
+
+
+def test_read_by_non_participant_is_ignored(client, make_user, chat_handler):
+    _, _, ids = _setup(make_user, "outsider", 1)
+    outsider_id, _ = make_user("outsider_other")
+    chat_handler.read_receipts = ReadReceiptService(window=0.01)
+
+    assert asyncio.run(chat_handler.handle_message_read(ids[0], outsider_id)) is False
+    assert asyncio.run(chat_handler.handle_message_read("nope", outsider_id)) is False
+    assert chat_handler.read_receipts.stats()["events"] == 0
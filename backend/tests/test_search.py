@@ -0,0 +1,34 @@
+from sqlalchemy import text
+
+from database.models import Message
+from database.session import unit_of_work
+from websocket.services import ChatService
+
+
+def _fts_ids(term: str) -> set[int]:
+    with unit_of_work() as db:
+        return set(db.execute(
+            text("SELECT rowid FROM messages_fts WHERE messages_fts MATCH :term"), {"term": term}
+        ).scalars())
+
+
+def test_search_index_follows_edits_and_deletes(client, make_user):
+    user_id, _ = make_user("fts_alice")
+    conversation = ChatService.create_conversation([user_id], name="fts")
+    with unit_of_work() as db:
+        [(kept, _), (removed, _), (purged, _)] = ChatService.create_messages([
+            {"conversation_id": conversation.id, "sender_id": user_id, "content": content}
+            for content in ("pelican original", "pelican doomed", "pelican purged")
+        ], db)
+    assert {kept.id, removed.id, purged.id} <= _fts_ids("pelican")
+
+    ChatService.edit_message(kept.id, "albatross edited")
+    ChatService.delete_message(removed.id)
+    with unit_of_work() as db:
+        db.delete(db.get(Message, purged.id))
+
+    assert _fts_ids("pelican") & {kept.id, removed.id, purged.id} == set()
+    assert kept.id in _fts_ids("albatross")
+    assert [m.id for m in ChatService.search_messages(conversation.id, "albatross")] == [kept.id]
+    assert ChatService.search_messages(conversation.id, "pelican") == []
+    assert [m.id for m in ChatService.search_messages(conversation.id, "alba")] == [kept.id]
@@ -0,0 +1,63 @@
+import asyncio
+
+from websocket.events import SocketEvents
+from websocket.services import TypingService
+
+
+def _events(handler) -> list[tuple[str, int, bool]]:
+    return [(event, data["user_id"], data["typing"]) for event, data, _ in handler.sio.emitted]
+
+
+def test_typing_is_debounced_within_the_interval(chat_handler):
+    chat_handler.typing_service = TypingService(interval=0.05, ttl=1.0)
+    alice = {"id": 1, "name": "Alice"}
+
+    async def scenario():
+        first = await chat_handler.handle_typing(alice, 10, True, session_id="s1")
+        repeats = [await chat_handler.handle_typing(alice, 10, True, session_id="s1") for _ in range(5)]
+        await asyncio.sleep(0.06)
+        again = await chat_handler.handle_typing(alice, 10, True, session_id="s1")
+        stop = await chat_handler.handle_typing(alice, 10, False, session_id="s1")
+        extra_stop = await chat_handler.handle_typing(alice, 10, False, session_id="s1")
+        return first, repeats, again, stop, extra_stop
+
+    first, repeats, again, stop, extra_stop = asyncio.run(scenario())
+    assert first["typing"] is True
+    assert repeats == [None] * 5
+    assert again["typing"] is True
+    assert stop["typing"] is False
+    assert extra_stop is None  # no stop without a start
+    assert chat_handler.typing_service.stats()["suppressed"] == 6
+
+
+def test_quiet_typist_is_expired_with_one_stop(chat_handler):
+    chat_handler.typing_service = TypingService(interval=0.05, ttl=0.1)
+    alice = {"id": 1, "name": "Alice"}
+
+    async def scenario():
+        chat_handler.start_typing_expiry()
+        try:
+            await chat_handler.handle_typing(alice, 10, True, session_id="s1")
+            await asyncio.sleep(0.05)
+            assert chat_handler.typing_service.get_typing_users(10) == [1]
+            await asyncio.sleep(0.2)
+        finally:
+            chat_handler.stop_typing_expiry()
+
+    asyncio.run(scenario())
+    assert _events(chat_handler) == [(SocketEvents.TYPING_STOP, 1, False)]
+    assert chat_handler.typing_service.get_typing_users(10) == []
+    assert chat_handler.typing_service.stats()["expired"] == 1
+
+
+def test_disconnect_stops_only_that_sessions_typing(chat_handler):
+    chat_handler.typing_service = TypingService(interval=0.05, ttl=1.0)
+
+    async def scenario():
+        await chat_handler.handle_typing({"id": 1, "name": "Alice"}, 10, True, session_id="s1")
+        await chat_handler.handle_typing({"id": 2, "name": "Bob"}, 10, True, session_id="s2")
+        await chat_handler.handle_typing_disconnect("s1")
+
+    asyncio.run(scenario())
+    assert _events(chat_handler) == [(SocketEvents.TYPING_STOP, 1, False)]
+    assert chat_handler.typing_service.get_typing_users(10) == [2]
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from database.models import User
+from database.session import engine, unit_of_work
+from database.writer import WriteQueue
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def _make(enabled: bool = True, max_batch: int = 64, max_delay: float = 0.05) -> WriteQueue:
+        queue = WriteQueue(
+            sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine),
+            enabled=enabled,
+            max_batch=max_batch,
+            max_delay=max_delay,
+        )
+        queues.append(queue)
+        return queue
+
+    yield _make
+    for queue in queues:
+        queue.stop()
+
+
+def _add_user(username: str):
+    def op(db):
+        user = User(first_name=username, last_name="Queue", email=f"{username}@example.com",
+                    username=username, hashed_password="x")
+        db.add(user)
+        db.flush()
+        return user.username
+    return op
+
+
+def _fail(db):
+    raise ValueError("bad write")
+
+
+def _usernames(prefix: str) -> list[str]:
+    with unit_of_work() as db:
+        return sorted(u for (u,) in db.query(User.username).filter(User.username.like(f"{prefix}%")))
+
+
+def test_operations_are_batched_into_one_commit(client, make_queue):
+    queue = make_queue(max_batch=8)
+    futures = [queue.submit(_add_user(f"batch{n}")) for n in range(8)]
+
+    assert [future.result(5) for future in futures] == [f"batch{n}" for n in range(8)]
+    stats = queue.stats()
+    assert stats["batches"] == 1
+    assert stats["max_batch"] == 8
+    assert _usernames("batch") == [f"batch{n}" for n in range(8)]
+
+
+def test_failed_batch_is_replayed_one_operation_at_a_time(client, make_queue):
+    queue = make_queue()
+    good = [queue.submit(_add_user(f"replay{n}")) for n in range(3)]
+    bad = queue.submit(_fail)
+    good.append(queue.submit(_add_user("replay3")))
+
+    assert [future.result(5) for future in good] == [f"replay{n}" for n in range(4)]
+    with pytest.raises(ValueError):
+        bad.result(5)
+    # Rolled back once, then each good write committed exactly once
+    assert _usernames("replay") == [f"replay{n}" for n in range(4)]
+    assert queue.stats()["failures"] == 1
+
+
+def test_run_and_run_sync_return_each_callers_result(client, make_queue):
+    for enabled in (True, False):
+        queue = make_queue(enabled=enabled, max_delay=0.01)
+        prefix = f"callers{int(enabled)}_"
+        assert queue.run_sync(_add_user(f"{prefix}sync")) == f"{prefix}sync"
+
+        async def concurrent():
+            return await asyncio.gather(*(queue.run(_add_user(f"{prefix}async{n}")) for n in range(5)))
+
+        assert asyncio.run(concurrent()) == [f"{prefix}async{n}" for n in range(5)]
+        with pytest.raises(ValueError):
+            queue.run_sync(_fail)
@@ -1,9 +1,19 @@
 from socketio import AsyncServer
 from core.config import settings
+from .pubsub import TransportManager, create_transport
 import os
 
+# Shared by the client manager and the presence registry; None when a single
+# worker serves every socket
+transport = create_transport(
+    settings.SOCKETIO_MANAGER,
+    redis_url=settings.SOCKETIO_REDIS_URL,
+    broker_path=settings.SOCKETIO_BROKER_PATH,
+)
+
 sio = AsyncServer(
     async_mode='asgi',
+    client_manager=TransportManager(transport, channel=settings.SOCKETIO_CHANNEL) if transport else None,
     cors_allowed_origins=os.getenv('CORS_ORIGINS', '*').split(',') if os.getenv('CORS_ORIGINS') != '*' else '*',
     cors_credentials=True,
     ping_timeout=60,
@@ -12,4 +22,4 @@ sio = AsyncServer(
     engineio_logger=True,
 )
 
-__all__ = ['sio']
+__all__ = ['sio', 'transport']
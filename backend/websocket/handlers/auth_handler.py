@@ -1,11 +1,24 @@
 from fastapi import HTTPException, status
-from jose import JWTError, jwt
-from core.config import settings
+from jose import JWTError
+from core.security import decode_access_token
 from database.session import SessionLocal
+from database.executor import run_db
 from database.models import User
 
 class AuthHandler:
     """Handles WebSocket authentication"""
+
+    @staticmethod
+    def _load_user(payload: dict) -> User | None:
+        db = SessionLocal()
+        try:
+            uid = payload.get("uid")
+            if uid is not None:
+                return db.get(User, int(uid))
+            # Legacy email-only token
+            return db.query(User).filter(User.email == payload["sub"]).first()
+        finally:
+            db.close()
     
     @staticmethod
     async def authenticate_socket(auth: dict) -> User:
@@ -18,14 +31,12 @@ class AuthHandler:
         
         token = auth['token']
         try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            payload = decode_access_token(token)
             email: str | None = payload.get("sub")
             if email is None:
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
             
-            db = SessionLocal()
-            user = db.query(User).filter(User.email == email).first()
-            db.close()
+            user = await run_db(AuthHandler._load_user, payload)
             
             if user is None:
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
@@ -1,114 +1,308 @@
-from websocket.services import ChatService, NotificationService, ConnectionService
+import asyncio
+from datetime import datetime
+from sqlalchemy.orm import Session
+from core.cache import TTLCache
+from core.config import settings
+from websocket.services import (
+    ChatService, AsyncChatService, NotificationService, ConnectionService,
+    membership_service, typing_service, read_receipt_service, message_pipeline,
+    recent_client_messages,
+)
 from websocket.events import SocketEvents
 from database.models import User
 
+
+def conversation_room(conversation_id: int) -> str:
+    """Socket.IO room holding every connected session of a conversation's participants"""
+    return f"conversation:{conversation_id}"
+
+
+def user_card(user: User) -> dict:
+    """Compact sender info, saved in the Socket.IO session when a user connects"""
+    return {
+        "id": user.id,
+        "name": f"{user.first_name} {user.last_name}".strip(),
+        "avatar": user.profile_photo,
+    }
+
+
 class ChatHandler:
     """Handles chat-related WebSocket events"""
 
     def __init__(self, sio, connection_service: ConnectionService):
         self.sio = sio
         self.connection_service = connection_service
-        self.chat_service = ChatService()
+        self.chat_service = AsyncChatService()
         self.notification_service = NotificationService()
+        # message id -> (conversation_id, sender_id); neither ever changes
+        self.message_owners = TTLCache(
+            maxsize=settings.MESSAGE_OWNER_CACHE_SIZE,
+            ttl=settings.MESSAGE_OWNER_CACHE_TTL_SECONDS,
+        )
+        self.typing_service = typing_service
+        self._typing_expiry: asyncio.Task | None = None
+        self.read_receipts = read_receipt_service
+        self.message_pipeline = message_pipeline
+        self._read_flushes: set[asyncio.Task] = set()
+
+    @staticmethod
+    def load_participant_ids(db: Session, conversation_id: int) -> frozenset[int]:
+        """Get participant ids of a conversation, using the caller's session on an index miss"""
+        return membership_service.get_member_ids(conversation_id, db=db)
+
+    @staticmethod
+    def load_conversation_ids(db: Session, user_id: int) -> frozenset[int]:
+        """Get ids of the user's conversations, using the caller's session on an index miss"""
+        return membership_service.get_conversation_ids(user_id, db=db)
+
+    def load_message_owner(self, db: Session, message_id: int) -> tuple[int, int] | None:
+        """Get (conversation_id, sender_id) of a message, using the caller's session on a cache miss"""
+        owner = self.message_owners.get(message_id)
+        if owner is None:
+            owner = ChatService.get_message_owner(message_id, db=db)
+            if owner is not None:
+                self.message_owners.set(message_id, owner)
+        return owner
+
+    async def get_message_owner(self, message_id: int) -> tuple[int, int] | None:
+        """Get (conversation_id, sender_id) of a message, from the cache when possible"""
+        owner = self.message_owners.get(message_id)
+        if owner is None:
+            owner = await self.chat_service.transaction(self.load_message_owner, message_id)
+        return owner
+
+    async def get_participant_ids(self, conversation_id: int) -> frozenset[int]:
+        """Get participant ids of a conversation, from the membership index when cached"""
+        participant_ids = membership_service.cached_member_ids(conversation_id)
+        if participant_ids is None:
+            participant_ids = await self.chat_service.transaction(self.load_participant_ids, conversation_id)
+        return participant_ids
+
+    async def join_conversation_rooms(self, sid: str, user_id: int):
+        """Put a newly connected session in the rooms of all the user's conversations"""
+        conversation_ids = membership_service.cached_conversation_ids(user_id)
+        if conversation_ids is None:
+            conversation_ids = await self.chat_service.transaction(self.load_conversation_ids, user_id)
+        for conversation_id in conversation_ids:
+            await self.sio.enter_room(sid, conversation_room(conversation_id))
+
+    async def join_conversation_room(self, conversation_id: int, user_ids):
+        """Put the connected sessions of user_ids, on any worker, in a conversation's room"""
+        room = conversation_room(conversation_id)
+        for user_id in user_ids:
+            for session_id in self.connection_service.get_user_sessions(user_id):
+                await self.sio.enter_room(session_id, room)
+
+    async def close_conversation_room(self, conversation_id: int):
+        """Remove every session from a deleted conversation's room"""
+        await self.sio.close_room(conversation_room(conversation_id))
 
     async def handle_send_message(
         self,
-        user: User,
+        sender: dict,
         conversation_id: int,
         content: str,
         content_type: str = "text",
         media_url: str = None,
-    ) -> dict:
-        """Handle sending a message"""
-        try:
-            message = self.chat_service.create_message(
-                conversation_id=conversation_id,
-                sender_id=user.id,
-                content=content,
-                content_type=content_type,
-                media_url=media_url,
-            )
+        client_message_id: str = None,
+    ) -> dict | None:
+        """Handle sending a message
 
-            read_by_ids = [u.id for u in message.read_by]
+        sender is the user card from the socket session. Returns the message
+        payload once the message is committed, or None if the sender is not a
+        participant. With the pipeline enabled the insert is group-committed
+        with messages from other sockets (see MessagePipeline).
 
-            payload = {
-                "id": message.id,
-                "conversation_id": message.conversation_id,
-                "sender": {
-                    "id": user.id,
-                    "name": f"{user.first_name} {user.last_name}".strip(),
-                    "avatar": user.profile_photo,
-                },
-                "content": message.content,
-                "content_type": message.content_type,
-                "media_url": message.media_url,
-                "is_deleted": message.is_deleted,
-                "edited_at": None,
-                "created_at": message.created_at.isoformat(),
-                "read_by": read_by_ids,
-            }
+        A retry whose client_message_id the sender already used gets the
+        original message back, marked "duplicate", and nothing is written;
+        the caller acks it without broadcasting again.
+        """
+        key = (sender["id"], client_message_id)
+        if client_message_id:
+            message = recent_client_messages.get(key)
+            if message is not None:
+                return {**self.message_payload(message, sender), "duplicate": True}
 
-            return payload
+        fields = {
+            "conversation_id": conversation_id,
+            "sender_id": sender["id"],
+            "content": content,
+            "content_type": content_type,
+            "media_url": media_url,
+            "client_message_id": client_message_id,
+        }
+
+        def _send(db: Session):
+            participant_ids = self.load_participant_ids(db, conversation_id)
+            if sender["id"] not in participant_ids:
+                return None
+            return ChatService.create_messages([fields], db)[0]
+
+        try:
+            if self.message_pipeline.enabled:
+                if sender["id"] not in await self.get_participant_ids(conversation_id):
+                    return None
+                result = await self.message_pipeline.submit(**fields)
+            else:
+                result = await self.chat_service.transaction(_send)
         except Exception as e:
             raise Exception(f"Error sending message: {str(e)}")
+        if result is None:
+            return None
+
+        message, created = result
+        # Only once committed: a rolled back id can be handed out again
+        self.message_owners.set(message.id, (message.conversation_id, sender["id"]))
+        if client_message_id:
+            recent_client_messages.set(key, message)
+        payload = self.message_payload(message, sender)
+        if not created:
+            payload["duplicate"] = True
+        return payload
+
+    @staticmethod
+    def message_payload(message, sender: dict) -> dict:
+        """Socket payload of a message that was just sent"""
+        return {
+            "id": message.id,
+            "conversation_id": message.conversation_id,
+            "sender": sender,
+            "content": message.content,
+            "content_type": message.content_type,
+            "media_url": message.media_url,
+            "client_message_id": message.client_message_id,
+            "is_deleted": message.is_deleted,
+            "edited_at": None,
+            "created_at": message.created_at.isoformat(),
+            "read_by": [],  # nobody has read a message that was just sent
+        }
+
+    async def handle_message_read(self, message_id: int, user_id: int) -> bool:
+        """Handle message read confirmation
 
-    async def handle_message_read(self, message_id: int, user_id: int):
-        """Handle message read confirmation"""
+        The read is coalesced with the user's other reads in the same
+        conversation and flushed once the window closes (see flush_read).
+        Returns False if the message does not exist or the user is not a
+        participant of its conversation.
+        """
         try:
-            message = self.chat_service.mark_message_as_read(message_id, user_id)
-            read_by_ids = [u.id for u in message.read_by]
-            return {
-                "message_id": message_id,
-                "user_id": user_id,
-                "read_by": read_by_ids,
-            }
-        except Exception as e:
-            raise Exception(f"Error marking message as read: {str(e)}")
+            message_id = int(message_id)
+        except (TypeError, ValueError):
+            return False
+        owner = await self.get_message_owner(message_id)
+        if not owner:
+            return False
+        conversation_id, _ = owner
+        if user_id not in await self.get_participant_ids(conversation_id):
+            return False
+        if self.read_receipts.add(conversation_id, user_id, message_id):
+            task = asyncio.get_running_loop().create_task(self._flush_read_later(conversation_id, user_id))
+            self._read_flushes.add(task)
+            task.add_done_callback(self._read_flushes.discard)
+        return True
 
-    async def handle_delete_message(self, message_id: int):
-        """Handle message deletion"""
+    async def _flush_read_later(self, conversation_id: int, user_id: int):
+        await asyncio.sleep(self.read_receipts.window)
+        await self.flush_read(conversation_id, user_id)
+
+    async def flush_read(self, conversation_id: int, user_id: int):
+        """Persist the highest message read in the window and broadcast "read up to" it
+
+        Nothing is broadcast when the user's read cursor was already past it.
+        """
+        message_id = self.read_receipts.take(conversation_id, user_id)
+        if message_id is None:
+            return
         try:
-            message = self.chat_service.delete_message(message_id)
-            return {
+            advanced = await self.chat_service.mark_read_up_to(conversation_id, user_id, message_id)
+            if advanced:
+                await self.emit_message_read_to_conversation(conversation_id, {
+                    "conversation_id": conversation_id,
+                    "user_id": user_id,
+                    "message_id": message_id,  # every message up to this one is read
+                    "read_at": datetime.utcnow().isoformat(),
+                })
+        except Exception as e:
+            print(f"Error marking messages as read: {e}")
+
+    async def flush_reads(self):
+        """Flush every open read window now (on shutdown)"""
+        for task in list(self._read_flushes):
+            task.cancel()
+        for conversation_id, user_id in list(self.read_receipts.pending):
+            await self.flush_read(conversation_id, user_id)
+
+    async def handle_delete_message(self, message_id: int, user_id: int) -> dict | None:
+        """Handle message deletion
+
+        Returns None if the message does not exist or was not sent by the user.
+        """
+        def _delete(db: Session):
+            owner = self.load_message_owner(db, message_id)
+            if not owner or owner[1] != user_id:
+                return None
+            ChatService.delete_message(message_id, db=db)
+            delete_data = {
                 "message_id": message_id,
                 "is_deleted": True,
-                "conversation_id": message.conversation_id,
+                "conversation_id": owner[0],
             }
+            return delete_data
+
+        try:
+            return await self.chat_service.transaction(_delete)
         except Exception as e:
             raise Exception(f"Error deleting message: {str(e)}")
 
-    async def handle_edit_message(self, message_id: int, content: str):
-        """Handle message editing"""
-        try:
-            message = self.chat_service.edit_message(message_id, content)
-            read_by_ids = [u.id for u in message.read_by]
-            return {
+    async def handle_edit_message(self, message_id: int, user_id: int, content: str) -> dict | None:
+        """Handle message editing
+
+        Returns None if the message does not exist or was not sent by the user.
+        """
+        def _edit(db: Session):
+            owner = self.load_message_owner(db, message_id)
+            if not owner or owner[1] != user_id:
+                return None
+            message = ChatService.edit_message(message_id, content, db=db)
+            read_by_ids = ChatService.get_read_by([message.id], db=db)[message.id]
+            edit_data = {
                 "id": message.id,
                 "conversation_id": message.conversation_id,
                 "content": message.content,
                 "edited_at": message.edited_at.isoformat() if message.edited_at else None,
                 "read_by": read_by_ids,
             }
+            return edit_data
+
+        try:
+            return await self.chat_service.transaction(_edit)
         except Exception as e:
             raise Exception(f"Error editing message: {str(e)}")
 
     async def handle_typing(
         self,
-        user: User,
+        user: dict,
         conversation_id: int,
         is_typing: bool,
-    ) -> dict:
-        """Handle typing indicator"""
+        session_id: str = None,
+    ) -> dict | None:
+        """Handle typing indicator for the user card from the socket session
+
+        Returns the payload to broadcast, or None when the event is
+        debounced (see TypingService).
+        """
         try:
             if is_typing:
-                self.connection_service.add_typing_user(conversation_id, user.id)
+                changed = self.typing_service.start(conversation_id, user["id"], user["name"], session_id)
             else:
-                self.connection_service.remove_typing_user(conversation_id, user.id)
+                changed = self.typing_service.stop(conversation_id, user["id"])
+            if not changed:
+                return None
 
             payload = self.notification_service.create_typing_payload(
                 conversation_id=conversation_id,
-                user_id=user.id,
-                user_name=f"{user.first_name} {user.last_name}".strip(),
+                user_id=user["id"],
+                user_name=user["name"],
                 typing=is_typing,
             )
 
@@ -116,84 +310,84 @@ class ChatHandler:
         except Exception as e:
             raise Exception(f"Error handling typing: {str(e)}")
 
+    async def emit_typing_stopped(self, stopped: list[tuple[int, int, str]]):
+        """Broadcast typing stops for (conversation_id, user_id, user_name) entries"""
+        for conversation_id, user_id, user_name in stopped:
+            payload = self.notification_service.create_typing_payload(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                user_name=user_name,
+                typing=False,
+            )
+            await self.emit_typing_to_conversation(conversation_id, payload)
+
+    async def handle_typing_disconnect(self, session_id: str):
+        """Stop whatever a disconnected session was typing"""
+        await self.emit_typing_stopped(self.typing_service.disconnect(session_id))
+
+    def start_typing_expiry(self):
+        """Start the timer that stops users who went quiet mid-typing"""
+        if self._typing_expiry is None:
+            self._typing_expiry = asyncio.get_running_loop().create_task(self._expire_typing())
+
+    def stop_typing_expiry(self):
+        if self._typing_expiry is not None:
+            self._typing_expiry.cancel()
+            self._typing_expiry = None
+
+    async def _expire_typing(self):
+        while True:
+            await asyncio.sleep(self.typing_service.ttl / 2)
+            try:
+                await self.emit_typing_stopped(self.typing_service.expire())
+            except Exception as e:
+                print(f"Error expiring typing indicators: {e}")
+
     async def emit_message_to_conversation(self, conversation_id: int, message_data: dict, exclude_sid: str = None):
         """Emit a message to all participants in a conversation"""
-        # Get all participants in the conversation
-        conversation = self.chat_service.get_conversation(conversation_id)
-        if not conversation:
-            return
-
-        for participant in conversation.participants:
-            sessions = self.connection_service.get_user_sessions(participant.id)
-            for session_id in sessions:
-                if session_id != exclude_sid:
-                    await self.sio.emit(
-                        SocketEvents.CHAT_MESSAGE,
-                        message_data,
-                        to=session_id
-                    )
+        await self.sio.emit(
+            SocketEvents.CHAT_MESSAGE,
+            message_data,
+            room=conversation_room(conversation_id),
+            skip_sid=exclude_sid
+        )
 
     async def emit_message_read_to_conversation(self, conversation_id: int, read_data: dict, exclude_sid: str = None):
         """Emit message read confirmation to all participants"""
-        conversation = self.chat_service.get_conversation(conversation_id)
-        if not conversation:
-            return
-
-        for participant in conversation.participants:
-            sessions = self.connection_service.get_user_sessions(participant.id)
-            for session_id in sessions:
-                if session_id != exclude_sid:
-                    await self.sio.emit(
-                        SocketEvents.MESSAGE_READ,
-                        read_data,
-                        to=session_id
-                    )
+        await self.sio.emit(
+            SocketEvents.MESSAGE_READ,
+            read_data,
+            room=conversation_room(conversation_id),
+            skip_sid=exclude_sid
+        )
 
     async def emit_message_deleted_to_conversation(self, conversation_id: int, delete_data: dict, exclude_sid: str = None):
         """Emit message deletion to all participants"""
-        conversation = self.chat_service.get_conversation(conversation_id)
-        if not conversation:
-            return
-
-        for participant in conversation.participants:
-            sessions = self.connection_service.get_user_sessions(participant.id)
-            for session_id in sessions:
-                if session_id != exclude_sid:
-                    await self.sio.emit(
-                        "message_deleted",
-                        delete_data,
-                        to=session_id
-                    )
+        await self.sio.emit(
+            "message_deleted",
+            delete_data,
+            room=conversation_room(conversation_id),
+            skip_sid=exclude_sid
+        )
 
     async def emit_message_edited_to_conversation(self, conversation_id: int, edit_data: dict, exclude_sid: str = None):
         """Emit message edit to all participants"""
-        conversation = self.chat_service.get_conversation(conversation_id)
-        if not conversation:
-            return
-
-        for participant in conversation.participants:
-            sessions = self.connection_service.get_user_sessions(participant.id)
-            for session_id in sessions:
-                if session_id != exclude_sid:
-                    await self.sio.emit(
-                        "message_edited",
-                        edit_data,
-                        to=session_id
-                    )
+        await self.sio.emit(
+            "message_edited",
+            edit_data,
+            room=conversation_room(conversation_id),
+            skip_sid=exclude_sid
+        )
 
     async def emit_typing_to_conversation(self, conversation_id: int, typing_data: dict, exclude_sid: str = None):
         """Emit typing indicator to all participants in a conversation"""
-        conversation = self.chat_service.get_conversation(conversation_id)
-        if not conversation:
-            return
-
-        for participant in conversation.participants:
-            if participant.id != typing_data['user_id']:  # Don't send to the typing user
-                sessions = self.connection_service.get_user_sessions(participant.id)
-                for session_id in sessions:
-                    if session_id != exclude_sid:
-                        await self.sio.emit(
-                            SocketEvents.TYPING_START if typing_data['typing'] else SocketEvents.TYPING_STOP,
-                            typing_data,
-                            to=session_id
-                        )
+        # Don't send to any of the typing user's devices
+        skip_sids = self.connection_service.get_user_sessions(typing_data['user_id'])
+        if exclude_sid and exclude_sid not in skip_sids:
+            skip_sids.append(exclude_sid)
+        await self.sio.emit(
+            SocketEvents.TYPING_START if typing_data['typing'] else SocketEvents.TYPING_STOP,
+            typing_data,
+            room=conversation_room(conversation_id),
+            skip_sid=skip_sids
+        )
@@ -0,0 +1,311 @@
+"""Pub/sub transports that let several Socket.IO workers act as one server.
+
+A transport carries opaque byte messages on named channels:
+
+- MemoryTransport: servers in the same process (tests, benchmarks)
+- UnixSocketTransport: worker processes on one host. The first worker to
+  take the lock file serves the broker on a Unix socket and every worker
+  (itself included) connects to it; if it exits, a survivor takes over.
+  Socket and lock live in a private (0700) directory, since the workers
+  unpickle what the broker relays.
+- RedisTransport: Redis pub/sub, for workers spread over several hosts
+
+TransportManager adapts any of them to python-socketio's client manager, so
+emits, room changes and disconnects reach sessions held by other workers.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import pickle
+import struct
+from collections import defaultdict
+from typing import AsyncIterator
+
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # pragma: no cover
+    try:
+        import aioredis
+    except ImportError:
+        aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# Frame header: payload length, op, channel length; the channel follows, then the payload
+_HEADER = struct.Struct(">IcH")
+_SUBSCRIBE, _PUBLISH, _MESSAGE = b"S", b"P", b"M"
+
+# A subscriber that lets this much pile up unread is dropped; it resyncs on reconnect
+_MAX_SUBSCRIBER_BUFFER = 16 * 1024 * 1024
+
+
+def _frame(op: bytes, channel: str, payload: bytes = b"") -> bytes:
+    name = channel.encode()
+    return _HEADER.pack(len(payload), op, len(name)) + name + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> tuple[bytes, str, bytes]:
+    size, op, name_size = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    channel = (await reader.readexactly(name_size)).decode()
+    payload = await reader.readexactly(size) if size else b""
+    return op, channel, payload
+
+
+class MemoryTransport:
+    """Delivers messages to subscribers in the same process"""
+
+    def __init__(self):
+        self._queues: dict[str, set[asyncio.Queue]] = defaultdict(set)
+
+    async def publish(self, channel: str, data: bytes):
+        for queue in self._queues.get(channel, ()):
+            queue.put_nowait(data)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        queue = asyncio.Queue()
+        self._queues[channel].add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues[channel].discard(queue)
+
+    async def close(self):
+        self._queues.clear()
+
+
+class LocalBroker:
+    """Fans published frames out to every connection subscribed to the channel"""
+
+    def __init__(self):
+        self._subscribers: dict[str, set[asyncio.StreamWriter]] = defaultdict(set)
+        self._connections: set[asyncio.StreamWriter] = set()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channels = set()
+        self._connections.add(writer)
+        try:
+            while True:
+                op, channel, payload = await _read_frame(reader)
+                if op == _SUBSCRIBE:
+                    self._subscribers[channel].add(writer)
+                    channels.add(channel)
+                elif op == _PUBLISH:
+                    frame = _frame(_MESSAGE, channel, payload)
+                    for subscriber in list(self._subscribers.get(channel, ())):
+                        if subscriber.transport.get_write_buffer_size() > _MAX_SUBSCRIBER_BUFFER:
+                            subscriber.close()
+                            continue
+                        subscriber.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for channel in channels:
+                self._subscribers[channel].discard(writer)
+            self._connections.discard(writer)
+            writer.close()
+
+    def close(self):
+        """Drop every connection, so the workers reconnect to the next broker"""
+        for writer in list(self._connections):
+            writer.close()
+
+
+def _ensure_private_dir(path: str):
+    """Create path with mode 0700, or check an existing one is ours and closed to others"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(
+            f"Socket.IO broker directory {path} must be owned by this user with mode 0700"
+        )
+
+
+class UnixSocketTransport:
+    """Pub/sub through a broker on a Unix socket, for workers on one host.
+
+    Whichever worker holds an flock on "<path>.lock" serves the broker; the
+    lock is released when that process exits, and the next worker to retry
+    binds a fresh socket. Messages published while no broker is up wait up
+    to publish_timeout for one and are then dropped; the connection is
+    re-established and re-subscribed automatically.
+
+    The directory holding the socket is created with mode 0700 and must be
+    owned by this user and closed to everyone else, and the socket itself
+    must be ours, so no other local user can act as the broker.
+    """
+
+    def __init__(self, path: str, retry_interval: float = 0.5, publish_timeout: float = 2.0):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.publish_timeout = publish_timeout
+        self._queues: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self._writer: asyncio.StreamWriter | None = None
+        self._connected: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._lock_fd: int | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._broker: LocalBroker | None = None
+
+    @property
+    def serving(self) -> bool:
+        return self._server is not None
+
+    def _start(self):
+        if self._task is None:
+            _ensure_private_dir(os.path.dirname(os.path.abspath(self.path)))
+            self._connected = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _serve_if_unclaimed(self):
+        if self._server is not None:
+            return
+        fd = os.open(f"{self.path}.lock", os.O_CREAT | os.O_RDWR | os.O_NOFOLLOW, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return
+        self._lock_fd = fd
+        # Whoever served before us is gone; its socket file is stale
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._broker = LocalBroker()
+        self._server = await asyncio.start_unix_server(self._broker.handle, self.path)
+        logger.info("Socket.IO broker serving on %s (pid %s)", self.path, os.getpid())
+
+    async def _run(self):
+        while True:
+            try:
+                await self._serve_if_unclaimed()
+                if os.stat(self.path).st_uid != os.getuid():
+                    logger.error("Refusing Socket.IO broker %s: owned by another user", self.path)
+                    await asyncio.sleep(self.retry_interval)
+                    continue
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.retry_interval)
+                continue
+            try:
+                # Set first, so a channel subscribed during the drain sends its own frame
+                self._writer = writer
+                for channel in list(self._queues):
+                    writer.write(_frame(_SUBSCRIBE, channel))
+                await writer.drain()
+                self._connected.set()
+                while True:
+                    _, channel, payload = await _read_frame(reader)
+                    for queue in self._queues.get(channel, ()):
+                        queue.put_nowait(payload)
+            except (asyncio.IncompleteReadError, OSError):
+                logger.warning("Lost the Socket.IO broker at %s, reconnecting", self.path)
+            finally:
+                self._connected.clear()
+                self._writer = None
+                writer.close()
+
+    async def publish(self, channel: str, data: bytes):
+        self._start()
+        deadline = asyncio.get_running_loop().time() + self.publish_timeout
+        while True:
+            try:
+                await asyncio.wait_for(self._connected.wait(), deadline - asyncio.get_running_loop().time())
+            except asyncio.TimeoutError:
+                logger.warning("No Socket.IO broker at %s, dropped a message on %s", self.path, channel)
+                return
+            writer = self._writer
+            if writer is not None:
+                writer.write(_frame(_PUBLISH, channel, data))
+                await writer.drain()
+                return
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        self._start()
+        queue = asyncio.Queue()
+        first = channel not in self._queues
+        self._queues[channel].add(queue)
+        if first and self._writer is not None:
+            self._writer.write(_frame(_SUBSCRIBE, channel))
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues[channel].discard(queue)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._server is not None:
+            self._server.close()
+            self._broker.close()
+            self._server = self._broker = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+class RedisTransport:
+    """Redis pub/sub, for workers on several hosts"""
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("Redis package is not installed (pip install redis)")
+        self.redis = aioredis.Redis.from_url(url)
+
+    async def publish(self, channel: str, data: bytes):
+        await self.redis.publish(channel, data)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"]
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+
+    async def close(self):
+        await self.redis.close()
+
+
+class TransportManager(AsyncPubSubManager):
+    """Socket.IO client manager that relays through a pub/sub transport"""
+
+    name = "transport"
+
+    def __init__(self, transport, channel: str = "socketio", retry_interval: float = 1.0,
+                 write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.transport = transport
+        self.retry_interval = retry_interval
+
+    async def _publish(self, data):
+        await self.transport.publish(self.channel, pickle.dumps(data))
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self.transport.subscribe(self.channel):
+                    yield message
+            except Exception:
+                self._get_logger().exception("Socket.IO pub/sub listener failed, resubscribing")
+                await asyncio.sleep(self.retry_interval)
+
+
+def create_transport(kind: str, redis_url: str = None, broker_path: str = None):
+    """Build the transport for a SOCKETIO_MANAGER setting; None means single process"""
+    if kind == "memory":
+        return None
+    if kind == "unix":
+        return UnixSocketTransport(broker_path)
+    if kind == "redis":
+        return RedisTransport(redis_url)
+    raise ValueError(f"Unknown Socket.IO manager: {kind!r} (expected memory, unix or redis)")
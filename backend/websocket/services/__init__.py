@@ -1,5 +1,14 @@
-from .chat_service import ChatService
+from .chat_service import ChatService, recent_client_messages
+from .async_chat_service import AsyncChatService
 from .notification_service import NotificationService
 from .connection_service import ConnectionService
+from .membership_service import MembershipService, membership_service
+from .typing_service import TypingService, typing_service
+from .read_receipt_service import ReadReceiptService, read_receipt_service
+from .message_pipeline import MessagePipeline, message_pipeline
 
-__all__ = ['ChatService', 'NotificationService', 'ConnectionService']
+__all__ = [
+    'ChatService', 'recent_client_messages', 'AsyncChatService', 'NotificationService', 'ConnectionService',
+    'MembershipService', 'membership_service', 'TypingService', 'typing_service',
+    'ReadReceiptService', 'read_receipt_service', 'MessagePipeline', 'message_pipeline',
+]
@@ -0,0 +1,34 @@
+from typing import Callable, TypeVar
+from database.executor import run_db
+from database.session import unit_of_work
+from .chat_service import ChatService
+
+T = TypeVar("T")
+
+
+def _in_unit_of_work(fn: Callable[..., T], *args, **kwargs) -> T:
+    with unit_of_work() as db:
+        return fn(db, *args, **kwargs)
+
+
+class AsyncChatService:
+    """Awaitable facade over ChatService.
+
+    Every ChatService method is exposed under the same name and signature, but
+    runs on the bounded DB executor instead of the event loop. Use
+    ``transaction`` to run several calls in one unit of work.
+    """
+
+    async def transaction(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run ``fn(db, *args, **kwargs)`` in one session and transaction on the DB executor"""
+        return await run_db(_in_unit_of_work, fn, *args, **kwargs)
+
+    def __getattr__(self, name: str):
+        method = getattr(ChatService, name)
+
+        async def call(*args, **kwargs):
+            return await run_db(method, *args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
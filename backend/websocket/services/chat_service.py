@@ -1,17 +1,117 @@
+from contextlib import contextmanager
 from datetime import datetime
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from database.models import Conversation, Message, User, message_reads
-from database.session import SessionLocal
+from typing import Iterator
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import and_, func, insert, or_, select, tuple_, update
+from core.cache import TTLCache
+from core.config import settings
+from database.models import ChatChange, Conversation, Message, User
+from database.models.chat_change import CHANGE_DELETE, CHANGE_EDIT, CHANGE_MESSAGE, CHANGE_READ
+from database.models.conversation import LAST_MESSAGE_PREVIEW_LENGTH, conversation_participants
+from database.search import rank_conversations, rank_messages
+from database.session import unit_of_work
+from .membership_service import membership_service
+
+
+# (sender_id, client_message_id) -> Message, for messages committed recently,
+# so retried sends are answered without touching the database. The unique
+# index on messages catches retries that fall outside the window.
+recent_client_messages = TTLCache(
+    maxsize=settings.CLIENT_MESSAGE_ID_WINDOW_SIZE,
+    ttl=settings.CLIENT_MESSAGE_ID_WINDOW_SECONDS,
+)
+
+# Keyset pagination position: (created_at, id), or just a message id
+MessageCursor = tuple[datetime, int] | int | None
+
+
+def _cursor_position(cursor: tuple[datetime, int] | int):
+    if isinstance(cursor, int):
+        created_at = select(Message.created_at).where(Message.id == cursor).scalar_subquery()
+        return tuple_(created_at, cursor)
+    return tuple_(*cursor)
+
+
+def _last_message_fields(message: Message | None) -> dict:
+    """Conversation columns that mirror its latest message"""
+    if message is None:
+        return {
+            Conversation.last_message_id: None,
+            Conversation.last_message_at: None,
+            Conversation.last_message_preview: None,
+            Conversation.last_message_type: None,
+            Conversation.last_sender_id: None,
+        }
+    return {
+        Conversation.last_message_id: message.id,
+        Conversation.last_message_at: message.created_at,
+        Conversation.last_message_preview: message.content[:LAST_MESSAGE_PREVIEW_LENGTH],
+        Conversation.last_message_type: message.content_type,
+        Conversation.last_sender_id: message.sender_id,
+    }
+
+
+def _log_changes(db: Session, kind: str, messages: list[Message]):
+    """Append message changes to the sync log, in the caller's transaction"""
+    db.execute(insert(ChatChange), [
+        {"conversation_id": message.conversation_id, "kind": kind, "message_id": message.id}
+        for message in messages
+    ])
+
+
+def _advance_read_cursor(db: Session, conversation_id: int, user_id: int, message_id: int | None) -> bool:
+    """Move a participant's read cursor forward to message_id (never backwards)
+
+    Returns whether the cursor moved; a move is logged for sync.
+    """
+    if message_id is None:
+        return False
+    moved = db.execute(
+        update(conversation_participants).where(
+            and_(
+                conversation_participants.c.conversation_id == conversation_id,
+                conversation_participants.c.user_id == user_id,
+                or_(
+                    conversation_participants.c.last_read_message_id == None,
+                    conversation_participants.c.last_read_message_id < message_id
+                )
+            )
+        ).values(last_read_message_id=message_id, last_read_at=datetime.utcnow())
+    ).rowcount > 0
+    if moved:
+        db.execute(insert(ChatChange).values(
+            conversation_id=conversation_id, kind=CHANGE_READ, user_id=user_id, message_id=message_id,
+        ))
+    return moved
+
+
+# Most recent activity first; conversations without messages sort by creation
+_inbox_order = func.coalesce(Conversation.last_message_at, Conversation.created_at).desc()
+
+
+@contextmanager
+def _session(db: Session | None) -> Iterator[Session]:
+    """Join the caller's unit of work, or run in a short-lived one of our own"""
+    if db is not None:
+        yield db
+        return
+    with unit_of_work() as own:
+        yield own
+
 
 class ChatService:
-    """Business logic for chat operations"""
+    """Business logic for chat operations
+
+    Every method accepts an optional ``db`` session. Pass the session of an
+    enclosing ``unit_of_work()`` to run several calls on one connection and in
+    one transaction; writes are then flushed but committed by the caller.
+    Without it, each call runs in its own unit of work.
+    """
 
     @staticmethod
-    def create_conversation(user_ids: list[int], name: str = None, created_by_id: int = None, description: str = None) -> Conversation:
+    def create_conversation(user_ids: list[int], name: str = None, created_by_id: int = None, description: str = None, db: Session = None) -> Conversation:
         """Create a new conversation"""
-        db = SessionLocal()
-        try:
+        with _session(db) as db:
             participants = db.query(User).filter(User.id.in_(user_ids)).all()
 
             is_group = len(user_ids) > 2 if name or description else len(user_ids) > 2
@@ -24,72 +124,140 @@ class ChatService:
             )
             conversation.participants = participants
             db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
+            db.flush()
+            membership_service.conversation_created(db, conversation.id, [p.id for p in participants])
             return conversation
-        finally:
-            db.close()
 
     @staticmethod
-    def get_conversation(conversation_id: int) -> Conversation | None:
+    def get_conversation(conversation_id: int, db: Session = None) -> Conversation | None:
         """Get conversation by ID"""
-        db = SessionLocal()
-        try:
+        with _session(db) as db:
             return db.query(Conversation).filter(
                 and_(
                     Conversation.id == conversation_id,
                     Conversation.deleted_at == None
                 )
             ).first()
-        finally:
-            db.close()
 
     @staticmethod
-    def get_user_conversations(user_id: int, limit: int = 50, offset: int = 0):
+    def get_message(message_id: int, db: Session = None) -> Message | None:
+        """Get message by ID"""
+        with _session(db) as db:
+            return db.get(Message, message_id)
+
+    @staticmethod
+    def get_message_owner(message_id: int, db: Session = None) -> tuple[int, int] | None:
+        """Get (conversation_id, sender_id) of a message without loading the row"""
+        with _session(db) as db:
+            row = db.execute(
+                select(Message.conversation_id, Message.sender_id).where(Message.id == message_id)
+            ).first()
+            return tuple(row) if row else None
+
+    @staticmethod
+    def get_user(user_id: int, db: Session = None) -> User | None:
+        """Get user by ID"""
+        with _session(db) as db:
+            return db.get(User, user_id)
+
+    @staticmethod
+    def get_users(user_ids: set[int], db: Session = None) -> list[User]:
+        """Get several users in one query"""
+        if not user_ids:
+            return []
+        with _session(db) as db:
+            return db.query(User).filter(User.id.in_(user_ids)).all()
+
+    @staticmethod
+    def get_user_conversations(user_id: int, limit: int = 50, offset: int = 0, db: Session = None):
         """Get all conversations for a user"""
-        db = SessionLocal()
-        try:
-            conversations = db.query(Conversation).join(
+        with _session(db) as db:
+            return db.query(Conversation).join(
                 Conversation.participants
             ).filter(
                 and_(
                     User.id == user_id,
                     Conversation.deleted_at == None
                 )
+            ).options(
+                selectinload(Conversation.participants),
+                selectinload(Conversation.last_sender),
             ).order_by(
-                Conversation.updated_at.desc()
+                _inbox_order
             ).limit(limit).offset(offset).all()
-            return conversations
-        finally:
-            db.close()
 
     @staticmethod
-    def search_conversations(user_id: int, query: str, limit: int = 20) -> list:
-        """Search conversations by name"""
-        db = SessionLocal()
-        try:
-            search_query = f"%{query}%"
-            conversations = db.query(Conversation).join(
-                Conversation.participants
+    def search_conversations(user_id: int, query: str, limit: int = 20, db: Session = None) -> list:
+        """Search the user's conversations by name, best match first"""
+        with _session(db) as db:
+            conversations = rank_conversations(
+                db.query(Conversation).join(
+                    Conversation.participants
+                ).filter(
+                    and_(
+                        User.id == user_id,
+                        Conversation.deleted_at == None
+                    )
+                ),
+                query
+            )
+            if conversations is None:
+                return []
+            return conversations.options(
+                selectinload(Conversation.participants),
+                selectinload(Conversation.last_sender),
+            ).limit(limit).all()
+
+    @staticmethod
+    def get_read_by(message_ids: list[int], db: Session = None) -> dict[int, list[int]]:
+        """Get the ids of users who read each message, derived from read cursors"""
+        if not message_ids:
+            return {}
+        with _session(db) as db:
+            read_by: dict[int, list[int]] = {message_id: [] for message_id in message_ids}
+            rows = db.execute(
+                select(Message.id, conversation_participants.c.user_id).join(
+                    conversation_participants,
+                    conversation_participants.c.conversation_id == Message.conversation_id
+                ).where(
+                    and_(
+                        Message.id.in_(message_ids),
+                        conversation_participants.c.user_id != Message.sender_id,
+                        conversation_participants.c.last_read_message_id >= Message.id
+                    )
+                )
+            )
+            for message_id, user_id in rows:
+                read_by[message_id].append(user_id)
+            return read_by
+
+    @staticmethod
+    def get_unread_counts(conversation_ids: list[int], user_id: int, db: Session = None) -> dict[int, int]:
+        """Get counts of messages after the user's read cursor, in one grouped query"""
+        if not conversation_ids:
+            return {}
+        with _session(db) as db:
+            rows = db.query(Message.conversation_id, func.count(Message.id)).join(
+                conversation_participants,
+                and_(
+                    conversation_participants.c.conversation_id == Message.conversation_id,
+                    conversation_participants.c.user_id == user_id
+                )
             ).filter(
                 and_(
-                    User.id == user_id,
-                    Conversation.deleted_at == None,
-                    Conversation.name.ilike(search_query)
+                    Message.conversation_id.in_(conversation_ids),
+                    Message.id > func.coalesce(conversation_participants.c.last_read_message_id, 0),
+                    Message.is_deleted == False,
+                    Message.sender_id != user_id
                 )
-            ).order_by(
-                Conversation.updated_at.desc()
-            ).limit(limit).all()
-            return conversations
-        finally:
-            db.close()
+            ).group_by(Message.conversation_id).all()
+            return dict(rows)
 
     @staticmethod
-    def update_conversation(conversation_id: int, name: str = None, description: str = None, avatar_url: str = None) -> Conversation | None:
+    def update_conversation(conversation_id: int, name: str = None, description: str = None, avatar_url: str = None, db: Session = None) -> Conversation | None:
         """Update conversation details"""
-        db = SessionLocal()
-        try:
-            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        with _session(db) as db:
+            conversation = db.get(Conversation, conversation_id)
             if conversation:
                 if name:
                     conversation.name = name
@@ -98,183 +266,274 @@ class ChatService:
                 if avatar_url:
                     conversation.avatar_url = avatar_url
                 conversation.updated_at = datetime.utcnow()
-                db.commit()
-                db.refresh(conversation)
+                db.flush()
             return conversation
-        finally:
-            db.close()
 
     @staticmethod
-    def delete_conversation(conversation_id: int):
+    def delete_conversation(conversation_id: int, db: Session = None):
         """Soft delete a conversation"""
-        db = SessionLocal()
-        try:
-            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        with _session(db) as db:
+            conversation = db.get(Conversation, conversation_id)
             if conversation:
                 conversation.deleted_at = datetime.utcnow()
-                db.commit()
+                db.flush()
+                membership_service.conversation_deleted(db, conversation.id, [p.id for p in conversation.participants])
             return conversation
-        finally:
-            db.close()
 
     @staticmethod
-    def create_message(
-        conversation_id: int,
-        sender_id: int,
-        content: str,
-        content_type: str = "text",
-        media_url: str = None
-    ) -> Message:
-        """Create a new message"""
-        db = SessionLocal()
-        try:
-            message = Message(
-                conversation_id=conversation_id,
-                sender_id=sender_id,
-                content=content,
-                content_type=content_type,
-                media_url=media_url
-            )
-            db.add(message)
+    def get_client_messages(keys: list[tuple[int, str]], db: Session = None) -> dict[tuple[int, str], Message]:
+        """Find messages by (sender_id, client_message_id), in one query"""
+        if not keys:
+            return {}
+        with _session(db) as db:
+            messages = db.query(Message).filter(
+                tuple_(Message.sender_id, Message.client_message_id).in_(keys)
+            ).all()
+            return {(message.sender_id, message.client_message_id): message for message in messages}
 
-            conversation = db.query(Conversation).filter(
-                Conversation.id == conversation_id
-            ).first()
-            if conversation:
-                conversation.updated_at = datetime.utcnow()
+    @staticmethod
+    def create_messages(messages: list[dict], db: Session) -> list[tuple[Message, bool]]:
+        """Insert several messages in the caller's transaction
 
-            db.commit()
-            db.refresh(message)
-            return message
-        finally:
-            db.close()
+        Each dict holds Message fields (conversation_id, sender_id, content,
+        content_type, media_url and optionally client_message_id). Returns
+        (message, created) per dict, in order. A dict whose client id the
+        sender already used, in the database or earlier in the batch, gets
+        that message back with created=False and is not inserted.
+
+        New rows are inserted in order by a single flush. Each
+        conversation's last-message columns are updated once, from its
+        newest message in the batch.
+        """
+        keys = list({
+            (fields["sender_id"], fields["client_message_id"])
+            for fields in messages if fields.get("client_message_id")
+        })
+        existing = ChatService.get_client_messages(keys, db=db)
+        results: list[tuple[Message, bool]] = []
+        created: list[Message] = []
+        for fields in messages:
+            key = (fields["sender_id"], fields.get("client_message_id"))
+            if key in existing:
+                results.append((existing[key], False))
+                continue
+            message = Message(**fields)
+            if key[1]:
+                existing[key] = message
+            created.append(message)
+            results.append((message, True))
+        if not created:
+            return results
+
+        db.add_all(created)
+        db.flush()
+        _log_changes(db, CHANGE_MESSAGE, created)
+        newest: dict[int, Message] = {}
+        for message in created:
+            newest[message.conversation_id] = message
+        now = datetime.utcnow()
+        for conversation_id, message in newest.items():
+            db.query(Conversation).filter(
+                Conversation.id == conversation_id
+            ).update({
+                Conversation.updated_at: now,
+                **_last_message_fields(message),
+            })
+        return results
 
     @staticmethod
-    def get_messages(conversation_id: int, limit: int = 50, offset: int = 0):
-        """Get messages from a conversation"""
-        db = SessionLocal()
-        try:
-            messages = db.query(Message).filter(
+    def get_messages(
+        conversation_id: int,
+        limit: int = 50,
+        offset: int = 0,
+        db: Session = None,
+        before: MessageCursor = None,
+        after: MessageCursor = None,
+    ):
+        """Get messages from a conversation, oldest first
+
+        ``before``/``after`` page by keyset on (created_at, id), which walks
+        ix_messages_conversation_created and stays stable while new messages
+        arrive. A cursor is a (created_at, id) pair, or a bare message id whose
+        created_at is looked up in the same query. ``offset`` is kept for older
+        clients and ignored when a cursor is given.
+        """
+        with _session(db) as db:
+            query = db.query(Message).filter(
                 and_(
                     Message.conversation_id == conversation_id,
                     Message.is_deleted == False
                 )
-            ).order_by(
-                Message.created_at.desc()
-            ).limit(limit).offset(offset).all()
+            )
+            position = tuple_(Message.created_at, Message.id)
+            if after is not None:
+                messages = query.filter(
+                    position > _cursor_position(after)
+                ).order_by(
+                    Message.created_at.asc(), Message.id.asc()
+                ).limit(limit).all()
+                return messages
+
+            query = query.order_by(Message.created_at.desc(), Message.id.desc())
+            if before is not None:
+                query = query.filter(position < _cursor_position(before))
+            else:
+                query = query.offset(offset)
+            messages = query.limit(limit).all()
             return list(reversed(messages))
-        finally:
-            db.close()
 
     @staticmethod
-    def search_messages(conversation_id: int, query: str, limit: int = 20) -> list:
-        """Search messages in a conversation"""
-        db = SessionLocal()
-        try:
-            search_query = f"%{query}%"
-            messages = db.query(Message).filter(
-                and_(
-                    Message.conversation_id == conversation_id,
-                    Message.is_deleted == False,
-                    Message.content.ilike(search_query)
-                )
-            ).order_by(
-                Message.created_at.desc()
-            ).limit(limit).all()
-            return list(reversed(messages))
-        finally:
-            db.close()
+    def search_messages(conversation_id: int, query: str, limit: int = 20, db: Session = None) -> list:
+        """Search messages in a conversation, best match first"""
+        with _session(db) as db:
+            messages = rank_messages(
+                db.query(Message).filter(
+                    and_(
+                        Message.conversation_id == conversation_id,
+                        Message.is_deleted == False
+                    )
+                ),
+                query
+            )
+            if messages is None:
+                return []
+            return messages.limit(limit).all()
+
+    @staticmethod
+    def search_user_messages(user_id: int, query: str, limit: int = 20, db: Session = None) -> list:
+        """Search messages across all of the user's conversations, best match first"""
+        with _session(db) as db:
+            messages = rank_messages(
+                db.query(Message).join(
+                    conversation_participants,
+                    conversation_participants.c.conversation_id == Message.conversation_id
+                ).join(
+                    Conversation, Conversation.id == Message.conversation_id
+                ).filter(
+                    and_(
+                        conversation_participants.c.user_id == user_id,
+                        Conversation.deleted_at == None,
+                        Message.is_deleted == False
+                    )
+                ),
+                query
+            )
+            if messages is None:
+                return []
+            return messages.limit(limit).all()
 
     @staticmethod
-    def mark_message_as_read(message_id: int, user_id: int):
-        """Mark a message as read by a user"""
-        db = SessionLocal()
-        try:
-            message = db.query(Message).filter(Message.id == message_id).first()
+    def mark_message_as_read(message_id: int, user_id: int, db: Session = None):
+        """Mark a message, and everything before it, as read by a user"""
+        with _session(db) as db:
+            message = db.get(Message, message_id)
             if message:
-                # Add user to read_by if not already there
-                user = db.query(User).filter(User.id == user_id).first()
-                if user and user not in message.read_by:
-                    message.read_by.append(user)
-                    db.commit()
-                    db.refresh(message)
+                _advance_read_cursor(db, message.conversation_id, user_id, message.id)
             return message
-        finally:
-            db.close()
 
     @staticmethod
-    def mark_conversation_messages_as_read(conversation_id: int, user_id: int):
-        """Mark all messages in a conversation as read by a user"""
-        db = SessionLocal()
-        try:
-            messages = db.query(Message).filter(
-                and_(
-                    Message.conversation_id == conversation_id,
-                    Message.is_deleted == False
-                )
-            ).all()
+    def mark_read_up_to(conversation_id: int, user_id: int, message_id: int, db: Session = None) -> bool:
+        """Mark every message up to message_id as read; False if the cursor was already there"""
+        with _session(db) as db:
+            return _advance_read_cursor(db, conversation_id, user_id, message_id)
 
-            user = db.query(User).filter(User.id == user_id).first()
-            if user:
-                for message in messages:
-                    if user not in message.read_by:
-                        message.read_by.append(user)
-                db.commit()
-        finally:
-            db.close()
+    @staticmethod
+    def mark_conversation_messages_as_read(conversation_id: int, user_id: int, db: Session = None):
+        """Mark all messages in a conversation as read by a user"""
+        with _session(db) as db:
+            latest_id = db.execute(
+                select(func.max(Message.id)).where(Message.conversation_id == conversation_id)
+            ).scalar()
+            if latest_id is not None:  # nothing to read in an empty conversation
+                _advance_read_cursor(db, conversation_id, user_id, latest_id)
 
     @staticmethod
-    def get_unread_count(conversation_id: int, user_id: int) -> int:
+    def get_unread_count(conversation_id: int, user_id: int, db: Session = None) -> int:
         """Get count of unread messages in a conversation for a user"""
-        db = SessionLocal()
-        try:
-            # Count messages not read by this user
-            from sqlalchemy import func
-            unread = db.query(func.count(Message.id)).filter(
-                and_(
-                    Message.conversation_id == conversation_id,
-                    Message.is_deleted == False,
-                    Message.sender_id != user_id,
-                    ~Message.read_by.any(User.id == user_id)
-                )
-            ).scalar()
-            return unread or 0
-        finally:
-            db.close()
+        return ChatService.get_unread_counts([conversation_id], user_id, db=db).get(conversation_id, 0)
 
     @staticmethod
-    def delete_message(message_id: int):
+    def delete_message(message_id: int, db: Session = None):
         """Soft delete a message"""
-        db = SessionLocal()
-        try:
-            message = db.query(Message).filter(Message.id == message_id).first()
+        with _session(db) as db:
+            message = db.get(Message, message_id)
             if message:
                 message.is_deleted = True
-                db.commit()
+                db.flush()
+                _log_changes(db, CHANGE_DELETE, [message])
+                conversation = db.get(Conversation, message.conversation_id)
+                if conversation is not None and conversation.last_message_id == message.id:
+                    # Fall back to the previous message
+                    previous = db.query(Message).filter(
+                        and_(
+                            Message.conversation_id == message.conversation_id,
+                            Message.is_deleted == False
+                        )
+                    ).order_by(
+                        Message.created_at.desc(), Message.id.desc()
+                    ).first()
+                    db.query(Conversation).filter(
+                        Conversation.id == conversation.id
+                    ).update(_last_message_fields(previous))
             return message
-        finally:
-            db.close()
 
     @staticmethod
-    def edit_message(message_id: int, content: str):
+    def edit_message(message_id: int, content: str, db: Session = None):
         """Edit a message"""
-        db = SessionLocal()
-        try:
-            message = db.query(Message).filter(Message.id == message_id).first()
+        with _session(db) as db:
+            message = db.get(Message, message_id)
             if message:
                 message.content = content
                 message.edited_at = datetime.utcnow()
-                db.commit()
-                db.refresh(message)
+                db.flush()
+                _log_changes(db, CHANGE_EDIT, [message])
+                db.query(Conversation).filter(
+                    and_(
+                        Conversation.id == message.conversation_id,
+                        Conversation.last_message_id == message.id
+                    )
+                ).update({
+                    Conversation.last_message_preview: content[:LAST_MESSAGE_PREVIEW_LENGTH],
+                })
             return message
-        finally:
-            db.close()
 
     @staticmethod
-    def get_or_create_dm_conversation(user_id_1: int, user_id_2: int) -> Conversation:
+    def get_latest_change_id(db: Session = None) -> int:
+        """Current end of the sync log; 0 while it is empty
+
+        Ids become visible in commit order only on SQLite (see ChatChange).
+        """
+        with _session(db) as db:
+            return db.execute(select(func.max(ChatChange.id))).scalar() or 0
+
+    @staticmethod
+    def get_changes(user_id: int, since: int, until: int, limit: int = 1000, db: Session = None) -> list[ChatChange]:
+        """Log entries in (since, until] of the live conversations a user takes part in, oldest first
+
+        Membership is read in the same query rather than from the membership
+        index, which may be stale: a skipped change would never be replayed.
+        """
+        with _session(db) as db:
+            return db.query(ChatChange).join(
+                conversation_participants,
+                and_(
+                    conversation_participants.c.conversation_id == ChatChange.conversation_id,
+                    conversation_participants.c.user_id == user_id
+                )
+            ).join(
+                Conversation, Conversation.id == ChatChange.conversation_id
+            ).filter(
+                and_(
+                    Conversation.deleted_at == None,
+                    ChatChange.id > since,
+                    ChatChange.id <= until
+                )
+            ).order_by(ChatChange.id).limit(limit).all()
+
+    @staticmethod
+    def get_or_create_dm_conversation(user_id_1: int, user_id_2: int, db: Session = None) -> Conversation:
         """Get or create a direct message conversation between two users"""
-        db = SessionLocal()
-        try:
+        with _session(db) as db:
             conversation = db.query(Conversation).join(
                 Conversation.participants
             ).filter(
@@ -284,7 +543,7 @@ class ChatService:
                     User.id.in_([user_id_1, user_id_2])
                 )
             ).group_by(Conversation.id).having(
-                db.func.count(User.id) == 2
+                func.count(User.id) == 2
             ).first()
 
             if conversation:
@@ -297,8 +556,6 @@ class ChatService:
             )
             conversation.participants = participants
             db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
+            db.flush()
+            membership_service.conversation_created(db, conversation.id, [p.id for p in participants])
             return conversation
-        finally:
-            db.close()
@@ -1,20 +1,61 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
 from typing import Dict, Set
 
+logger = logging.getLogger(__name__)
+
+
 class ConnectionService:
-    """Manages WebSocket connections for users"""
-    
-    def __init__(self):
+    """Manages WebSocket connections for users
+
+    Sessions of this worker live in active_connections. Given a pub/sub
+    transport (see websocket.pubsub), every worker also publishes its
+    connects and disconnects, plus a periodic snapshot, and mirrors those of
+    the other workers in remote_connections, so presence checks and session
+    lookups cover the whole deployment. A worker that stops sending
+    snapshots is forgotten after three missed heartbeats.
+    """
+
+    def __init__(self, transport=None, channel: str = "socketio-presence", heartbeat_interval: float = 10.0):
         self.active_connections: Dict[int, Set[str]] = {}
         self.user_by_session: Dict[str, int] = {}
-        self.typing_users: Dict[int, Set[int]] = {}  # conversation_id -> set of user_ids
-    
+        self.transport = transport
+        self.channel = channel
+        self.heartbeat_interval = heartbeat_interval
+        self.server_id = uuid.uuid4().hex
+        self.remote_connections: Dict[str, Dict[int, Set[str]]] = {}  # server_id -> user_id -> session ids
+        self._remote_seen: Dict[str, float] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        """Start sharing presence with the other workers (no-op without a transport)"""
+        if self.transport is None or self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._listen()), loop.create_task(self._heartbeat())]
+        await asyncio.sleep(0)  # let the listener subscribe before asking for snapshots
+        await self._publish("sync")
+
+    async def stop(self):
+        """Tell the other workers to forget this one's sessions"""
+        if not self._tasks:
+            return
+        await self._publish("leave")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
     async def connect(self, user_id: int, session_id: str):
         """Register a new connection"""
         if user_id not in self.active_connections:
             self.active_connections[user_id] = set()
         self.active_connections[user_id].add(session_id)
         self.user_by_session[session_id] = user_id
-    
+        await self._publish("connect", user_id=user_id, session_id=session_id)
+
     async def disconnect(self, session_id: str):
         """Remove a disconnected session"""
         user_id = self.user_by_session.get(session_id)
@@ -24,35 +65,99 @@ class ConnectionService:
                 del self.active_connections[user_id]
         if session_id in self.user_by_session:
             del self.user_by_session[session_id]
-    
+            await self._publish("disconnect", user_id=user_id, session_id=session_id)
+
     def is_user_online(self, user_id: int) -> bool:
-        """Check if user has active connections"""
-        return user_id in self.active_connections and len(self.active_connections[user_id]) > 0
-    
+        """Check if user has active connections on any worker"""
+        if self.active_connections.get(user_id):
+            return True
+        return any(sessions.get(user_id) for sessions in self.remote_connections.values())
+
     def get_user_sessions(self, user_id: int) -> list[str]:
-        """Get all session IDs for a user"""
-        return list(self.active_connections.get(user_id, set()))
-    
+        """Get all session IDs for a user, including those held by other workers"""
+        sessions = set(self.active_connections.get(user_id, set()))
+        for remote in self.remote_connections.values():
+            sessions.update(remote.get(user_id, ()))
+        return list(sessions)
+
     def get_online_users(self) -> Dict[int, int]:
         """Get count of active connections per user"""
-        return {uid: len(sids) for uid, sids in self.active_connections.items()}
-    
-    def add_typing_user(self, conversation_id: int, user_id: int):
-        """Add user to typing list for a conversation"""
-        if conversation_id not in self.typing_users:
-            self.typing_users[conversation_id] = set()
-        self.typing_users[conversation_id].add(user_id)
-    
-    def remove_typing_user(self, conversation_id: int, user_id: int):
-        """Remove user from typing list"""
-        if conversation_id in self.typing_users:
-            self.typing_users[conversation_id].discard(user_id)
-            if not self.typing_users[conversation_id]:
-                del self.typing_users[conversation_id]
-    
-    def get_typing_users(self, conversation_id: int) -> list[int]:
-        """Get users typing in a conversation"""
-        return list(self.typing_users.get(conversation_id, set()))
+        counts = {uid: len(sids) for uid, sids in self.active_connections.items()}
+        for remote in self.remote_connections.values():
+            for uid, sids in remote.items():
+                counts[uid] = counts.get(uid, 0) + len(sids)
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "server_id": self.server_id,
+            "local_sessions": len(self.user_by_session),
+            "remote_servers": len(self.remote_connections),
+            "online_users": len(self.get_online_users()),
+        }
+
+    # ============= PRESENCE SHARING =============
+
+    async def _publish(self, op: str, **fields):
+        if self.transport is None:
+            return
+        message = {"op": op, "server_id": self.server_id, **fields}
+        try:
+            await self.transport.publish(self.channel, json.dumps(message).encode())
+        except Exception:
+            # The next snapshot repairs whatever the other workers missed
+            logger.exception("Failed to publish presence %s", op)
+
+    def _snapshot(self) -> dict:
+        return {str(uid): list(sids) for uid, sids in self.active_connections.items()}
+
+    async def _listen(self):
+        while True:
+            try:
+                async for raw in self.transport.subscribe(self.channel):
+                    await self._apply(json.loads(raw))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Presence listener failed, resubscribing")
+                await asyncio.sleep(self.heartbeat_interval)
+
+    async def _apply(self, message: dict):
+        server_id = message.get("server_id")
+        if server_id == self.server_id:
+            return
+        op = message.get("op")
+        if op == "leave":
+            self.remote_connections.pop(server_id, None)
+            self._remote_seen.pop(server_id, None)
+            return
+
+        self._remote_seen[server_id] = time.monotonic()
+        remote = self.remote_connections.setdefault(server_id, {})
+        if op == "connect":
+            remote.setdefault(message["user_id"], set()).add(message["session_id"])
+        elif op == "disconnect":
+            sessions = remote.get(message["user_id"])
+            if sessions is not None:
+                sessions.discard(message["session_id"])
+                if not sessions:
+                    del remote[message["user_id"]]
+        elif op == "snapshot":
+            self.remote_connections[server_id] = {int(uid): set(sids) for uid, sids in message["sessions"].items()}
+        elif op == "sync":
+            # A worker just started; answer with our sessions right away
+            await self._publish("snapshot", sessions=self._snapshot())
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await self._publish("snapshot", sessions=self._snapshot())
+            expired = time.monotonic() - 3 * self.heartbeat_interval
+            for server_id, seen in list(self._remote_seen.items()):
+                if seen < expired:
+                    self.remote_connections.pop(server_id, None)
+                    del self._remote_seen[server_id]
+
 
 # Global connection service instance
 connection_service = ConnectionService()
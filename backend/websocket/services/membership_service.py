@@ -0,0 +1,134 @@
+from typing import Callable
+from sqlalchemy import and_, event, select
+from sqlalchemy.orm import Session
+from core.cache import TTLCache
+from core.config import settings
+from database.models import Conversation
+from database.models.conversation import conversation_participants
+from database.session import unit_of_work
+
+_PENDING = "membership_changes"
+
+
+class MembershipService:
+    """In-memory index of conversation membership
+
+    Maps conversation id -> frozenset of participant ids and user id ->
+    frozenset of conversation ids. Both are filled lazily from the database
+    on a miss. ChatService applies the conversations it creates or deletes
+    once their transaction commits. A fill that read the database before
+    such a change is not stored after it (see TTLCache.generation). The TTL
+    bounds staleness when another process changes membership.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 300.0):
+        self.members = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.conversations = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def cached_member_ids(self, conversation_id: int) -> frozenset[int] | None:
+        """Get participant ids without touching the database, or None on a miss"""
+        return self.members.get(conversation_id)
+
+    def get_member_ids(self, conversation_id: int, db: Session = None) -> frozenset[int]:
+        """Get participant ids of a live conversation (empty if it does not exist)"""
+        cached = self.members.get(conversation_id)
+        if cached is not None:
+            return cached
+        if db is None:
+            with unit_of_work() as db:
+                return self.get_member_ids(conversation_id, db)
+
+        generation = self.members.generation()
+        member_ids = frozenset(db.execute(
+            select(conversation_participants.c.user_id).join(
+                Conversation, Conversation.id == conversation_participants.c.conversation_id
+            ).where(
+                and_(
+                    Conversation.id == conversation_id,
+                    Conversation.deleted_at == None
+                )
+            )
+        ).scalars())
+        # Misses are not cached, so a conversation created by another process shows up
+        if member_ids:
+            self.members.set(conversation_id, member_ids, generation)
+        return member_ids
+
+    def cached_conversation_ids(self, user_id: int) -> frozenset[int] | None:
+        """Get a user's conversation ids without touching the database, or None on a miss"""
+        return self.conversations.get(user_id)
+
+    def is_member(self, conversation_id: int, user_id: int, db: Session = None) -> bool:
+        return user_id in self.get_member_ids(conversation_id, db)
+
+    def get_conversation_ids(self, user_id: int, db: Session = None) -> frozenset[int]:
+        """Get ids of the live conversations a user takes part in"""
+        cached = self.conversations.get(user_id)
+        if cached is not None:
+            return cached
+        if db is None:
+            with unit_of_work() as db:
+                return self.get_conversation_ids(user_id, db)
+
+        generation = self.conversations.generation()
+        conversation_ids = frozenset(db.execute(
+            select(conversation_participants.c.conversation_id).join(
+                Conversation, Conversation.id == conversation_participants.c.conversation_id
+            ).where(
+                and_(
+                    conversation_participants.c.user_id == user_id,
+                    Conversation.deleted_at == None
+                )
+            )
+        ).scalars())
+        self.conversations.set(user_id, conversation_ids, generation)
+        return conversation_ids
+
+    def conversation_created(self, db: Session, conversation_id: int, member_ids):
+        """Index a new conversation once db commits"""
+        member_ids = frozenset(member_ids)
+
+        def apply():
+            self.members.set(conversation_id, member_ids)
+            self.conversations.invalidate(*member_ids)
+
+        self._after_commit(db, apply)
+
+    def conversation_deleted(self, db: Session, conversation_id: int, member_ids):
+        """Drop a conversation from the index once db commits"""
+        member_ids = frozenset(member_ids)
+
+        def apply():
+            self.members.invalidate(conversation_id)
+            self.conversations.invalidate(*member_ids)
+
+        self._after_commit(db, apply)
+
+    @staticmethod
+    def _after_commit(db: Session, apply: Callable[[], None]):
+        db.info.setdefault(_PENDING, []).append(apply)
+
+    def clear(self):
+        self.members.clear()
+        self.conversations.clear()
+
+    def stats(self) -> dict:
+        return {"members": self.members.stats(), "conversations": self.conversations.stats()}
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_membership_changes(session: Session):
+    for apply in session.info.pop(_PENDING, ()):
+        apply()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_membership_changes(session: Session, previous_transaction):
+    session.info.pop(_PENDING, None)
+
+
+# Global membership index
+membership_service = MembershipService(
+    maxsize=settings.CONVERSATION_MEMBERSHIP_CACHE_SIZE,
+    ttl=settings.CONVERSATION_MEMBERSHIP_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from core.config import settings
+from database.executor import run_db
+from database.models import Message
+from database.session import unit_of_work
+from .chat_service import ChatService
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MessagePipeline:
+    """Group commit for messages sent over the socket
+
+    Senders queue their message and wait. A collector task takes whatever
+    is queued (up to max_batch) and inserts it in one transaction. If the
+    previous batch held several messages, it first waits up to max_delay for
+    more; a lone sender on an idle server is never delayed. Each sender then
+    gets its committed Message back, so acks always carry the real id.
+    Messages that arrive while a batch is committing form the next one. A
+    sender waits at most max_delay plus about two commits. When the queue
+    already holds max_pending messages, new sends wait for room.
+
+    If a batch fails, it is rolled back and its messages are retried one
+    transaction each, so a bad message only fails its own send. A retried
+    send (same sender and client_message_id) gets the stored message back
+    with created=False instead of a second row; see
+    ChatService.create_messages.
+    """
+
+    def __init__(self, enabled: bool = True, max_batch: int = 256, max_delay: float = 0.002, max_pending: int = 10000):
+        self.enabled = enabled
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.batches = 0
+        self.messages = 0
+        self.failures = 0
+        self.max_batch_seen = 0
+        self._last_batch = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def start(self):
+        """Start the collector, or restart it if it died; queued messages are kept"""
+        if self._task is not None and not self._task.done():
+            return
+        if self._task is not None and not self._task.cancelled() and self._task.exception() is not None:
+            logger.error("Message collector died, restarting", exc_info=self._task.exception())
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Commit whatever is queued, then stop the collector"""
+        if self._task is None:
+            return
+        self.start()  # a collector that died still has to commit what is queued
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = self._queue = None
+
+    async def submit(
+        self,
+        conversation_id: int,
+        sender_id: int,
+        content: str,
+        content_type: str = "text",
+        media_url: str = None,
+        client_message_id: str = None,
+    ) -> tuple[Message, bool]:
+        """Queue a message and wait until the batch holding it commits
+
+        Returns the message and whether this send created it.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        fields = {
+            "conversation_id": conversation_id,
+            "sender_id": sender_id,
+            "content": content,
+            "content_type": content_type,
+            "media_url": media_url,
+            "client_message_id": client_message_id,
+        }
+        await self._queue.put((fields, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            busy = self._last_batch > 1
+            if busy and len(batch) < self.max_batch and batch[-1] is not _STOP and self.max_delay > 0:
+                await asyncio.sleep(self.max_delay)
+                self._drain(batch)
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                await self._commit(batch)
+            if stop:
+                return
+
+    def _drain(self, batch: list):
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    @staticmethod
+    def _write(rows: list[dict]) -> list[tuple[Message, bool]]:
+        with unit_of_work() as db:
+            return ChatService.create_messages(rows, db)
+
+    async def _commit(self, batch: list):
+        try:
+            results = await run_db(self._write, [fields for fields, _, _ in batch])
+            outcomes = [(result, None) for result in results]
+        except Exception:
+            logger.exception("Message batch of %d failed, retrying one by one", len(batch))
+            outcomes = []
+            for fields, _, _ in batch:
+                try:
+                    outcomes.append(((await run_db(self._write, [fields]))[0], None))
+                except Exception as e:
+                    outcomes.append((None, e))
+
+        now = time.perf_counter()
+        self.batches += 1
+        self.messages += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self._last_batch = len(batch)
+        for (_, future, queued_at), (result, error) in zip(batch, outcomes):
+            latency = now - queued_at
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if future.done():
+                continue  # the sender gave up waiting; the message is stored regardless
+            if error is not None:
+                self.failures += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "messages": self.messages,
+            "failures": self.failures,
+            "avg_batch": round(self.messages / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "avg_latency_ms": round(self.total_latency / self.messages * 1000, 2) if self.messages else 0.0,
+            "max_latency_ms": round(self.max_latency * 1000, 2),
+        }
+
+
+# Global message ingestion pipeline
+message_pipeline = MessagePipeline(
+    enabled=settings.CHAT_MESSAGE_PIPELINE,
+    max_batch=settings.CHAT_MESSAGE_PIPELINE_MAX_BATCH,
+    max_delay=settings.CHAT_MESSAGE_PIPELINE_MAX_DELAY_MS / 1000,
+    max_pending=settings.CHAT_MESSAGE_PIPELINE_MAX_PENDING,
+)
@@ -0,0 +1,50 @@
+from typing import Dict, Tuple
+from core.config import settings
+
+
+class ReadReceiptService:
+    """Coalesces read events per (conversation, user) into one "read up to"
+
+    Clients report every message that scrolls into view. The first report
+    for a (conversation, user) pair opens a window of `window` seconds, and
+    later reports inside it only raise the pending message id. ChatHandler
+    flushes the pair when the window closes: one read cursor write and one
+    broadcast for the highest id.
+    """
+
+    def __init__(self, window: float = 0.5):
+        self.window = window
+        self.pending: Dict[Tuple[int, int], int] = {}  # (conversation_id, user_id) -> highest message id
+        self.events = 0
+        self.flushes = 0
+
+    def add(self, conversation_id: int, user_id: int, message_id: int) -> bool:
+        """Record a read; True if it opened a window the caller must flush"""
+        self.events += 1
+        key = (conversation_id, user_id)
+        current = self.pending.get(key)
+        if current is None:
+            self.pending[key] = message_id
+            return True
+        if message_id > current:
+            self.pending[key] = message_id
+        return False
+
+    def take(self, conversation_id: int, user_id: int) -> int | None:
+        """Close the window and return the highest message id read in it"""
+        message_id = self.pending.pop((conversation_id, user_id), None)
+        if message_id is not None:
+            self.flushes += 1
+        return message_id
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "events": self.events,
+            "flushes": self.flushes,
+            "coalesced": self.events - self.flushes - len(self.pending),
+        }
+
+
+# Global read receipt batcher
+read_receipt_service = ReadReceiptService(window=settings.READ_RECEIPT_WINDOW_MS / 1000)
@@ -0,0 +1,98 @@
+import time
+from typing import Callable, Dict, Tuple
+from core.config import settings
+
+
+class _Typing:
+    __slots__ = ("session_id", "user_name", "expires_at", "broadcast_at")
+
+    def __init__(self, session_id: str, user_name: str):
+        self.session_id = session_id
+        self.user_name = user_name
+        self.expires_at = 0.0
+        self.broadcast_at = float("-inf")
+
+
+class TypingService:
+    """Debounced typing state per (conversation, user)
+
+    Clients send "typing" on every keystroke. A start is broadcast when a
+    user begins typing and then at most once per interval while they keep
+    going. A stop is broadcast only if a start was. A user who sends nothing
+    for ttl seconds, or whose session disconnects, stops typing. ChatHandler
+    runs the expiry timer and broadcasts those stops. Every event that does
+    not lead to a broadcast is counted as suppressed.
+    """
+
+    def __init__(self, interval: float = 3.0, ttl: float = 6.0, clock: Callable[[], float] = time.monotonic):
+        self.interval = interval
+        self.ttl = ttl
+        self.clock = clock
+        self.typing: Dict[Tuple[int, int], _Typing] = {}  # (conversation_id, user_id) -> state
+        self.broadcasts = 0
+        self.suppressed = 0
+        self.expired = 0
+
+    def start(self, conversation_id: int, user_id: int, user_name: str, session_id: str) -> bool:
+        """Record a keystroke; True if a typing start should be broadcast"""
+        now = self.clock()
+        entry = self.typing.get((conversation_id, user_id))
+        if entry is None:
+            entry = self.typing[(conversation_id, user_id)] = _Typing(session_id, user_name)
+        entry.session_id = session_id
+        entry.expires_at = now + self.ttl
+        if now - entry.broadcast_at < self.interval:
+            self.suppressed += 1
+            return False
+        entry.broadcast_at = now
+        self.broadcasts += 1
+        return True
+
+    def stop(self, conversation_id: int, user_id: int) -> bool:
+        """Record an explicit stop; True if a typing stop should be broadcast"""
+        if self.typing.pop((conversation_id, user_id), None) is None:
+            self.suppressed += 1
+            return False
+        self.broadcasts += 1
+        return True
+
+    def expire(self) -> list[tuple[int, int, str]]:
+        """Drop users who stopped sending keystrokes; returns (conversation_id, user_id, user_name)"""
+        now = self.clock()
+        stale = [key for key, entry in self.typing.items() if entry.expires_at <= now]
+        self.expired += len(stale)
+        return self._drop(stale)
+
+    def disconnect(self, session_id: str) -> list[tuple[int, int, str]]:
+        """Drop whatever a disconnected session was typing; returns (conversation_id, user_id, user_name)"""
+        stale = [key for key, entry in self.typing.items() if entry.session_id == session_id]
+        return self._drop(stale)
+
+    def _drop(self, keys) -> list[tuple[int, int, str]]:
+        dropped = []
+        for conversation_id, user_id in keys:
+            entry = self.typing.pop((conversation_id, user_id))
+            dropped.append((conversation_id, user_id, entry.user_name))
+        self.broadcasts += len(dropped)
+        return dropped
+
+    def get_typing_users(self, conversation_id: int) -> list[int]:
+        """Get users typing in a conversation"""
+        return [user_id for (cid, user_id) in self.typing if cid == conversation_id]
+
+    def stats(self) -> dict:
+        total = self.broadcasts + self.suppressed
+        return {
+            "typing": len(self.typing),
+            "broadcasts": self.broadcasts,
+            "suppressed": self.suppressed,
+            "expired": self.expired,
+            "suppressed_ratio": round(self.suppressed / total, 4) if total else 0.0,
+        }
+
+
+# Global typing state
+typing_service = TypingService(
+    interval=settings.TYPING_BROADCAST_INTERVAL_SECONDS,
+    ttl=settings.TYPING_TTL_SECONDS,
+)